@@ -0,0 +1,358 @@
+"""
+Micro-benchmarks of the `mega.crypto` helpers on representative inputs:
+node keys, attribute blobs, base64 handles, an RSA private key blob,
+v1 passwords and 1 MB chunks.
+
+Each case is timed with `timeit`, calibrated to run for a fixed time
+and repeated, and reported like pytest-benchmark: min, median and mean
+per call and calls per second.
+
+With --compare, every case that has alternative implementations (the
+straightforward per-block versions the helpers replaced, and candidate
+rewrites) first checks that each alternative gives byte-identical
+output on the same input, and only then reports its speed against the
+current helper. A mismatch is reported and makes the run exit with 1.
+
+Usage:
+    python benchmarks/bench_crypto.py [--compare] [-k filter]
+        [--min-time 0.2] [--repeat 5] [--json results.json]
+"""
+import argparse
+import base64
+import json
+import random
+import statistics
+import struct
+import sys
+import timeit
+from array import array
+
+from Crypto.Cipher import AES
+from Crypto.Util import Counter
+
+from mega.crypto import (MacAccumulator, a32_to_str, base64_url_decode,
+                         base64_url_encode, decrypt_attr, decrypt_key,
+                         decrypt_key_bytes, encrypt_attr, encrypt_key,
+                         encrypt_key_bytes, get_chunks, prepare_key,
+                         str_to_a32, stringhash)
+
+RNG = random.Random(0)
+
+
+def random_bytes(count):
+    return RNG.getrandbits(count * 8).to_bytes(count, 'big')
+
+
+def mpi(value):
+    length = (value.bit_length() + 7) // 8
+    return value.bit_length().to_bytes(2, 'big') + value.to_bytes(
+        length, 'big')
+
+
+# inputs
+MASTER_KEY = str_to_a32(random_bytes(16))
+FILE_KEY = str_to_a32(random_bytes(32))
+FOLDER_KEY = str_to_a32(random_bytes(16))
+ENCRYPTED_FILE_KEY = encrypt_key(FILE_KEY, MASTER_KEY)
+ATTR_KEY = tuple(FILE_KEY[i] ^ FILE_KEY[i + 4] for i in range(4))
+ATTRIBUTES = {'n': 'IMG_20200625_184512.jpg', 'c': 'Rf6hQvMn1xk2b9pW0aZc'}
+ATTR_BLOB = encrypt_attr(ATTRIBUTES, ATTR_KEY)
+ENCODED_ATTR_BLOB = base64_url_encode(ATTR_BLOB)
+ENCODED_NODE_KEY = base64_url_encode(a32_to_str(ENCRYPTED_FILE_KEY))
+# four MPIs of a 2048-bit key (p, q, d, u), as the 'privk' of login
+PRIVK = b''.join(mpi(RNG.getrandbits(bits) | 1 << bits - 1)
+                 for bits in (1024, 1024, 2048, 1024))
+PRIVK += b'\0' * (-len(PRIVK) % 16)
+ENCRYPTED_PRIVK = encrypt_key_bytes(PRIVK, a32_to_str(MASTER_KEY))
+SHORT_PASSWORD = str_to_a32('hunter2hunter2')
+LONG_PASSWORD = str_to_a32('correct horse battery staple, and then some')
+EMAIL = 'someone@example.com'
+CHUNK = random_bytes(1048576)
+CHUNK_KEY = a32_to_str(ATTR_KEY)
+CHUNK_IV = FILE_KEY[4:6]
+
+
+# the straightforward versions, as the helpers were written before
+def _cbc_zero(key):
+    return AES.new(key, AES.MODE_CBC, b'\0' * 16)
+
+
+def loop_a32_to_str(a):
+    return b''.join(value.to_bytes(4, 'big') for value in a)
+
+
+def loop_str_to_a32(b):
+    if len(b) % 4:
+        b += b'\0' * (4 - len(b) % 4)
+    return tuple(
+        int.from_bytes(b[i:i + 4], 'big') for i in range(0, len(b), 4))
+
+
+def per_block_encrypt_key(a, key):
+    key = a32_to_str(key)
+    return sum((str_to_a32(_cbc_zero(key).encrypt(a32_to_str(a[i:i + 4])))
+                for i in range(0, len(a), 4)), ())
+
+
+def per_block_decrypt_key(a, key):
+    key = a32_to_str(key)
+    return sum((str_to_a32(_cbc_zero(key).decrypt(a32_to_str(a[i:i + 4])))
+                for i in range(0, len(a), 4)), ())
+
+
+def per_block_decrypt_privk(data, key):
+    return a32_to_str(per_block_decrypt_key(str_to_a32(data), key))
+
+
+def per_round_prepare_key(arr):
+    pkey = [0x93C467E3, 0x7DB0C7A4, 0xD1BE3F81, 0x0152CB56]
+    for _ in range(0x10000):
+        for j in range(0, len(arr), 4):
+            key = [0, 0, 0, 0]
+            for i in range(4):
+                if i + j < len(arr):
+                    key[i] = arr[i + j]
+            pkey = str_to_a32(
+                _cbc_zero(a32_to_str(key)).encrypt(a32_to_str(pkey)))
+    return pkey
+
+
+def per_round_stringhash(text, aeskey):
+    s32 = str_to_a32(text.encode('latin-1'))
+    h32 = [0, 0, 0, 0]
+    for i in range(len(s32)):
+        h32[i % 4] ^= s32[i]
+    for _ in range(0x4000):
+        h32 = str_to_a32(
+            _cbc_zero(a32_to_str(aeskey)).encrypt(a32_to_str(h32)))
+    return base64_url_encode(a32_to_str((h32[0], h32[2])))
+
+
+def per_block_chunk_mac(chunk, key, iv):
+    iv_str = a32_to_str([iv[0], iv[1], iv[0], iv[1]])
+    encryptor = AES.new(key, AES.MODE_CBC, iv_str)
+    for i in range(0, len(chunk), 16):
+        block = chunk[i:i + 16]
+        if len(block) % 16:
+            block += b'\0' * (16 - len(block) % 16)
+        mac = encryptor.encrypt(block)
+    return mac
+
+
+# candidate rewrites
+def array_a32_to_str(a):
+    words = array('I', a)
+    if sys.byteorder == 'little':
+        words.byteswap()
+    return words.tobytes()
+
+
+def unpack_from_str_to_a32(b):
+    if len(b) % 4:
+        b += b'\0' * (4 - len(b) % 4)
+    return struct.unpack(f'>{len(b) // 4}I', b)
+
+
+def urlsafe_base64_url_encode(data):
+    return base64.urlsafe_b64encode(data).rstrip(b'=').decode('ascii')
+
+
+def urlsafe_base64_url_decode(data):
+    data = data.replace(',', '')
+    return base64.urlsafe_b64decode(data + '=' * (-len(data) % 4))
+
+
+def bytes_decrypt_attr(attr, key):
+    decrypted = _cbc_zero(a32_to_str(key)).decrypt(attr).rstrip(b'\0')
+    if decrypted[:6] != b'MEGA{"':
+        return None
+    try:
+        return json.loads(decrypted[4:].decode('latin-1'))
+    except ValueError:
+        return None
+
+
+def list_get_chunks(size):
+    chunks = []
+    start = 0
+    chunk_size = 0x20000
+    while start + chunk_size < size:
+        chunks.append((start, chunk_size))
+        start += chunk_size
+        chunk_size = min(chunk_size + 0x20000, 0x100000)
+    chunks.append((start, size - start))
+    return chunks
+
+
+def current_chunk_mac(chunk, key, iv):
+    return MacAccumulator(key, iv).chunk_mac(chunk)
+
+
+def ctr_decrypt(chunk, key, iv):
+    counter = Counter.new(128, initial_value=((iv[0] << 32) + iv[1]) << 64)
+    return AES.new(key, AES.MODE_CTR, counter=counter).decrypt(chunk)
+
+
+# (name, helper, arguments, {alternative name: alternative})
+CASES = [
+    ('a32_to_str[node key]', a32_to_str, (FILE_KEY, ), {
+        'loop': loop_a32_to_str,
+        'array': array_a32_to_str
+    }),
+    ('str_to_a32[node key]', str_to_a32, (a32_to_str(FILE_KEY), ), {
+        'loop': loop_str_to_a32,
+        'unpack': unpack_from_str_to_a32
+    }),
+    ('str_to_a32[privk]', str_to_a32, (PRIVK, ), {
+        'loop': loop_str_to_a32,
+        'unpack': unpack_from_str_to_a32
+    }),
+    ('base64_url_encode[node key]', base64_url_encode,
+     (a32_to_str(ENCRYPTED_FILE_KEY), ), {
+         'urlsafe': urlsafe_base64_url_encode
+     }),
+    ('base64_url_encode[attributes]', base64_url_encode, (ATTR_BLOB, ), {
+        'urlsafe': urlsafe_base64_url_encode
+    }),
+    ('base64_url_decode[node key]', base64_url_decode, (ENCODED_NODE_KEY, ),
+     {
+         'urlsafe': urlsafe_base64_url_decode
+     }),
+    ('base64_url_decode[attributes]', base64_url_decode,
+     (ENCODED_ATTR_BLOB, ), {
+         'urlsafe': urlsafe_base64_url_decode
+     }),
+    ('encrypt_key[file key]', encrypt_key, (FILE_KEY, MASTER_KEY), {
+        'per-block': per_block_encrypt_key
+    }),
+    ('encrypt_key[folder key]', encrypt_key, (FOLDER_KEY, MASTER_KEY), {
+        'per-block': per_block_encrypt_key
+    }),
+    ('decrypt_key[file key]', decrypt_key, (ENCRYPTED_FILE_KEY, MASTER_KEY),
+     {
+         'per-block': per_block_decrypt_key
+     }),
+    ('decrypt_key_bytes[privk]', decrypt_key_bytes,
+     (ENCRYPTED_PRIVK, a32_to_str(MASTER_KEY)), {}),
+    ('decrypt_key[privk]', lambda data, key: a32_to_str(
+        decrypt_key(str_to_a32(data), key)), (ENCRYPTED_PRIVK, MASTER_KEY), {
+            'per-block': per_block_decrypt_privk
+        }),
+    ('encrypt_attr[attributes]', encrypt_attr, (ATTRIBUTES, ATTR_KEY), {}),
+    ('decrypt_attr[attributes]', decrypt_attr, (ATTR_BLOB, ATTR_KEY), {
+        'bytes': bytes_decrypt_attr
+    }),
+    ('decrypt_attr[wrong key]', decrypt_attr, (ATTR_BLOB, MASTER_KEY), {
+        'bytes': bytes_decrypt_attr
+    }),
+    ('prepare_key[14 chars]', prepare_key, (SHORT_PASSWORD, ), {
+        'per-round': per_round_prepare_key
+    }),
+    ('prepare_key[43 chars]', prepare_key, (LONG_PASSWORD, ), {
+        'per-round': per_round_prepare_key
+    }),
+    ('stringhash[email]', stringhash, (EMAIL, MASTER_KEY), {
+        'per-round': per_round_stringhash
+    }),
+    ('get_chunks[1 GB]', lambda size: list(get_chunks(size)), (1 << 30, ), {
+        'list': list_get_chunks
+    }),
+    ('chunk_mac[1 MB]', current_chunk_mac, (CHUNK, CHUNK_KEY, CHUNK_IV), {
+        'per-block': per_block_chunk_mac
+    }),
+    ('ctr_decrypt[1 MB]', ctr_decrypt, (CHUNK, CHUNK_KEY, CHUNK_IV), {}),
+]
+
+
+def as_bytes(value):
+    """
+    A helper's output as bytes, so that outputs of different types that
+    mean the same (lists and tuples of words, say) compare equal and
+    anything else does not.
+    """
+    if isinstance(value, (bytes, bytearray)):
+        return bytes(value)
+    if isinstance(value, str):
+        return value.encode('utf8')
+    if isinstance(value, (list, tuple)) and all(
+            isinstance(item, int) for item in value):
+        return a32_to_str(value)
+    return json.dumps(value, sort_keys=True).encode('utf8')
+
+
+def measure(func, args, min_time, repeat):
+    """
+    Returns:
+        Seconds per call of each repeat
+    """
+    timer = timeit.Timer(lambda: func(*args))
+    number, elapsed = timer.autorange()
+    number = max(1, int(number * min_time / max(elapsed, 1e-9)))
+    return [total / number for total in timer.repeat(repeat, number)]
+
+
+def stats(times):
+    return {
+        'min': min(times),
+        'median': statistics.median(times),
+        'mean': statistics.mean(times),
+        'ops': 1 / statistics.median(times),
+    }
+
+
+def report(name, result, baseline=None):
+    line = (f'{name:44} {result["min"] * 1e6:12.2f} '
+            f'{result["median"] * 1e6:12.2f} {result["mean"] * 1e6:12.2f} '
+            f'{result["ops"]:14.1f}')
+    if baseline is not None:
+        line += f'  {baseline["median"] / result["median"]:8.2f}x'
+    print(line)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--compare', action='store_true')
+    parser.add_argument('-k', dest='filter', default='')
+    parser.add_argument('--min-time', default=0.2, type=float,
+                        help='seconds each repeat runs for')
+    parser.add_argument('--repeat', default=5, type=int)
+    parser.add_argument('--json', dest='json_path')
+    args = parser.parse_args()
+
+    print(f'{"case (us per call)":44} {"min":>12} {"median":>12} '
+          f'{"mean":>12} {"ops/s":>14}' +
+          ('  vs helper' if args.compare else ''))
+    results = {}
+    mismatches = []
+    for name, helper, inputs, alternatives in CASES:
+        if args.filter not in name:
+            continue
+        result = stats(measure(helper, inputs, args.min_time, args.repeat))
+        results[name] = {'helper': result}
+        report(name, result)
+        if not args.compare:
+            continue
+        expected = as_bytes(helper(*inputs))
+        for alternative_name, alternative in alternatives.items():
+            label = f'  {alternative_name}'
+            if as_bytes(alternative(*inputs)) != expected:
+                mismatches.append(f'{name} {alternative_name}')
+                print(f'{label:44} output differs from the helper, '
+                      'not timed')
+                results[name][alternative_name] = 'mismatch'
+                continue
+            alternative_result = stats(
+                measure(alternative, inputs, args.min_time, args.repeat))
+            results[name][alternative_name] = alternative_result
+            report(label, alternative_result, baseline=result)
+
+    if args.json_path:
+        with open(args.json_path, 'w') as file:
+            json.dump(results, file, indent=2)
+    if mismatches:
+        print(f'\n{len(mismatches)} mismatched: ' + ', '.join(mismatches))
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,111 @@
+"""
+Memory per node: the processed server dicts against `mega.nodes.Node`
+and `mega.columnar.ColumnarNodeTree`.
+
+Builds a synthetic tree of files and folders in each layout and reports
+the memory traced while it is alive.
+
+Usage:
+    python benchmarks/bench_node_memory.py [node_count]
+"""
+import gc
+import os
+import sys
+import tracemalloc
+
+from mega.crypto import base64_url_encode, str_to_a32
+from mega.columnar import ColumnarNodeTree
+from mega.nodes import Node
+
+USER = 'U_bench__'
+
+
+def raw_node(i):
+    is_folder = i % 10 == 0
+    key = os.urandom(16 if is_folder else 32)
+    fields = {
+        'h': f'{i:08d}',
+        'p': f'{i // 10 * 10:08d}',
+        'u': USER,
+        't': int(is_folder),
+        'a': base64_url_encode(os.urandom(48)),
+        'ts': 1600000000 + i,
+    }
+    if not is_folder:
+        fields['s'] = i * 1000
+    return fields, key
+
+
+def as_dict(fields, key):
+    """A node as `_process_file` used to leave it."""
+    node = dict(fields)
+    key = str_to_a32(key)
+    if node['t'] == 0:
+        node['k'] = (key[0] ^ key[4], key[1] ^ key[5], key[2] ^ key[6],
+                     key[3] ^ key[7])
+        node['iv'] = key[4:6] + (0, 0)
+        node['meta_mac'] = key[6:8]
+    else:
+        node['k'] = key
+    node['key'] = key
+    node['a'] = {'n': f'node {node["h"]}.txt'}
+    return node
+
+
+def as_node(fields, key):
+    return Node(fields, key)
+
+
+def as_materialized_node(fields, key):
+    node = Node(fields, key)
+    node['a'] = {'n': f'node {node["h"]}.txt'}
+    return node
+
+
+def measure_columnar(count):
+    gc.collect()
+    tracemalloc.start()
+    tree = ColumnarNodeTree()
+    for i in range(count):
+        fields, key = raw_node(i)
+        tree.add(Node(fields, key))
+    del fields, key
+    gc.collect()
+    used = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    del tree
+    return used
+
+
+def measure(build, count):
+    gc.collect()
+    tracemalloc.start()
+    nodes = {}
+    for i in range(count):
+        fields, key = raw_node(i)
+        node = build(fields, key)
+        nodes[node['h']] = node
+    del fields, key, node
+    gc.collect()
+    used = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    del nodes
+    return used
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 1000000
+    print(f'{count} nodes')
+    for name, build in (('dict', as_dict), ('Node', as_node),
+                        ('Node, attributes read', as_materialized_node),
+                        ('ColumnarNodeTree', None)):
+        if build is None:
+            used = measure_columnar(count)
+        else:
+            used = measure(build, count)
+        print(f'  {name:24} {used / 1048576:8.0f} MB '
+              f'{used / count:6.0f} bytes/node')
+
+
+if __name__ == '__main__':
+    main()
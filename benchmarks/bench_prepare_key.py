@@ -0,0 +1,47 @@
+"""
+v1 password key derivation: the old per-round loop against prepare_key.
+
+Usage:
+    python benchmarks/bench_prepare_key.py [password_length ...]
+"""
+import sys
+import time
+
+from mega.crypto import aes_cbc_encrypt_a32, prepare_key, str_to_a32
+
+
+def round_loop_prepare_key(arr):
+    """The loop `prepare_key` ran before."""
+    pkey = [0x93C467E3, 0x7DB0C7A4, 0xD1BE3F81, 0x0152CB56]
+    for r in range(0x10000):
+        for j in range(0, len(arr), 4):
+            key = [0, 0, 0, 0]
+            for i in range(4):
+                if i + j < len(arr):
+                    key[i] = arr[i + j]
+            pkey = aes_cbc_encrypt_a32(pkey, key)
+    return pkey
+
+
+def measure(func, arr):
+    start = time.perf_counter()
+    result = func(arr)
+    return tuple(result), time.perf_counter() - start
+
+
+def main():
+    lengths = [int(arg) for arg in sys.argv[1:]] or [8, 16, 40]
+    for length in lengths:
+        arr = str_to_a32('x' * length)
+        before, before_time = measure(round_loop_prepare_key, arr)
+        after, after_time = measure(prepare_key, arr)
+        assert before == after, 'key mismatch'
+
+        print(f'{length} character password')
+        print(f'  per-round loop:  {before_time * 1000:10.1f} ms')
+        print(f'  prepare_key:     {after_time * 1000:10.1f} ms')
+        print(f'  speedup:         {before_time / after_time:10.1f}x')
+
+
+if __name__ == '__main__':
+    main()
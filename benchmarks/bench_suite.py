@@ -0,0 +1,250 @@
+"""
+End-to-end benchmarks against the in-process `mega.local.LocalServer`:
+login and key derivation time, upload and download throughput across
+file sizes and worker counts, node tree fetch latency and memory for
+large synthetic accounts, and `find` latency.
+
+Results are written as JSON, to stdout or to --output, so runs can be
+compared across releases; a readable summary goes to stderr.
+
+Usage:
+    python benchmarks/bench_suite.py [--only login,transfers,tree]
+        [--sizes 1,16,64] [--workers 1,4] [--nodes 10000,100000,1000000]
+        [--latency 0] [--repeat 3] [--output results.json]
+"""
+import argparse
+import gc
+import io
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime, timezone
+
+import requests
+
+from mega import Mega
+from mega.columnar import ColumnarNodeTree
+from mega.local import LocalServer, LocalTransport
+from mega.tree import NodeTree
+
+EMAIL = 'bench@example.com'
+PASSWORD = 'correct horse battery staple'
+V1_EMAIL = 'bench-v1@example.com'
+
+
+class CachedListing(LocalTransport):
+    """
+    Serves the 'f' listing from a body rendered once, so the memory
+    traced during a tree fetch is the client's alone.
+    """
+    def __init__(self, server):
+        super().__init__(server)
+        self.listing = None
+
+    def api_post(self, url, params, data, timeout, stream=False):
+        if json.loads(data)[0].get('a') != 'f':
+            return super().api_post(url, params, data, timeout, stream)
+        if self.listing is None:
+            self.listing = super().api_post(url, params, data,
+                                            timeout).content
+        response = requests.Response()
+        response.status_code = 200
+        response.raw = io.BytesIO(self.listing)
+        return response
+
+
+def log(message):
+    print(message, file=sys.stderr)
+
+
+def timed(func, repeat):
+    """
+    Returns:
+        (last result, median seconds over `repeat` runs)
+    """
+    times = []
+    for _ in range(repeat):
+        gc.collect()
+        start = time.perf_counter()
+        result = func()
+        times.append(time.perf_counter() - start)
+    return result, statistics.median(times)
+
+
+def client(server, latency=0.0, **options):
+    options['transport'] = LocalTransport(server, latency=latency)
+    return Mega(options)
+
+
+def bench_login(server, args):
+    results = {}
+    for name, email, salt in (('v2', EMAIL, {'s': 'A' * 43}),
+                              ('v1', V1_EMAIL, {})):
+        _, kdf = timed(
+            lambda: Mega._password_key(email, PASSWORD, salt), args.repeat)
+        _, login = timed(
+            lambda: client(server, args.latency).login(email, PASSWORD),
+            args.repeat)
+        results[name] = {'kdf_s': kdf, 'login_s': login}
+        log(f'login {name}:  kdf {kdf * 1000:8.1f} ms   '
+            f'login {login * 1000:8.1f} ms')
+    return results
+
+
+def bench_transfers(server, args):
+    results = []
+    with tempfile.TemporaryDirectory() as directory:
+        for size_mb in args.sizes:
+            path = os.path.join(directory, 'source.bin')
+            with open(path, 'wb') as source:
+                source.write(os.urandom(int(size_mb * 1048576)))
+            for workers in args.workers:
+                mega = client(server, args.latency,
+                              upload_workers=workers,
+                              download_workers=workers).login(
+                                  EMAIL, PASSWORD)
+                _, upload = timed(lambda: mega.upload(path), args.repeat)
+                file = mega.find('source.bin')
+                _, download = timed(
+                    lambda: mega.download(file, directory, 'out.bin'),
+                    args.repeat)
+                with open(os.path.join(directory, 'out.bin'), 'rb') as out:
+                    with open(path, 'rb') as source:
+                        assert out.read() == source.read(), 'data mismatch'
+                for node_id in list(mega.get_files_in_node(mega.root_id)):
+                    mega.destroy(node_id)
+                result = {
+                    'size_mb': size_mb,
+                    'workers': workers,
+                    'upload_mb_s': size_mb / upload,
+                    'download_mb_s': size_mb / download,
+                }
+                results.append(result)
+                log(f'transfer {size_mb:6g} MB x{workers}:  '
+                    f'up {result["upload_mb_s"]:8.1f} MB/s   '
+                    f'down {result["download_mb_s"]:8.1f} MB/s')
+    return results
+
+
+def bench_tree(args):
+    results = []
+    for count in args.nodes:
+        server = LocalServer(rsa_bits=1024, seed=0)
+        server.add_user(EMAIL, PASSWORD)
+        start = time.perf_counter()
+        server.add_tree(EMAIL, count)
+        log(f'tree {count}: seeded in {time.perf_counter() - start:.1f} s')
+        for tree_class in (NodeTree, ColumnarNodeTree):
+            transport = CachedListing(server)
+            mega = Mega({'transport': transport, 'node_tree': tree_class})
+            mega.login(EMAIL, PASSWORD)
+            _, fetch = timed(mega.refresh, args.repeat)
+
+            mega._nodes = None
+            gc.collect()
+            tracemalloc.start()
+            mega.get_files()
+            retained, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+
+            step = max(count // 100, 1)
+            names = [f'node {i}' for i in range(1, count, step)]
+            # the first lookup builds the name index
+            _, find_first = timed(lambda mega=mega: mega.find(names[0]), 1)
+            _, find_name = timed(
+                lambda mega=mega: [mega.find(name) for name in names],
+                args.repeat)
+            paths = [mega._node_tree().path(mega.find(name)[0])
+                     for name in names]
+            paths = [path.split('/', 1)[1] for path in paths]
+            _, find_path = timed(
+                lambda mega=mega: [mega.find(path) for path in paths],
+                args.repeat)
+            result = {
+                'nodes': count,
+                'node_tree': tree_class.__name__,
+                'response_mb': len(transport.listing) / 1048576,
+                'get_files_s': fetch,
+                'get_files_peak_mb': peak / 1048576,
+                'tree_retained_mb': retained / 1048576,
+                'find_first_s': find_first,
+                'find_name_us': find_name / len(names) * 1e6,
+                'find_path_us': find_path / len(paths) * 1e6,
+            }
+            results.append(result)
+            log(f'tree {count} {tree_class.__name__}:  '
+                f'get_files {fetch:7.2f} s   '
+                f'peak {result["get_files_peak_mb"]:7.0f} MB   '
+                f'retained {result["tree_retained_mb"]:7.0f} MB   '
+                f'first find {find_first:6.2f} s   '
+                f'find {result["find_name_us"]:7.1f} us   '
+                f'path {result["find_path_us"]:7.1f} us')
+            del mega, transport
+    return results
+
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', 'HEAD'],
+                              capture_output=True,
+                              text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def numbers(value, cast):
+    return [cast(part) for part in value.split(',') if part]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--only', default='login,transfers,tree')
+    parser.add_argument('--sizes', default='1,16,64',
+                        type=lambda value: numbers(value, float))
+    parser.add_argument('--workers', default='1,4',
+                        type=lambda value: numbers(value, int))
+    parser.add_argument('--nodes', default='10000,100000,1000000',
+                        type=lambda value: numbers(value, int))
+    parser.add_argument('--latency', default=0.0, type=float,
+                        help='seconds added to every request')
+    parser.add_argument('--repeat', default=3, type=int)
+    parser.add_argument('--output')
+    args = parser.parse_args()
+    sections = args.only.split(',')
+
+    report = {
+        'timestamp': datetime.now(timezone.utc).isoformat(),
+        'commit': git_commit(),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'latency_s': args.latency,
+        'repeat': args.repeat,
+    }
+    if 'login' in sections or 'transfers' in sections:
+        server = LocalServer(seed=0)
+        server.add_user(EMAIL, PASSWORD)
+        server.add_user(V1_EMAIL, PASSWORD, version=1)
+        if 'login' in sections:
+            report['login'] = bench_login(server, args)
+        if 'transfers' in sections:
+            report['transfers'] = bench_transfers(server, args)
+    if 'tree' in sections:
+        report['tree'] = bench_tree(args)
+
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, 'w') as file:
+            file.write(output + '\n')
+    else:
+        print(output)
+
+
+if __name__ == '__main__':
+    main()
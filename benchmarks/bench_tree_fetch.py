@@ -0,0 +1,83 @@
+"""
+Node tree fetch: parsing the whole 'f' response at once against
+streaming it through `mega.stream.iter_response`.
+
+Serves a synthetic 'f' response body from memory in 64 KiB chunks and
+loads it into a node tree both ways, reporting time and the peak memory
+traced on top of the body itself.
+
+Usage:
+    python benchmarks/bench_tree_fetch.py [node_count]
+"""
+import gc
+import json
+import os
+import sys
+import time
+import tracemalloc
+
+from bench_tree_load import synthetic_listing
+from mega import Mega
+from mega.crypto import str_to_a32
+from mega.mega import STREAM_CHUNK_SIZE
+from mega.stream import iter_response
+from mega.tree import NodeTree
+
+
+def chunks(body):
+    for start in range(0, len(body), STREAM_CHUNK_SIZE):
+        yield body[start:start + STREAM_CHUNK_SIZE]
+
+
+def whole(mega, body):
+    """The tree load as it was: json.loads of the decoded body."""
+    files = json.loads(b''.join(chunks(body)).decode())[0]
+    tree = NodeTree()
+    tree.sn = files.get('sn')
+    shared_keys = {}
+    mega._init_shared_keys(files, shared_keys)
+    for node in mega._process_files(files['f'], shared_keys):
+        tree.add(node)
+    return tree
+
+
+def streamed(mega, body):
+    mega._api_stream = lambda command: iter_response(chunks(body))
+    return mega._load_nodes()
+
+
+def measure(func, mega, body):
+    gc.collect()
+    tracemalloc.start()
+    start = time.perf_counter()
+    tree = func(mega, body)
+    elapsed = time.perf_counter() - start
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return tree, elapsed, peak
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    mega = Mega()
+    mega.master_key = str_to_a32(os.urandom(16))
+    body = json.dumps([{
+        'f': synthetic_listing(count, mega.master_key),
+        'ok': [],
+        's': [],
+        'sn': 'SEQNUM01',
+    }]).encode()
+
+    before, before_time, before_peak = measure(whole, mega, body)
+    after, after_time, after_peak = measure(streamed, mega, body)
+    assert dict(before.items()) == dict(after.items()), 'tree mismatch'
+
+    print(f'{count} nodes, {len(body) / 1048576:.0f} MB response')
+    print(f'  whole:     {before_time:8.2f} s '
+          f'{before_peak / 1048576:8.0f} MB peak')
+    print(f'  streamed:  {after_time:8.2f} s '
+          f'{after_peak / 1048576:8.0f} MB peak')
+
+
+if __name__ == '__main__':
+    main()
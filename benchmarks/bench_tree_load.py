@@ -0,0 +1,108 @@
+"""
+Node tree load: decrypting node keys one by one against in batches.
+
+Builds a synthetic 'f' response of an owned account and runs it through
+`Mega._process_file` per node and through `Mega._process_files`, then
+times the key decryption step on its own. Times are totals for all the
+nodes, not per node.
+
+Usage:
+    python benchmarks/bench_tree_load.py [node_count]
+"""
+import copy
+import os
+import sys
+import time
+
+from mega import Mega
+from mega.crypto import (a32_to_str, base64_to_a32, base64_url_encode,
+                         decrypt_key, encrypt_attr, encrypt_key_bytes,
+                         str_to_a32)
+
+USER = 'U_bench__'
+
+
+def synthetic_listing(count, master_key):
+    master_key_str = a32_to_str(master_key)
+    files = [{'h': 'ROOT', 'p': '', 'u': USER, 't': 2, 'a': '', 'k': ''}]
+    folders = ['ROOT']
+    for i in range(count):
+        is_folder = i % 10 == 0
+        key = os.urandom(16 if is_folder else 32)
+        key_a32 = str_to_a32(key)
+        k = key_a32 if is_folder else tuple(key_a32[j] ^ key_a32[j + 4]
+                                            for j in range(4))
+        handle = f'{i:08d}'
+        files.append({
+            'h': handle,
+            'p': folders[i % len(folders)],
+            'u': USER,
+            't': int(is_folder),
+            'a': base64_url_encode(encrypt_attr({'n': f'node {i}'}, k)),
+            'k': f'{USER}:' +
+            base64_url_encode(encrypt_key_bytes(key, master_key_str)),
+            's': 0 if is_folder else 1024,
+            'ts': 1600000000,
+        })
+        if is_folder:
+            folders.append(handle)
+    return files
+
+
+def per_node(mega, files):
+    shared_keys = {}
+    return [mega._process_file(file, shared_keys) for file in files]
+
+
+def batched(mega, files):
+    return mega._process_files(files, {})
+
+
+def keys_per_node(mega, files):
+    return [
+        a32_to_str(
+            decrypt_key(base64_to_a32(file['k'].split(':')[1]),
+                        mega.master_key)) for file in files[1:]
+    ]
+
+
+def keys_batched(mega, files):
+    return mega._decrypt_node_keys([(mega.master_key, file['k'].split(':')[1])
+                                    for file in files[1:]])
+
+
+def measure(func, mega, files):
+    files = copy.deepcopy(files)
+    start = time.perf_counter()
+    result = func(mega, files)
+    return result, time.perf_counter() - start
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    mega = Mega()
+    mega.master_key = str_to_a32(os.urandom(16))
+    files = synthetic_listing(count, mega.master_key)
+
+    before, before_time = measure(per_node, mega, files)
+    after, after_time = measure(batched, mega, files)
+    assert before == after, 'node mismatch'
+
+    print(f'{count} nodes')
+    print('  whole load')
+    print(f'    per-node keys: {before_time:10.2f} s')
+    print(f'    batched keys:  {after_time:10.2f} s')
+    print(f'    speedup:       {before_time / after_time:10.1f}x')
+
+    before, before_time = measure(keys_per_node, mega, files)
+    after, after_time = measure(keys_batched, mega, files)
+    assert before == after, 'key mismatch'
+
+    print('  node keys only')
+    print(f'    per-node:      {before_time:10.2f} s')
+    print(f'    batched:       {after_time:10.2f} s')
+    print(f'    speedup:       {before_time / after_time:10.1f}x')
+
+
+if __name__ == '__main__':
+    main()
@@ -32,6 +32,7 @@ setup(name='mega.py',
       author_email='hello@odwyer.software',
       license='Creative Commons Attribution-Noncommercial-Share Alike license',
       install_requires=install_requires,
+      extras_require={'async': ['aiohttp>=3.9.0']},
       python_requires='>=3.12',
       classifiers=[
           'Intended Audience :: Developers',
@@ -0,0 +1,694 @@
+import asyncio
+import functools
+import json
+import logging
+import os
+import random
+import re
+import shutil
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Optional, Union
+
+from tenacity import retry, retry_if_exception_type, wait_exponential
+
+from .crypto import MacAccumulator, a32_to_str, get_chunks
+from .errors import RequestError, ValidationError
+from .mega import (STREAM_CHUNK_SIZE, AuthenticationError, Mega,
+                   NetworkError)
+from .metrics import command_name, result_errors, start_request
+from .stream import iter_response
+from .transport import HTTPTransport
+
+try:
+    import aiohttp
+except ImportError:
+    aiohttp = None
+
+logger = logging.getLogger(__name__)
+
+
+class AiohttpTransport:
+    """
+    Async HTTP transport on aiohttp, the default of `AsyncMega`.
+
+    As with `mega.transport.HTTPTransport`, API commands and storage
+    transfers go through two separate connection pools. Any object with
+    the same coroutine methods can be given to `AsyncMega` instead.
+    """
+    def __init__(self,
+                 api_pool_size: int = 4,
+                 storage_pool_size: int = 16) -> None:
+        """
+        Args:
+            api_pool_size: Connections kept open to the API host
+            storage_pool_size: Connections kept open to storage hosts
+        """
+        if aiohttp is None:
+            raise ImportError(
+                'AsyncMega needs aiohttp (pip install mega.py[async]), '
+                'or a transport given in the `async_transport` option')
+        self.api_pool_size = api_pool_size
+        self.storage_pool_size = storage_pool_size
+        self._api_session = None
+        self._storage_session = None
+
+    def _sessions(self):
+        # sessions have to be made inside the event loop they run on
+        if self._api_session is None:
+            self._api_session = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(limit=self.api_pool_size))
+            self._storage_session = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(limit=self.storage_pool_size))
+        return self._api_session, self._storage_session
+
+    @staticmethod
+    async def _request(session, method: str, url: str,
+                       timeout: Optional[float], **kwargs) -> bytes:
+        try:
+            async with session.request(
+                    method,
+                    url,
+                    timeout=aiohttp.ClientTimeout(total=timeout),
+                    **kwargs) as response:
+                response.raise_for_status()
+                return await response.read()
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            raise NetworkError(f'Network error: {e}') from e
+
+    async def api_post(self, url: str, params: Dict[str, Any], data: str,
+                       timeout: Optional[float]) -> bytes:
+        """
+        POST a batch of commands to the API.
+
+        Returns:
+            The response body
+        """
+        api_session, _ = self._sessions()
+        return await self._request(api_session, 'POST', url, timeout,
+                                   params=params, data=data)
+
+    async def storage_get(self,
+                          url: str,
+                          headers: Optional[Dict[str, str]] = None,
+                          timeout: Optional[float] = None) -> bytes:
+        """
+        GET file data from a storage host.
+        """
+        _, storage_session = self._sessions()
+        return await self._request(storage_session, 'GET', url, timeout,
+                                   headers=headers)
+
+    async def storage_post(self, url: str, data: bytes,
+                           timeout: Optional[float]) -> bytes:
+        """
+        POST an upload chunk to a storage host.
+        """
+        _, storage_session = self._sessions()
+        return await self._request(storage_session, 'POST', url, timeout,
+                                   data=data)
+
+    async def close(self) -> None:
+        """
+        Close every pooled connection.
+        """
+        if self._api_session is not None:
+            await self._api_session.close()
+            await self._storage_session.close()
+            self._api_session = self._storage_session = None
+
+
+class _NoBlockingTransport(HTTPTransport):
+    """
+    Transport of the `Mega` inside an `AsyncMega`, which only keeps state
+    and does no I/O of its own: any request reaching it is a bug.
+    """
+    def __init__(self) -> None:
+        pass
+
+    def _refuse(self, *args, **kwargs):
+        # not a RuntimeError, which Mega's requests retry on
+        raise TypeError('AsyncMega made a blocking request')
+
+    api_post = api_get = storage_get = storage_post = _refuse
+
+    def close(self) -> None:
+        pass
+
+
+async def _gather(coroutines: Iterable) -> List[Any]:
+    """
+    `asyncio.gather`, cancelling the other tasks if one fails.
+    """
+    tasks = [asyncio.ensure_future(coroutine) for coroutine in coroutines]
+    try:
+        return await asyncio.gather(*tasks)
+    except BaseException:
+        for task in tasks:
+            task.cancel()
+        raise
+
+
+class AsyncMega:
+    """
+    asyncio client with the main surface of `Mega`: logging in, listing
+    and finding nodes, creating, renaming, moving and deleting them,
+    links and exports, uploads and downloads.
+
+    The state, node tree, crypto and command building are those of a
+    `Mega` held inside; only the I/O differs. Requests go through an
+    async transport (`AiohttpTransport` by default), key derivation,
+    RSA, tree decryption and chunk encryption run on a bounded thread
+    pool so they do not block the event loop, and the chunks of a
+    transfer are fetched or sent concurrently.
+
+    Options are those of `Mega` plus:
+        async_transport: Transport to use instead of `AiohttpTransport`
+        crypto_workers: Threads for crypto work, 4 by default
+
+    The `node_cache_path`, `transport` and `session` options are not
+    supported.
+    """
+    def __init__(self, options: Optional[Dict[str, Any]] = None) -> None:
+        options = dict(options or {})
+        for name in ('node_cache_path', 'transport', 'session'):
+            if name in options:
+                raise ValueError(f'AsyncMega does not support {name}')
+        self.transport = options.pop('async_transport', None)
+        if self.transport is None:
+            self.transport = AiohttpTransport(
+                api_pool_size=options.get('api_pool_size', 4),
+                storage_pool_size=options.get('storage_pool_size', 16))
+        self.crypto_workers = options.pop('crypto_workers', 4)
+        # seconds the cached node tree is used before it is fetched again
+        self.node_cache_ttl = options.get('node_cache_ttl', 60)
+        options['node_cache_ttl'] = None
+        options['transport'] = _NoBlockingTransport()
+        self._mega = Mega(options)
+        self._executor = ThreadPoolExecutor(
+            max_workers=self.crypto_workers,
+            thread_name_prefix='mega-crypto')
+        self._tree_lock = asyncio.Lock()
+
+    @property
+    def sid(self) -> Optional[str]:
+        return self._mega.sid
+
+    @property
+    def master_key(self):
+        return self._mega.master_key
+
+    @property
+    def root_id(self) -> str:
+        return self._mega.root_id
+
+    async def __aenter__(self) -> 'AsyncMega':
+        return self
+
+    async def __aexit__(self, *exc_info) -> None:
+        await self.close()
+
+    async def close(self) -> None:
+        """
+        Close the transport's connections and the crypto thread pool.
+        """
+        await self.transport.close()
+        self._executor.shutdown(wait=False)
+        self._mega.close()
+
+    async def _run(self, func, *args, **kwargs):
+        """
+        Run CPU-bound work on the crypto thread pool.
+        """
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(
+            self._executor, functools.partial(func, *args, **kwargs))
+
+    async def login(self,
+                    email: Optional[str] = None,
+                    password: Optional[str] = None) -> 'AsyncMega':
+        """
+        Log in, see `Mega.login`.
+        """
+        try:
+            if email:
+                await self._login_user(email, password)
+            else:
+                await self.login_anonymous()
+            self._mega._trash_folder_node_id = (
+                await self.get_node_by_type(4))[0]
+            logger.info('Login complete')
+            return self
+        except RequestError as e:
+            logger.error(f'Login failed: {e}')
+            raise AuthenticationError(f'Login failed: {e}') from e
+
+    async def _login_user(self, email: str, password: str) -> None:
+        logger.info('Logging in user...')
+        email = email.lower()
+        get_user_salt_resp = await self._api_request({
+            'a': 'us0',
+            'user': email
+        })
+        password_aes, user_hash = await self._run(Mega._password_key, email,
+                                                  password,
+                                                  get_user_salt_resp)
+        resp = await self._api_request({
+            'a': 'us',
+            'user': email,
+            'uh': user_hash
+        })
+        if isinstance(resp, int):
+            raise RequestError(resp)
+        await self._run(self._mega._login_process, resp, password_aes)
+
+    async def login_anonymous(self) -> None:
+        logger.info('Logging in anonymous temporary user...')
+        password_key, command = Mega._anonymous_user()
+        user = await self._api_request(command)
+        resp = await self._api_request({'a': 'us', 'user': user})
+        if isinstance(resp, int):
+            raise RequestError(resp)
+        await self._run(self._mega._login_process, resp, password_key)
+
+    def _params(self) -> Dict[str, Any]:
+        params = {'id': self._mega._next_sequence_num()}
+        if self._mega.sid:
+            params['sid'] = self._mega.sid
+        return params
+
+    @property
+    def _api_url(self) -> str:
+        return f'{self._mega.schema}://g.api.{self._mega.domain}/cs'
+
+    async def _api_request(self, data: Union[Dict[str, Any],
+                                             List[Dict[str, Any]]]) -> Any:
+        """
+        Send commands to the API, see `Mega._api_request`.
+        """
+        if not isinstance(data, list):
+            data = [data]
+        return Mega._command_result(await self._api_post(data))
+
+    @retry(retry=retry_if_exception_type(RuntimeError),
+           wait=wait_exponential(multiplier=2, min=2, max=60),
+           reraise=True)
+    async def _api_post(self, commands: List[Dict[str, Any]]) -> Any:
+        data = json.dumps(commands)
+        timer = start_request(self._mega.metrics, command_name(commands),
+                              len(data))
+        try:
+            body = await self.transport.api_post(self._api_url,
+                                                 params=self._params(),
+                                                 data=data,
+                                                 timeout=self._mega.timeout)
+        except NetworkError:
+            timer.done(errors=('network', ))
+            raise
+        try:
+            json_resp = json.loads(body)
+        except json.JSONDecodeError as e:
+            timer.done(len(body), ('decode', ))
+            logger.error(f'Failed to decode JSON response: {e}')
+            raise RequestError(f'Invalid response format: {e}') from e
+        retried = json_resp == -3 or (isinstance(json_resp, list)
+                                      and json_resp[:1] == [-3])
+        timer.done(len(body), result_errors(json_resp), retried)
+        if retried:
+            msg = 'Request failed, retrying'
+            logger.info(msg)
+            raise RuntimeError(msg)
+        return json_resp
+
+    @retry(retry=retry_if_exception_type(RuntimeError),
+           wait=wait_exponential(multiplier=2, min=2, max=60),
+           reraise=True)
+    async def _api_stream(self, command: Dict[str, Any]):
+        """
+        Send one command and return an iterator over its result's
+        (field, value) pairs, see `Mega._api_stream`.
+
+        The body is read whole, but parsed a chunk at a time as the
+        iterator is consumed, so its decoded text and the parsed result
+        are never held at once.
+        """
+        data = json.dumps([command])
+        timer = start_request(self._mega.metrics, command_name([command]),
+                              len(data))
+        try:
+            body = await self.transport.api_post(self._api_url,
+                                                 params=self._params(),
+                                                 data=data,
+                                                 timeout=self._mega.timeout)
+        except NetworkError:
+            timer.done(errors=('network', ))
+            raise
+        timer.response_bytes = len(body)
+        events = iter_response(
+            body[start:start + STREAM_CHUNK_SIZE]
+            for start in range(0, len(body), STREAM_CHUNK_SIZE))
+        try:
+            first = next(events)
+        except StopIteration:
+            timer.done()
+            return iter(())
+        except RequestError as e:
+            timer.done(errors=(e.code, ), retried=e.code == -3)
+            if e.code == -3:
+                msg = 'Request failed, retrying'
+                logger.info(msg)
+                raise RuntimeError(msg) from e
+            raise
+        except json.JSONDecodeError as e:
+            timer.done(errors=('decode', ))
+            logger.error(f'Failed to decode JSON response: {e}')
+            raise RequestError(f'Invalid response format: {e}') from e
+        return Mega._stream_events(first, events, timer)
+
+    async def _node_tree(self):
+        """
+        The cached node tree, fetched when missing or older than the
+        `node_cache_ttl` option. Lookups on the inner `Mega` are only
+        made after this, so they never fetch.
+        """
+        async with self._tree_lock:
+            tree = self._mega._nodes
+            if tree is None or (self.node_cache_ttl is not None
+                                and tree.age() >= self.node_cache_ttl):
+                tree = await self._load_nodes()
+            return tree
+
+    async def _load_nodes(self):
+        logger.info('Getting all files...')
+        events = await self._api_stream({'a': 'f', 'c': 1, 'r': 1})
+        return await self._run(self._mega._build_tree, events)
+
+    async def refresh(self) -> None:
+        """
+        Fetch the whole node tree again, replacing the cached one
+        """
+        async with self._tree_lock:
+            await self._load_nodes()
+
+    async def materialize(self) -> None:
+        """
+        Decrypt the attributes of every cached node now
+        """
+        await self._node_tree()
+        await self._run(self._mega.materialize)
+
+    # lookups can decrypt the attributes of every node, building the
+    # name index on first use, so they run on the thread pool too
+
+    async def get_files(self):
+        await self._node_tree()
+        return await self._run(self._mega.get_files)
+
+    async def find(self, filename=None, handle=None, exclude_deleted=False):
+        await self._node_tree()
+        return await self._run(self._mega.find, filename, handle,
+                               exclude_deleted)
+
+    async def find_path_descriptor(self, path, files=()):
+        if not files:
+            await self._node_tree()
+        return await self._run(self._mega.find_path_descriptor, path, files)
+
+    async def get_node_by_type(self, type):
+        await self._node_tree()
+        return self._mega.get_node_by_type(type)
+
+    async def get_files_in_node(self, target):
+        await self._node_tree()
+        return await self._run(self._mega.get_files_in_node, target)
+
+    async def get_user(self):
+        return await self._api_request({'a': 'ug'})
+
+    async def get_quota(self):
+        """
+        Get current remaining disk quota in MegaBytes
+        """
+        json_resp = await self._api_request({
+            'a': 'uq',
+            'xfer': 1,
+            'strg': 1,
+            'v': 1
+        })
+        return json_resp['mstrg'] / 1048576
+
+    async def _command(self, command):
+        """
+        Send a command that changes nodes and apply it to the cached tree
+        """
+        result = await self._api_request(command)
+        self._mega._apply_command(command, result)
+        return result
+
+    async def create_folder(self, name, dest=None):
+        await self._node_tree()
+        dirs = tuple(dir_name for dir_name in str(name).split('/') if dir_name)
+        folder_node_ids = {}
+        for idx, directory_name in enumerate(dirs):
+            existing_node_id = await self._run(
+                self._mega.find_path_descriptor, directory_name)
+            if existing_node_id:
+                folder_node_ids[idx] = existing_node_id
+                continue
+            if idx == 0:
+                parent_node_id = self._mega.root_id if dest is None else dest
+            else:
+                parent_node_id = folder_node_ids[idx - 1]
+            created_node = await self._command(
+                self._mega._mkdir_command(directory_name, parent_node_id))
+            folder_node_ids[idx] = created_node['f'][0]['h']
+        return dict(zip(dirs, folder_node_ids.values()))
+
+    async def rename(self, file, new_name):
+        return await self._command(self._mega._rename_command(file, new_name))
+
+    async def move(self, file_id, target):
+        """
+        Move a node to another parent, see `Mega.move`.
+        """
+        if isinstance(target, int):
+            await self._node_tree()
+        return await self._command(self._mega._move_command(file_id, target))
+
+    async def delete(self, public_handle):
+        """
+        Move a node to the trash
+        """
+        return await self.move(public_handle, 4)
+
+    async def destroy(self, file_id):
+        """
+        Destroy a node by its private id
+        """
+        return await self._command(self._mega._destroy_command(file_id))
+
+    async def get_link(self, file):
+        """
+        Get a file public link from given file object
+        """
+        file = file[1]
+        if 'h' in file and 'k' in file:
+            public_handle = await self._api_request({'a': 'l', 'n': file['h']})
+            return self._mega._public_link(public_handle, file['key'])
+        else:
+            raise ValidationError('File id and key must be present')
+
+    async def get_folder_link(self, file):
+        file = self._mega._node_data(file)
+        if 'h' in file and 'k' in file:
+            public_handle = await self._api_request({'a': 'l', 'n': file['h']})
+            return self._mega._public_link(public_handle,
+                                           file['shared_folder_key'],
+                                           folder=True)
+        else:
+            raise ValidationError('File id and key must be present')
+
+    async def export(self, path=None, node_id=None):
+        """
+        Make a public link to a file or folder, see `Mega.export`.
+        """
+        await self._node_tree()
+        if node_id:
+            node = self._mega.find(handle=node_id)
+        else:
+            node = await self._run(self._mega.find, path)
+
+        node_data = self._mega._node_data(node)
+        if node_data['t'] == 0:
+            await self._api_request([self._mega._link_command(node_data['h'])])
+            return await self.get_link(node)
+        if node:
+            try:
+                # If already exported
+                return await self.get_folder_link(node)
+            except (RequestError, KeyError):
+                pass
+
+        command = self._mega._export_folder_command(node_data)
+        self._mega._apply_command(command, await self._api_request([command]))
+        return await self.get_folder_link(
+            self._mega.find(handle=node_data['h']))
+
+    async def download(self, file, dest_path=None, dest_filename=None,
+                       workers=None):
+        """
+        Download a file by its file object. Up to `workers` chunks, the
+        `download_workers` option by default, are fetched at once.
+        """
+        return await self._download_file(None,
+                                         None,
+                                         dest_path=dest_path,
+                                         dest_filename=dest_filename,
+                                         file=file[1],
+                                         workers=workers)
+
+    async def download_url(self, url, dest_path=None, dest_filename=None,
+                           workers=None):
+        """
+        Download a file by its public URL.
+        """
+        path = self._mega._parse_url(url).split('!')
+        if len(path) != 2:
+            raise ValueError("Invalid MEGA URL format")
+        file_id, file_key = path
+        if not file_id or not file_key:
+            raise ValueError("Missing file ID or key in URL")
+        return await self._download_file(file_id,
+                                         file_key,
+                                         dest_path=dest_path,
+                                         dest_filename=dest_filename,
+                                         is_public=True,
+                                         workers=workers)
+
+    async def _download_file(self,
+                             file_handle,
+                             file_key,
+                             dest_path=None,
+                             dest_filename=None,
+                             is_public=False,
+                             file=None,
+                             workers=None):
+        command, k, iv, meta_mac = Mega._download_command(
+            file_handle, file_key, is_public, file)
+        file_data = await self._api_request(command)
+        file_url, file_size, file_name = Mega._download_target(
+            file_data, k, dest_filename)
+        if workers is None:
+            workers = self._mega.download_workers
+        dest_path = '' if dest_path is None else dest_path + '/'
+        k_str = a32_to_str(k)
+        mac = MacAccumulator(k_str, iv)
+        semaphore = asyncio.Semaphore(workers)
+        write_lock = threading.Lock()
+
+        with tempfile.NamedTemporaryFile(mode='w+b',
+                                         prefix='megapy_',
+                                         delete=False) as output_file:
+            output_file.truncate(file_size)
+
+            def decrypt_chunk(chunk_start, data):
+                data = Mega._chunk_cipher(k_str, iv, chunk_start).decrypt(data)
+                with write_lock:
+                    output_file.seek(chunk_start)
+                    output_file.write(data)
+                return mac.chunk_mac(data)
+
+            async def fetch_chunk(chunk_start, chunk_size):
+                chunk_end = chunk_start + chunk_size - 1
+                async with semaphore:
+                    data = await self.transport.storage_get(
+                        file_url,
+                        headers={'Range': f'bytes={chunk_start}-{chunk_end}'},
+                        timeout=self._mega.timeout)
+                    if len(data) != chunk_size:
+                        raise NetworkError(
+                            f'Expected {chunk_size} bytes at offset '
+                            f'{chunk_start}, got {len(data)}')
+                    return await self._run(decrypt_chunk, chunk_start, data)
+
+            chunk_macs = await _gather(
+                fetch_chunk(chunk_start, chunk_size)
+                for chunk_start, chunk_size in get_chunks(file_size)
+                if chunk_size)
+            for chunk_mac in chunk_macs:
+                mac.add_chunk_mac(chunk_mac)
+            if mac.meta_mac() != tuple(meta_mac):
+                raise ValueError('Mismatched mac')
+            output_path = Path(dest_path + file_name)
+            shutil.move(output_file.name, output_path)
+            return output_path
+
+    async def upload(self, filename, dest=None, dest_filename=None,
+                     workers=None):
+        """
+        Upload a file. Up to `workers` chunks, the `upload_workers` option
+        by default, are encrypted and sent at once.
+        """
+        if workers is None:
+            workers = self._mega.upload_workers
+        if dest is None:
+            await self._node_tree()
+            dest = self._mega.root_id
+
+        file_size = os.path.getsize(filename)
+        ul_url = (await self._api_request({'a': 'u', 's': file_size}))['p']
+        # generate random aes key (128) for file
+        ul_key = [random.randint(0, 0xFFFFFFFF) for _ in range(6)]
+        k_str = a32_to_str(ul_key[:4])
+        iv = ul_key[4:6]
+        mac = MacAccumulator(k_str, iv)
+        semaphore = asyncio.Semaphore(workers)
+        read_lock = threading.Lock()
+
+        with open(filename, 'rb') as input_file:
+
+            def encrypt_chunk(chunk_start, chunk_size):
+                with read_lock:
+                    input_file.seek(chunk_start)
+                    chunk = input_file.read(chunk_size)
+                cipher = Mega._chunk_cipher(k_str, iv, chunk_start)
+                return mac.chunk_mac(chunk), cipher.encrypt(chunk)
+
+            async def upload_chunk(chunk_start, chunk_size):
+                async with semaphore:
+                    chunk_mac, chunk = await self._run(encrypt_chunk,
+                                                       chunk_start,
+                                                       chunk_size)
+                    response = await self.transport.storage_post(
+                        f'{ul_url}/{chunk_start}',
+                        data=chunk,
+                        timeout=self._mega.timeout)
+                response_text = response.decode()
+                if re.fullmatch(r'-\d+', response_text):
+                    raise RequestError(int(response_text))
+                return chunk_mac, response_text
+
+            if file_size > 0:
+                results = await _gather(
+                    upload_chunk(chunk_start, chunk_size)
+                    for chunk_start, chunk_size in get_chunks(file_size))
+            else:
+                response = await self.transport.storage_post(
+                    ul_url + '/0', data=b'', timeout=self._mega.timeout)
+                results = [(None, response.decode())]
+
+        completion_file_handle = None
+        for chunk_mac, response_text in results:
+            if chunk_mac is not None:
+                mac.add_chunk_mac(chunk_mac)
+            if response_text:
+                completion_file_handle = response_text
+        logger.info('Chunks uploaded')
+        command = self._mega._upload_completion_command(
+            dest, completion_file_handle, ul_key, mac.meta_mac(),
+            dest_filename or os.path.basename(filename))
+        data = await self._command(command)
+        logger.info('Upload complete')
+        return data
@@ -0,0 +1,145 @@
+import logging
+from concurrent.futures import Future
+from typing import Any, Dict, List, Tuple
+
+from .errors import RequestError
+
+logger = logging.getLogger(__name__)
+
+
+class Batch:
+    """
+    Queue of API commands sent to the server together.
+
+    Every queued command returns a `concurrent.futures.Future` which, once
+    the batch is sent, holds that command's own result or raises a
+    `RequestError` with that command's own error code. Commands go out in
+    order, `max_commands` per request, when `send()` is called or when a
+    `with` block around the batch exits without an exception.
+    """
+    MAX_COMMANDS = 200
+
+    def __init__(self, mega, max_commands: int = MAX_COMMANDS) -> None:
+        self.mega = mega
+        self.max_commands = max_commands
+        self._queue: List[Tuple[Dict[str, Any], Future]] = []
+
+    def __enter__(self) -> 'Batch':
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback) -> None:
+        if exc_type is None:
+            self.send()
+        else:
+            self.cancel()
+
+    def __len__(self) -> int:
+        return len(self._queue)
+
+    def add(self, command: Dict[str, Any]) -> Future:
+        """
+        Queue a raw API command, e.g. {'a': 'd', 'n': node_id}. Commands
+        that change nodes are applied to the client's node cache once
+        they succeed.
+        """
+        future = Future()
+        self._queue.append((command, future))
+        return future
+
+    def move(self, file_id, target) -> Future:
+        """
+        Queue `Mega.move`.
+        """
+        return self.add(self.mega._move_command(file_id, target))
+
+    def delete(self, file_id) -> Future:
+        """
+        Queue `Mega.delete`, i.e. a move to the trash.
+        """
+        return self.move(file_id, 4)
+
+    def destroy(self, file_id) -> Future:
+        """
+        Queue `Mega.destroy`.
+        """
+        return self.add(self.mega._destroy_command(file_id))
+
+    def rename(self, file, new_name) -> Future:
+        """
+        Queue `Mega.rename`.
+        """
+        return self.add(self.mega._rename_command(file, new_name))
+
+    def mkdir(self, name, parent_node_id) -> Future:
+        """
+        Queue the creation of a folder, resolving to the 'p' response.
+        """
+        return self.add(self.mega._mkdir_command(name, parent_node_id))
+
+    def link(self, node_id) -> Future:
+        """
+        Queue a request for a node's public handle.
+        """
+        return self.add(self.mega._link_command(node_id))
+
+    def cancel(self) -> None:
+        """
+        Drop every queued command without sending it.
+        """
+        for command, future in self._queue:
+            future.cancel()
+        self._queue = []
+
+    def send(self) -> List[Any]:
+        """
+        Send the queued commands.
+
+        Returns:
+            One result per command, in order. Failed commands are returned
+            as their `RequestError` rather than raised.
+
+        Raises:
+            RequestError: If a request is rejected as a whole, or its
+                response does not hold one result per command
+            NetworkError: If a request fails
+
+        When sending stops on an error, the futures of the commands
+        without a result raise that error.
+        """
+        queue, self._queue = self._queue, []
+        results = []
+        for start in range(0, len(queue), self.max_commands):
+            part = queue[start:start + self.max_commands]
+            try:
+                response = self.mega._api_post(
+                    [command for command, future in part])
+                if isinstance(response, int):
+                    raise RequestError(response)
+            except Exception as e:
+                self._fail(queue[start:], e)
+                raise
+            logger.info('Sent batch of %d commands', len(part))
+            if len(response) != len(part):
+                e = RequestError(f'Expected {len(part)} results, '
+                                 f'got {len(response)}')
+                self._fail(queue[start:], e)
+                raise e
+            for index, ((command, future),
+                        result) in enumerate(zip(part, response)):
+                if isinstance(result, int) and result < 0:
+                    result = RequestError(result)
+                    future.set_exception(result)
+                else:
+                    try:
+                        self.mega._apply_command(command, result)
+                    except Exception as e:
+                        self._fail(queue[start + index:], e)
+                        raise
+                    future.set_result(result)
+                results.append(result)
+        return results
+
+    @staticmethod
+    def _fail(queue, exception) -> None:
+        for command, future in queue:
+            future.set_exception(exception)
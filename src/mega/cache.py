@@ -0,0 +1,185 @@
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+from typing import Any, Callable, Dict, Iterable, Optional, Sequence, Tuple
+
+from Crypto.Cipher import AES
+
+from .crypto import (a32_to_str, str_to_a32, base64_url_encode,
+                     base64_url_decode)
+from .nodes import Node
+from .tree import NodeTree
+
+# node fields holding decrypted key material, stored encrypted
+_KEY_FIELDS = ('k', 'key', 'iv', 'meta_mac', 'shared_folder_key')
+
+_SCHEMA = '''
+CREATE TABLE IF NOT EXISTS accounts (
+    account TEXT PRIMARY KEY,
+    sn TEXT,
+    shared_keys TEXT NOT NULL,
+    saved_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS nodes (
+    account TEXT NOT NULL,
+    h TEXT NOT NULL,
+    node TEXT NOT NULL,
+    key BLOB,
+    shared_folder_key BLOB,
+    PRIMARY KEY (account, h)
+);
+'''
+
+
+def account_id(master_key: Sequence[int]) -> str:
+    """
+    Identify an account in the cache without storing anything that
+    reveals it.
+    """
+    return hashlib.sha256(b'mega.py node cache' +
+                          a32_to_str(master_key)).hexdigest()
+
+
+class NodeStore:
+    """
+    On-disk copy of decrypted node trees in SQLite, for warm starts.
+
+    Each account's nodes, its shared-key table and the sequence number
+    the tree is current up to are stored under an id derived from the
+    master key. Node attributes are stored as JSON; all key material is
+    encrypted with the account's master key.
+    """
+    def __init__(self, path: str) -> None:
+        self.path = path
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        with self._db:
+            self._db.executescript(_SCHEMA)
+
+    def close(self) -> None:
+        self._db.close()
+
+    def save(self, master_key: Sequence[int], tree: NodeTree,
+             shared_keys: Dict[str, Dict[str, Sequence[int]]]) -> None:
+        """
+        Replace the stored tree of an account.
+        """
+        account = account_id(master_key)
+        cipher = AES.new(a32_to_str(master_key), AES.MODE_ECB)
+        with self._lock, self._db:
+            self._db.execute('DELETE FROM nodes WHERE account = ?',
+                             (account, ))
+            self._db.executemany(
+                'INSERT INTO nodes VALUES (?, ?, ?, ?, ?)',
+                (self._row(account, cipher, node)
+                 for node in tree.nodes.values()))
+            self._save_account(account, cipher, tree.sn, shared_keys)
+
+    def update(self, master_key: Sequence[int], sn: Optional[str],
+               changed: Iterable[Dict[str, Any]],
+               removed: Iterable[str]) -> None:
+        """
+        Store changed nodes, drop removed ones and move the account's
+        sequence number forward.
+        """
+        account = account_id(master_key)
+        cipher = AES.new(a32_to_str(master_key), AES.MODE_ECB)
+        with self._lock, self._db:
+            self._db.executemany(
+                'DELETE FROM nodes WHERE account = ? AND h = ?',
+                ((account, handle) for handle in removed))
+            self._db.executemany(
+                'INSERT OR REPLACE INTO nodes VALUES (?, ?, ?, ?, ?)',
+                (self._row(account, cipher, node) for node in changed))
+            self._db.execute(
+                'UPDATE accounts SET sn = ?, saved_at = ? WHERE account = ?',
+                (sn, time.time(), account))
+
+    def load(
+        self,
+        master_key: Sequence[int],
+        tree_class: Callable[..., NodeTree] = NodeTree
+    ) -> Optional[Tuple[NodeTree, Dict[str, Dict[str, Tuple[int, ...]]]]]:
+        """
+        Args:
+            master_key: The account's master key
+            tree_class: Node tree to load into, see the `node_tree`
+                option of `Mega`
+
+        Returns:
+            The stored tree and shared-key table of an account, None if
+            nothing is stored for it
+        """
+        account = account_id(master_key)
+        cipher = AES.new(a32_to_str(master_key), AES.MODE_ECB)
+        with self._lock:
+            account_row = self._db.execute(
+                'SELECT sn, shared_keys FROM accounts WHERE account = ?',
+                (account, )).fetchone()
+            if account_row is None:
+                return None
+            rows = self._db.execute(
+                'SELECT node, key, shared_folder_key FROM nodes '
+                'WHERE account = ?', (account, )).fetchall()
+        sn, shared_keys_json = account_row
+        tree = tree_class(self._node(cipher, *row) for row in rows)
+        tree.sn = sn
+        shared_keys = {
+            user: {
+                handle: str_to_a32(cipher.decrypt(base64_url_decode(key)))
+                for handle, key in keys.items()
+            }
+            for user, keys in json.loads(shared_keys_json).items()
+        }
+        return tree, shared_keys
+
+    def clear(self, master_key: Sequence[int]) -> None:
+        """
+        Forget everything stored for an account.
+        """
+        account = account_id(master_key)
+        with self._lock, self._db:
+            self._db.execute('DELETE FROM nodes WHERE account = ?',
+                             (account, ))
+            self._db.execute('DELETE FROM accounts WHERE account = ?',
+                             (account, ))
+
+    def _save_account(self, account, cipher, sn, shared_keys):
+        encrypted_keys = {
+            user: {
+                handle: base64_url_encode(cipher.encrypt(a32_to_str(key)))
+                for handle, key in keys.items()
+            }
+            for user, keys in shared_keys.items()
+        }
+        self._db.execute(
+            'INSERT OR REPLACE INTO accounts VALUES (?, ?, ?, ?)',
+            (account, sn, json.dumps(encrypted_keys), time.time()))
+
+    @staticmethod
+    def _row(account, cipher, node):
+        key = node.get('key')
+        data = {
+            field: value
+            for field, value in node.items()
+            if field not in _KEY_FIELDS or (field == 'k' and key is None)
+        }
+        shared_folder_key = node.get('shared_folder_key')
+        return (
+            account,
+            node['h'],
+            json.dumps(data),
+            cipher.encrypt(a32_to_str(key)) if key else None,
+            (cipher.encrypt(a32_to_str(shared_folder_key))
+             if shared_folder_key else None),
+        )
+
+    @staticmethod
+    def _node(cipher, data, key, shared_folder_key):
+        fields = json.loads(data)
+        if shared_folder_key is not None:
+            fields['shared_folder_key'] = str_to_a32(
+                cipher.decrypt(shared_folder_key))
+        return Node(fields, cipher.decrypt(key) if key is not None else None)
@@ -0,0 +1,542 @@
+import time
+import weakref
+from array import array
+from collections.abc import Mapping
+from typing import Any, Dict, Iterable, Iterator, List, Optional
+
+from .crypto import a32_to_str, base64_url_decode, decrypt_attr, str_to_a32
+from .nodes import Node
+
+# type of rows that hold no node: removed ones, and parents referenced
+# by a node before they were added themselves
+_ABSENT = -1
+# timestamp of nodes that have none
+_NO_TIMESTAMP = -1
+# bytes reserved per row for the node key: 32 for files, 16 for folders
+_KEY_SIZE = 32
+
+
+class _RowNode(Node):
+    """
+    Node built from a row, which the tree keeps a weak reference to.
+    """
+    __slots__ = ('__weakref__', )
+
+
+class _NodesView(Mapping):
+    """
+    `ColumnarNodeTree.nodes`: handle -> `mega.nodes.Node`, built from the
+    columns on access. Changing a node read from here does not change
+    the tree.
+    """
+    def __init__(self, tree: 'ColumnarNodeTree') -> None:
+        self._tree = tree
+
+    def __getitem__(self, handle: str) -> Node:
+        row = self._tree._live_row(handle)
+        if row is None:
+            raise KeyError(handle)
+        return self._tree._node(row)
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self._tree)
+
+    def __len__(self) -> int:
+        return len(self._tree)
+
+
+class ColumnarNodeTree:
+    """
+    Node tree kept in columns rather than one object per node, for
+    accounts with millions of nodes.
+
+    Every node is a row: its handle, the row of its parent, type, size,
+    timestamp, owner and name live in flat `array`s, with owners and
+    names interned, and node keys are packed in one buffer. The
+    attributes (still encrypted until first read) are kept in a per-row
+    list, the rarely used server fields in a sparse dict. Filtering by
+    type scans the packed type column, and children and names are
+    indexed by row, so a tree costs a few dozen bytes per node besides
+    its handle and attributes, and leaves the garbage collector almost
+    nothing to track.
+
+    It has the lookup API of `mega.tree.NodeTree` and can replace it
+    through the `node_tree` option of `Mega`. Nodes read from it are
+    built on demand and are snapshots: change the tree through its
+    methods, not by writing to a node. A node is built once for as long
+    as anyone holds it, and its attributes are only decrypted when read;
+    the tree then keeps them decrypted too.
+
+    The rows of removed nodes are dropped once there are more of them
+    than live nodes, and at least `COMPACT_MIN_ROWS`.
+    """
+    COMPACT_MIN_ROWS = 4096
+
+    def __init__(self, nodes: Iterable[Dict[str, Any]] = ()) -> None:
+        self.created_at = time.monotonic()
+        # sequence number of the last change applied, see mega.sync
+        self.sn: Optional[str] = None
+        self.nodes = _NodesView(self)
+        self._rows: Dict[str, int] = {}
+        self._handles: List[str] = []
+        self._parents = array('l')
+        self._types = array('b')
+        self._sizes = array('q')
+        self._timestamps = array('q')
+        self._owners = array('l')
+        self._names = array('l')
+        self._keys = bytearray()
+        # length of each row's key, 0 for nodes without one
+        self._key_sizes = bytearray()
+        # decrypted attributes, or the encrypted string while pending
+        self._attributes: List[Any] = []
+        self._pending = bytearray()
+        # row -> (extra fields, shared folder key) of the few nodes with any
+        self._extra: Dict[int, tuple] = {}
+        self._strings: List[str] = []
+        self._string_ids: Dict[str, int] = {}
+        self._live = 0
+        # rows removed since the last compaction
+        self._removed = 0
+        # row -> the node built from it, while anyone holds that node
+        self._views: 'weakref.WeakValueDictionary[int, _RowNode]' = (
+            weakref.WeakValueDictionary())
+        # parent row -> child rows, and name id -> rows, built on first
+        # use; entries left stale by changes are dropped when read
+        self._child_index: Optional[Dict[int, array]] = None
+        self._name_index: Optional[Dict[int, array]] = None
+        for node in nodes:
+            self.add(node)
+
+    def __len__(self) -> int:
+        return self._live
+
+    def __contains__(self, handle: str) -> bool:
+        return self._live_row(handle) is not None
+
+    def __iter__(self) -> Iterator[str]:
+        types = self._types
+        handles = self._handles
+        return (handles[row] for row in range(len(handles))
+                if types[row] != _ABSENT)
+
+    def age(self) -> float:
+        """
+        Returns:
+            Seconds since the tree was fetched or last brought up to date
+        """
+        return time.monotonic() - self.created_at
+
+    def touch(self) -> None:
+        """
+        Mark the tree as current, once the changes made since it was
+        fetched have been applied.
+        """
+        self.created_at = time.monotonic()
+
+    def get(self, handle: str) -> Optional[Node]:
+        row = self._live_row(handle)
+        return None if row is None else self._node(row)
+
+    def items(self):
+        return self.nodes.items()
+
+    def materialize(self) -> None:
+        """
+        Decrypt the attributes of every node that still holds them
+        encrypted.
+        """
+        start = 0
+        while True:
+            row = self._pending.find(1, start)
+            if row < 0:
+                return
+            self._attributes_of(row)
+            start = row + 1
+
+    def add(self, node: Dict[str, Any]) -> None:
+        """
+        Insert a node, replacing any node with the same handle.
+        """
+        if not isinstance(node, Node):
+            key = node.get('key')
+            node = Node(node, a32_to_str(key) if key is not None else None)
+        row = self._rows.get(node.h)
+        if row is None:
+            row = self._append(node.h)
+        self._views.pop(row, None)
+        if self._types[row] == _ABSENT:
+            self._live += 1
+        self._parents[row] = self._parent_row(node.p)
+        self._types[row] = node.t
+        self._sizes[row] = node.s or 0
+        self._timestamps[row] = (node.ts
+                                 if node.ts is not None else _NO_TIMESTAMP)
+        self._owners[row] = self._intern(node.u)
+        self._set_key(row, node.key_bytes)
+        if node.extra or node.shared_folder_key is not None:
+            self._extra[row] = (node.extra, node.shared_folder_key)
+        else:
+            self._extra.pop(row, None)
+        if node.decrypted:
+            self._set_attributes(row, node['a'])
+        else:
+            self._attributes[row] = node.encrypted_attributes
+            self._pending[row] = 1
+            self._names[row] = -1
+        self._index_child(row)
+
+    def remove(self, handle: str) -> List[str]:
+        """
+        Remove a node together with everything below it.
+
+        Returns:
+            Handles of the removed nodes
+        """
+        row = self._live_row(handle)
+        if row is None:
+            return []
+        rows = list(self._subtree_rows(row))
+        for current in rows:
+            self._views.pop(current, None)
+            self._parents[current] = -1
+            self._types[current] = _ABSENT
+            self._sizes[current] = 0
+            self._set_key(current, None)
+            self._attributes[current] = None
+            self._pending[current] = 0
+            self._names[current] = -1
+            self._extra.pop(current, None)
+        self._live -= len(rows)
+        self._removed += len(rows)
+        removed = [self._handles[current] for current in rows]
+        if self._removed > max(self._live, self.COMPACT_MIN_ROWS):
+            self._compact()
+        return removed
+
+    def move(self, handle: str, parent: str) -> None:
+        row = self._live_row(handle)
+        if row is not None:
+            self._views.pop(row, None)
+            self._parents[row] = self._parent_row(parent)
+            self._index_child(row)
+
+    def set_attributes(self, handle: str, attributes: Dict[str, Any]) -> None:
+        row = self._live_row(handle)
+        if row is not None:
+            self._views.pop(row, None)
+            self._set_attributes(row, attributes)
+
+    def set_timestamp(self, handle: str, timestamp: int) -> None:
+        row = self._live_row(handle)
+        if row is not None:
+            self._views.pop(row, None)
+            self._timestamps[row] = timestamp
+
+    def children(self, handle: str) -> List[str]:
+        """
+        Returns:
+            Handles of the nodes directly inside `handle`
+        """
+        row = self._rows.get(handle)
+        if row is None:
+            return []
+        return [self._handles[child] for child in self._child_rows(row)]
+
+    def subtree(self, handle: str) -> List[str]:
+        """
+        Returns:
+            Handles of a node and everything below it
+        """
+        row = self._live_row(handle)
+        if row is None:
+            return []
+        return [self._handles[current] for current in self._subtree_rows(row)]
+
+    def total_size(self, handle: Optional[str] = None) -> int:
+        """
+        Returns:
+            Bytes taken by the files below a node, or by every file
+        """
+        if handle is None:
+            return sum(self._sizes)
+        row = self._live_row(handle)
+        if row is None:
+            return 0
+        sizes = self._sizes
+        return sum(sizes[current] for current in self._subtree_rows(row))
+
+    def by_type(self, node_type: int) -> List[str]:
+        """
+        Returns:
+            Handles of the nodes of a numeric type, see
+            `Mega.get_node_by_type`
+        """
+        types = self._types.tobytes()
+        needle = node_type.to_bytes(1, 'big', signed=True)
+        handles = []
+        row = types.find(needle)
+        while row >= 0:
+            handles.append(self._handles[row])
+            row = types.find(needle, row + 1)
+        return handles
+
+    def named(self, name: str, parent: Optional[str] = None) -> List[str]:
+        """
+        Returns:
+            Handles of the nodes called `name`, only those directly
+            inside `parent` if given
+        """
+        if parent is not None and self._name_index is None:
+            # only the children need decrypting, not the whole tree
+            parent_row = self._rows.get(parent)
+            if parent_row is None:
+                return []
+            rows = self._child_rows(parent_row)
+            for row in rows:
+                self._attributes_of(row)
+            name_id = self._string_ids.get(name)
+            names = self._names
+            return [
+                self._handles[row] for row in rows
+                if name_id is not None and names[row] == name_id
+            ]
+        if self._name_index is None:
+            self.materialize()
+            self._name_index = {}
+            for row, name_id in enumerate(self._names):
+                if name_id >= 0:
+                    self._name_index.setdefault(name_id,
+                                                array('l')).append(row)
+        name_id = self._string_ids.get(name)
+        if name_id is None:
+            return []
+        parent_row = None
+        if parent is not None:
+            parent_row = self._rows.get(parent)
+            if parent_row is None:
+                return []
+        names = self._names
+        parents = self._parents
+        return [
+            self._handles[row] for row in dict.fromkeys(
+                self._name_index.get(name_id, ())) if names[row] == name_id
+            and (parent_row is None or parents[row] == parent_row)
+        ]
+
+    def resolve(self, path: str, root: str) -> Optional[str]:
+        """
+        Follow a path like folder1/folder2 down from `root`, through
+        folders only.
+
+        Returns:
+            Handle of the last folder, None if the path does not exist
+        """
+        handle = root
+        for name in path.split('/'):
+            if name == '':
+                continue
+            for child in self.named(name, handle):
+                if self._types[self._rows[child]]:
+                    handle = child
+                    break
+            else:
+                return None
+        return handle
+
+    def path(self, handle: str) -> Optional[str]:
+        """
+        Returns:
+            Full path of a node, e.g. Cloud Drive/folder1/file.txt
+        """
+        row = self._live_row(handle)
+        if row is None:
+            return None
+        names = []
+        while row >= 0 and self._types[row] != _ABSENT:
+            attributes = self._attributes_of(row)
+            names.append((attributes or {}).get('n') or '')
+            row = self._parents[row]
+        return '/'.join(reversed(names))
+
+    def _live_row(self, handle: str) -> Optional[int]:
+        row = self._rows.get(handle)
+        if row is None or self._types[row] == _ABSENT:
+            return None
+        return row
+
+    def _append(self, handle: str) -> int:
+        row = len(self._handles)
+        self._rows[handle] = row
+        self._handles.append(handle)
+        self._parents.append(-1)
+        self._types.append(_ABSENT)
+        self._sizes.append(0)
+        self._timestamps.append(_NO_TIMESTAMP)
+        self._owners.append(-1)
+        self._names.append(-1)
+        self._keys.extend(bytes(_KEY_SIZE))
+        self._key_sizes.append(0)
+        self._attributes.append(None)
+        self._pending.append(0)
+        return row
+
+    def _parent_row(self, parent: str) -> int:
+        if not parent:
+            return -1
+        row = self._rows.get(parent)
+        if row is None:
+            row = self._append(parent)
+        return row
+
+    def _intern(self, string: str) -> int:
+        string_id = self._string_ids.get(string)
+        if string_id is None:
+            string_id = len(self._strings)
+            self._string_ids[string] = string_id
+            self._strings.append(string)
+        return string_id
+
+    def _index_child(self, row: int) -> None:
+        if self._child_index is not None:
+            self._child_index.setdefault(self._parents[row],
+                                         array('l')).append(row)
+
+    def _child_rows(self, row: int) -> List[int]:
+        if self._child_index is None:
+            self._child_index = {}
+            for child, parent in enumerate(self._parents):
+                if self._types[child] != _ABSENT:
+                    self._child_index.setdefault(parent,
+                                                 array('l')).append(child)
+        rows = self._child_index.get(row)
+        if not rows:
+            return []
+        parents = self._parents
+        types = self._types
+        children = [
+            child for child in dict.fromkeys(rows)
+            if parents[child] == row and types[child] != _ABSENT
+        ]
+        if len(children) != len(rows):
+            self._child_index[row] = array('l', children)
+        return children
+
+    def _subtree_rows(self, row: int) -> Iterator[int]:
+        pending = [row]
+        while pending:
+            current = pending.pop()
+            yield current
+            pending.extend(self._child_rows(current))
+
+    def _set_key(self, row: int, key: Optional[bytes]) -> None:
+        key = key or b''
+        start = row * _KEY_SIZE
+        self._keys[start:start + len(key)] = key
+        self._key_sizes[row] = len(key)
+
+    def _key(self, row: int) -> Optional[bytes]:
+        size = self._key_sizes[row]
+        if not size:
+            return None
+        start = row * _KEY_SIZE
+        return bytes(self._keys[start:start + size])
+
+    def _set_attributes(self, row: int, attributes: Any) -> None:
+        self._attributes[row] = attributes
+        self._pending[row] = 0
+        name = attributes.get('n') if isinstance(attributes, dict) else None
+        if name is None:
+            self._names[row] = -1
+            return
+        name_id = self._intern(name)
+        self._names[row] = name_id
+        if self._name_index is not None:
+            self._name_index.setdefault(name_id, array('l')).append(row)
+
+    def _decrypt(self, row: int) -> None:
+        key = str_to_a32(self._key(row))
+        if self._types[row] == 0:
+            key = (key[0] ^ key[4], key[1] ^ key[5], key[2] ^ key[6],
+                   key[3] ^ key[7])
+        self._set_attributes(
+            row,
+            decrypt_attr(base64_url_decode(self._attributes[row]), key))
+
+    def _attributes_of(self, row: int) -> Any:
+        if self._pending[row]:
+            node = self._views.get(row)
+            if node is not None and node.decrypted:
+                # already decrypted through a node read from the tree
+                self._set_attributes(row, node['a'])
+            else:
+                self._decrypt(row)
+        return self._attributes[row]
+
+    def _node(self, row: int) -> Node:
+        node = self._views.get(row)
+        if node is None:
+            node = self._views[row] = self._build(row)
+        return node
+
+    def _build(self, row: int) -> _RowNode:
+        node_type = self._types[row]
+        parent = self._parents[row]
+        fields = {
+            'h': self._handles[row],
+            'p': self._handles[parent] if parent >= 0 else '',
+            'u': self._strings[self._owners[row]],
+            't': node_type,
+            # still encrypted while pending, for the node to decrypt
+            'a': self._attributes[row],
+        }
+        if node_type == 0:
+            fields['s'] = self._sizes[row]
+        if self._timestamps[row] != _NO_TIMESTAMP:
+            fields['ts'] = self._timestamps[row]
+        extra, shared_folder_key = self._extra.get(row, (None, None))
+        if extra:
+            fields.update(extra)
+        if shared_folder_key is not None:
+            fields['shared_folder_key'] = shared_folder_key
+        return _RowNode(fields, self._key(row))
+
+    def _compact(self) -> None:
+        """
+        Drop the rows of removed nodes, keeping those of absent parents
+        that live nodes still point to, and renumber the rest.
+        """
+        types = self._types
+        parents = self._parents
+        keep = bytearray(len(types))
+        for row, node_type in enumerate(types):
+            if node_type != _ABSENT:
+                keep[row] = 1
+                if parents[row] >= 0:
+                    keep[parents[row]] = 1
+        rows = [row for row, kept in enumerate(keep) if kept]
+        moved = array('l', [-1]) * len(types)
+        for new_row, row in enumerate(rows):
+            moved[row] = new_row
+        self._handles = [self._handles[row] for row in rows]
+        self._rows = {handle: row for row, handle in enumerate(self._handles)}
+        self._parents = array('l', (moved[parents[row]]
+                                    if parents[row] >= 0 else -1
+                                    for row in rows))
+        for name in ('_types', '_sizes', '_timestamps', '_owners', '_names'):
+            column = getattr(self, name)
+            setattr(self, name,
+                    array(column.typecode, (column[row] for row in rows)))
+        self._keys = bytearray().join(
+            self._keys[row * _KEY_SIZE:(row + 1) * _KEY_SIZE] for row in rows)
+        self._key_sizes = bytearray(self._key_sizes[row] for row in rows)
+        self._attributes = [self._attributes[row] for row in rows]
+        self._pending = bytearray(self._pending[row] for row in rows)
+        self._extra = {
+            moved[row]: extra
+            for row, extra in self._extra.items() if moved[row] >= 0
+        }
+        self._views = weakref.WeakValueDictionary()
+        self._child_index = None
+        self._name_index = None
+        self._removed = 0
@@ -1,4 +1,5 @@
 from Crypto.Cipher import AES
+import functools
 import json
 import base64
 import struct
@@ -6,7 +7,7 @@ import binascii
 import random
 import sys
 import codecs
-from typing import List, Tuple, Union, Optional
+from typing import List, Tuple, Union, Optional, Sequence
 
 # Python3 compatibility
 if sys.version_info < (3, ):
@@ -27,6 +28,39 @@ else:
         return codecs.latin_1_decode(x)[0]
 
 
+# number of keys whose expanded AES cipher is kept by aes_ecb_cipher
+CIPHER_CACHE_SIZE = 1024
+
+
+@functools.lru_cache(maxsize=CIPHER_CACHE_SIZE)
+def aes_ecb_cipher(key: bytes):
+    """
+    AES-ECB cipher for a key, from a bounded LRU cache.
+
+    ECB keeps no state between calls, so one object per key can be
+    shared, and hot loops stop paying for key expansion on every block.
+    The zero-IV CBC helpers below are built on it.
+
+    Args:
+        key: 16, 24 or 32 byte key
+
+    Returns:
+        Cipher object
+    """
+    return AES.new(key, AES.MODE_ECB)
+
+
+def _ecb_cipher(key: bytes, cache: bool):
+    if cache:
+        return aes_ecb_cipher(key)
+    return AES.new(key, AES.MODE_ECB)
+
+
+def _xor(a: bytes, b: bytes) -> bytes:
+    return (int.from_bytes(a, 'big') ^ int.from_bytes(b, 'big')).to_bytes(
+        len(a), 'big')
+
+
 def aes_cbc_encrypt(data: bytes, key: bytes) -> bytes:
     """
     Encrypt data using AES in CBC mode.
@@ -38,10 +72,12 @@ def aes_cbc_encrypt(data: bytes, key: bytes) -> bytes:
     Returns:
         Encrypted data
     """
-    if len(key) != 32:  # AES-256 requires 32-byte key
-        raise ValueError("Key must be 32 bytes long")
-    aes_cipher = AES.new(key, AES.MODE_CBC, makebyte('\0' * 16))
-    return aes_cipher.encrypt(data)
+    if len(key) not in AES.key_size:
+        raise ValueError("Key must be 16, 24 or 32 bytes long")
+    if len(data) == 16:
+        # a single block is its ECB encryption, from the cached cipher
+        return aes_ecb_cipher(key).encrypt(data)
+    return AES.new(key, AES.MODE_CBC, b'\0' * 16).encrypt(data)
 
 
 def aes_cbc_decrypt(data: bytes, key: bytes) -> bytes:
@@ -55,10 +91,31 @@ def aes_cbc_decrypt(data: bytes, key: bytes) -> bytes:
     Returns:
         Decrypted data
     """
-    if len(key) != 32:
-        raise ValueError("Key must be 32 bytes long")
-    aes_cipher = AES.new(key, AES.MODE_CBC, makebyte('\0' * 16))
-    return aes_cipher.decrypt(data)
+    if len(key) not in AES.key_size:
+        raise ValueError("Key must be 16, 24 or 32 bytes long")
+    decrypted = aes_ecb_cipher(key).decrypt(data)
+    if len(data) <= 16:
+        return decrypted
+    return _xor(decrypted, b'\0' * 16 + data[:-16])
+
+
+def aes_encrypt_rounds(block: bytes, key: bytes, rounds: int) -> bytes:
+    """
+    Encrypt a block with the same key `rounds` times over.
+
+    This is a CBC encryption of zero blocks with the block as IV, so it
+    runs as a single cipher call.
+
+    Args:
+        block: 16 bytes to encrypt
+        key: Encryption key
+        rounds: Number of encryptions
+
+    Returns:
+        The last ciphertext block
+    """
+    cipher = AES.new(key, AES.MODE_CBC, block)
+    return cipher.encrypt(bytes(16 * rounds))[-16:]
 
 
 def aes_cbc_encrypt_a32(data: List[int], key: List[int]) -> List[int]:
@@ -110,66 +167,141 @@ def stringhash(str: str, aeskey: List[int]) -> str:
     h32 = [0, 0, 0, 0]
     for i in range(len(s32)):
         h32[i % 4] ^= s32[i]
-    for r in range(0x4000):
-        h32 = aes_cbc_encrypt_a32(h32, aeskey)
+    h32 = str_to_a32(
+        aes_encrypt_rounds(a32_to_str(h32), a32_to_str(aeskey), 0x4000))
     return a32_to_base64((h32[0], h32[2]))
 
 
+# starting value of the v1 password key derivation
+_PREPARE_KEY_SEED = bytes.fromhex('93c467e37db0c7a4d1be3f810152cb56')
+_PREPARE_KEY_ROUNDS = 0x10000
+
+
+def prepare_key_bytes(password: bytes) -> bytes:
+    """
+    Derive the AES key of a v1 account from its password.
+
+    Every 16-byte block of the password, zero padded, is a key that
+    encrypts the running value in turn, for 0x10000 rounds. The cipher
+    for each block is built once. For a password of a single block the
+    rounds are a CBC encryption of zero blocks with the seed as IV, done
+    in one call.
+
+    Args:
+        password: Password bytes
+
+    Returns:
+        16-byte derived key
+    """
+    if len(password) % 16:
+        password += b'\0' * (16 - len(password) % 16)
+    if not password:
+        return _PREPARE_KEY_SEED
+    if len(password) == 16:
+        return aes_encrypt_rounds(_PREPARE_KEY_SEED, password,
+                                  _PREPARE_KEY_ROUNDS)
+    # built here rather than taken from aes_ecb_cipher, so that no
+    # password material stays in the shared cache
+    encrypts = [
+        AES.new(password[i:i + 16], AES.MODE_ECB).encrypt
+        for i in range(0, len(password), 16)
+    ]
+    pkey = _PREPARE_KEY_SEED
+    for _ in range(_PREPARE_KEY_ROUNDS):
+        for encrypt in encrypts:
+            pkey = encrypt(pkey)
+    return pkey
+
+
 def prepare_key(arr: List[int]) -> List[int]:
     """
     Prepare AES key from array.
     
     Args:
-        arr: Input array of integers
+        arr: Input array of integers, zero padded to a multiple of 4
         
     Returns:
         Prepared AES key as list of 4 integers
     """
-    pkey = [0x93C467E3, 0x7DB0C7A4, 0xD1BE3F81, 0x0152CB56]
-    if len(arr) % 4 != 0:
-        raise ValueError("Input array length must be multiple of 4")
-    for r in range(0x10000):
-        for j in range(0, len(arr), 4):
-            key = [0, 0, 0, 0]
-            for i in range(4):
-                if i + j < len(arr):
-                    key[i] = arr[i + j]
-            pkey = aes_cbc_encrypt_a32(pkey, key)
-    return pkey
+    if not arr:
+        return list(str_to_a32(_PREPARE_KEY_SEED))
+    return str_to_a32(prepare_key_bytes(a32_to_str(arr)))
+
+
+def encrypt_key_bytes(data: bytes, key: bytes, cache: bool = True) -> bytes:
+    """
+    Encrypt key material, such as node keys or the RSA private key, with
+    another key. Every 16-byte block is encrypted on its own (ECB), in a
+    single cipher call.
+
+    Args:
+        data: Key material, a multiple of 16 bytes
+        key: 16 byte encryption key
+        cache: Whether to use the shared `aes_ecb_cipher` cache; off
+            for keys that should not outlive the call, such as
+            password keys
+
+    Returns:
+        Encrypted key material
+    """
+    if len(key) != 16:
+        raise ValueError("Key must be 16 bytes long")
+    return _ecb_cipher(key, cache).encrypt(data)
+
+
+def decrypt_key_bytes(data: bytes, key: bytes, cache: bool = True) -> bytes:
+    """
+    Decrypt key material encrypted by `encrypt_key_bytes`.
 
+    Args:
+        data: Encrypted key material, a multiple of 16 bytes
+        key: 16 byte decryption key
+        cache: Whether to use the shared `aes_ecb_cipher` cache
 
-def encrypt_key(a: List[int], key: List[int]) -> List[int]:
+    Returns:
+        Decrypted key material
+    """
+    if len(key) != 16:
+        raise ValueError("Key must be 16 bytes long")
+    return _ecb_cipher(key, cache).decrypt(data)
+
+
+def encrypt_key(a: List[int], key: List[int],
+                cache: bool = True) -> List[int]:
     """
     Encrypt key using AES.
     
     Args:
         a: Data to encrypt as list of integers
         key: Encryption key as list of 4 integers
+        cache: See `encrypt_key_bytes`
         
     Returns:
         Encrypted data as list of integers
     """
     if len(key) != 4:
         raise ValueError("Key must be 4 integers long")
-    return sum((aes_cbc_encrypt_a32(a[i:i + 4], key)
-                for i in range(0, len(a), 4)), ())
+    return str_to_a32(
+        encrypt_key_bytes(a32_to_str(a), a32_to_str(key), cache))
 
 
-def decrypt_key(a: List[int], key: List[int]) -> List[int]:
+def decrypt_key(a: List[int], key: List[int],
+                cache: bool = True) -> List[int]:
     """
     Decrypt key using AES.
     
     Args:
         a: Encrypted data as list of integers
         key: Decryption key as list of 4 integers
+        cache: See `encrypt_key_bytes`
         
     Returns:
         Decrypted data as list of integers
     """
     if len(key) != 4:
         raise ValueError("Key must be 4 integers long")
-    return sum((aes_cbc_decrypt_a32(a[i:i + 4], key)
-                for i in range(0, len(a), 4)), ())
+    return str_to_a32(
+        decrypt_key_bytes(a32_to_str(a), a32_to_str(key), cache))
 
 
 def encrypt_attr(attr: dict, key: List[int]) -> bytes:
@@ -302,6 +434,73 @@ def get_chunks(size):
     yield (p, size - p)
 
 
+class MacAccumulator:
+    """
+    Streaming CBC-MAC of a file, fed one chunk at a time.
+
+    Every chunk is MACed with AES-CBC under the file key, seeded with the
+    file IV and zero padded to a block boundary. Only the last ciphertext
+    block is kept, so the whole chunk goes through a single cipher call.
+    The chunk MACs are then folded, in file order, into the file MAC with
+    a second AES-CBC chain starting from a zero IV.
+    """
+
+    def __init__(self, key: bytes, iv: Sequence[int]) -> None:
+        """
+        Args:
+            key: File key as 16 bytes
+            iv: File IV, at least its first two 32-bit integers
+        """
+        self.key = key
+        self.chunk_iv = a32_to_str([iv[0], iv[1], iv[0], iv[1]])
+        self._mac_encryptor = AES.new(key, AES.MODE_CBC, b'\0' * 16)
+        self._mac = b'\0' * 16
+
+    def chunk_mac(self, chunk: bytes) -> bytes:
+        """
+        Compute the MAC of a single chunk.
+
+        Args:
+            chunk: Plaintext chunk
+
+        Returns:
+            16 byte chunk MAC
+        """
+        if len(chunk) % 16:
+            chunk = bytes(chunk) + b'\0' * (16 - len(chunk) % 16)
+        encryptor = AES.new(self.key, AES.MODE_CBC, self.chunk_iv)
+        return encryptor.encrypt(chunk)[-16:]
+
+    def add_chunk_mac(self, chunk_mac: bytes) -> None:
+        """
+        Fold the MAC of the next chunk, in file order, into the file MAC.
+        """
+        self._mac = self._mac_encryptor.encrypt(chunk_mac)
+
+    def update(self, chunk: bytes) -> None:
+        """
+        MAC the next chunk of the file and fold it into the file MAC.
+        Empty chunks are ignored.
+        """
+        if chunk:
+            self.add_chunk_mac(self.chunk_mac(chunk))
+
+    def digest(self) -> bytes:
+        """
+        Returns:
+            16 byte file MAC of the chunks seen so far
+        """
+        return self._mac
+
+    def meta_mac(self) -> Tuple[int, int]:
+        """
+        Returns:
+            The condensed meta-MAC stored in the node key
+        """
+        file_mac = str_to_a32(self._mac)
+        return (file_mac[0] ^ file_mac[1], file_mac[2] ^ file_mac[3])
+
+
 def make_id(length):
     text = ''
     possible = "ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz0123456789"
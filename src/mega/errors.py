@@ -50,13 +50,17 @@ _CODE_TO_DESCRIPTIONS = {
 
 class RequestError(Exception):
     """
-    Error in API request
+    Error in API request. `code` is the API error code, None for errors
+    given as a message.
     """
     def __init__(self, message):
-        code = message
+        code = message if isinstance(message, int) else None
         self.code = code
-        code_desc, long_desc = _CODE_TO_DESCRIPTIONS[code]
-        self.message = f'{code_desc}, {long_desc}'
+        if code in _CODE_TO_DESCRIPTIONS:
+            code_desc, long_desc = _CODE_TO_DESCRIPTIONS[code]
+            self.message = f'{code_desc}, {long_desc}'
+        else:
+            self.message = str(message)
 
     def __str__(self):
         return self.message
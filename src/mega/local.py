@@ -0,0 +1,794 @@
+import asyncio
+import hashlib
+import io
+import json
+import random
+import re
+import threading
+import time
+from typing import Any, Dict, List, Optional, Tuple
+from urllib.parse import urlsplit
+
+import requests
+from Crypto.Cipher import AES
+from Crypto.PublicKey import RSA
+from Crypto.Util import Counter
+
+from .crypto import (MacAccumulator, a32_to_base64, a32_to_str,
+                     base64_url_encode, encrypt_attr, encrypt_key,
+                     encrypt_key_bytes, get_chunks, prepare_key, str_to_a32,
+                     stringhash)
+from .mega import NetworkError
+from .transport import HTTPTransport
+
+# base of the storage URLs handed out by 'g' and 'u'
+STORAGE_URL = 'https://storage.local.invalid'
+
+_HANDLE_CHARACTERS = ('ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz'
+                      '0123456789-_')
+# commands answered without a session, besides public file lookups
+_PUBLIC_COMMANDS = ('us0', 'us', 'up')
+
+
+def _mpi(value: int) -> bytes:
+    """
+    Encode an integer as a multi-precision integer, see
+    `mega.crypto.mpi_to_int`.
+    """
+    length = (value.bit_length() + 7) // 8
+    return value.bit_length().to_bytes(2, 'big') + value.to_bytes(
+        length, 'big')
+
+
+class _Account:
+    """
+    A user of a `LocalServer`, holding its keys and nodes as the server
+    sees them: everything a client sends is stored encrypted.
+    """
+    def __init__(self, handle: str, email: Optional[str], k: str) -> None:
+        self.handle = handle
+        self.email = email
+        # master key encrypted under the password key
+        self.k = k
+        self.version = 1
+        self.salt = None
+        self.user_hash = None
+        self.master_key = None
+        self.privk = None
+        self.rsa_key = None
+        # temporary session id of an anonymous account
+        self.tsid = None
+        # node handle -> node, as listed by 'f'
+        self.nodes = {}
+        self.ok = []
+        self.s = []
+        # (sequence number, action packet) pairs, oldest first
+        self.packets = []
+        self.sn = self.created_sn = None
+        self.since = int(time.time())
+
+
+class LocalServer:
+    """
+    In-process stand-in for the MEGA API and its storage hosts, for
+    testing and benchmarking without the network or an account.
+
+    It answers the commands the client sends (us0, us, up, ug, uq, ur, f,
+    g, u, p, m, d, a, l and s2), the server-client channel and storage
+    uploads and downloads. It keeps keys, attributes and file data
+    encrypted by the client as the real server does, and logs users in
+    with the real key derivation, RSA session ids and temporary session
+    checks, so the client's crypto runs unchanged against it.
+
+    Clients reach it through `LocalTransport`:
+
+        server = LocalServer()
+        server.add_user('user@example.com', 'password')
+        mega = Mega({'transport': LocalTransport(server)})
+        mega.login('user@example.com', 'password')
+    """
+    def __init__(self,
+                 rsa_bits: int = 2048,
+                 quota: int = 20 * 1024**3,
+                 seed: Optional[int] = None) -> None:
+        """
+        Args:
+            rsa_bits: Size of the RSA keys of new users; 1024 makes
+                creating them much faster
+            quota: Storage quota of every account in bytes
+            seed: Seed of the handles and keys the server makes up, for
+                runs that repeat exactly
+        """
+        self.rsa_bits = rsa_bits
+        self.quota = quota
+        self.random = random.Random(seed)
+        self._lock = threading.RLock()
+        self._changed = threading.Condition(self._lock)
+        # user handle -> account
+        self._accounts = {}
+        self._emails = {}
+        # session id -> account
+        self._sessions = {}
+        # public handle -> (account, node handle)
+        self._public = {}
+        # node handle -> encrypted file data
+        self._data = {}
+        # upload token -> [size, {offset: chunk}, bytes received]
+        self._uploads = {}
+        # completion handle -> encrypted file data
+        self._completed = {}
+        # download token -> node handle
+        self._downloads = {}
+        # wait token -> (account, sequence number)
+        self._waits = {}
+        self._sequence = 0
+
+    def _handle(self, length: int = 8) -> str:
+        return ''.join(
+            self.random.choice(_HANDLE_CHARACTERS) for _ in range(length))
+
+    def _words(self, count: int) -> List[int]:
+        return [self.random.getrandbits(32) for _ in range(count)]
+
+    def _bytes(self, count: int) -> bytes:
+        return self.random.getrandbits(count * 8).to_bytes(count, 'big')
+
+    def add_user(self,
+                 email: str,
+                 password: str,
+                 version: int = 2) -> str:
+        """
+        Create an account that logs in with `email` and `password`.
+
+        Args:
+            version: 2 for the PBKDF2 key derivation of current accounts,
+                1 for the AES rounds of old ones
+
+        Returns:
+            The user's handle
+        """
+        email = email.lower()
+        if version == 2:
+            salt = self._bytes(32)
+            derived = hashlib.pbkdf2_hmac('sha512', password.encode(), salt,
+                                          100000, 32)
+            password_key = str_to_a32(derived[:16])
+            user_hash = base64_url_encode(derived[-16:])
+        else:
+            salt = None
+            password_key = prepare_key(str_to_a32(password))
+            user_hash = stringhash(email, password_key)
+        master_key = self._words(4)
+        with self._lock:
+            account = self._new_account(
+                email, a32_to_base64(encrypt_key(master_key, password_key)))
+            account.version = version
+            account.salt = salt
+            account.user_hash = user_hash
+            account.master_key = master_key
+        self._make_rsa_key(account, master_key)
+        return account.handle
+
+    def _new_account(self, email, k):
+        account = _Account(self._handle(11), email, k)
+        for node_type in (2, 3, 4):
+            handle = self._handle()
+            account.nodes[handle] = {
+                'h': handle, 'p': '', 'u': account.handle, 't': node_type,
+                'a': '', 'k': '', 'ts': account.since
+            }
+        account.sn = account.created_sn = self._next_sn()
+        self._accounts[account.handle] = account
+        if email is not None:
+            self._emails[email] = account
+        return account
+
+    def _make_rsa_key(self, account, master_key):
+        """
+        Give an account an RSA key pair, the private key encrypted under
+        the master key as the API stores it.
+        """
+        key = RSA.generate(self.rsa_bits, randfunc=self._bytes)
+        phi = (key.p - 1) * (key.q - 1)
+        private_key = (_mpi(key.p) + _mpi(key.q) +
+                       _mpi(pow(key.e, -1, phi)) + _mpi(pow(key.q, -1,
+                                                            key.p)))
+        private_key += b'\0' * (-len(private_key) % 16)
+        account.rsa_key = key
+        account.privk = base64_url_encode(
+            encrypt_key_bytes(private_key, a32_to_str(master_key)))
+
+    def _account(self, email: str) -> _Account:
+        return self._emails[email.lower()]
+
+    def add_folder(self,
+                   email: str,
+                   name: str,
+                   parent: Optional[str] = None) -> str:
+        """
+        Create a folder in a user's account directly, as if uploaded.
+
+        Args:
+            parent: Handle of the parent folder, the root by default
+
+        Returns:
+            The folder's handle
+        """
+        account = self._account(email)
+        key = self._words(4)
+        return self._add_node(account, parent, {
+            't': 1,
+            'a': base64_url_encode(encrypt_attr({'n': name}, key)),
+            'k': a32_to_base64(encrypt_key(key, account.master_key)),
+        })
+
+    def add_file(self,
+                 email: str,
+                 name: str,
+                 data: bytes = b'',
+                 parent: Optional[str] = None) -> str:
+        """
+        Store a file in a user's account directly, encrypted as an upload
+        would be.
+
+        Args:
+            parent: Handle of the parent folder, the root by default
+
+        Returns:
+            The file's handle
+        """
+        account = self._account(email)
+        ul_key = self._words(6)
+        k_str = a32_to_str(ul_key[:4])
+        iv = ul_key[4:6]
+        counter = Counter.new(128,
+                              initial_value=((iv[0] << 32) + iv[1]) << 64)
+        cipher = AES.new(k_str, AES.MODE_CTR, counter=counter)
+        mac = MacAccumulator(k_str, iv)
+        encrypted = []
+        for chunk_start, chunk_size in get_chunks(len(data)):
+            chunk = data[chunk_start:chunk_start + chunk_size]
+            mac.update(chunk)
+            encrypted.append(cipher.encrypt(chunk))
+        meta_mac = mac.meta_mac()
+        key = [
+            ul_key[0] ^ ul_key[4], ul_key[1] ^ ul_key[5],
+            ul_key[2] ^ meta_mac[0], ul_key[3] ^ meta_mac[1], ul_key[4],
+            ul_key[5], meta_mac[0], meta_mac[1]
+        ]
+        return self._add_node(account, parent, {
+            't': 0,
+            'a': base64_url_encode(encrypt_attr({'n': name}, ul_key[:4])),
+            'k': a32_to_base64(encrypt_key(key, account.master_key)),
+        }, b''.join(encrypted))
+
+    def add_tree(self, email: str, count: int) -> List[str]:
+        """
+        Fill a user's drive with `count` synthetic nodes named 'node 0',
+        'node 1'... for benchmarks of large accounts. Every tenth is a
+        folder and the others are spread over them. The files have a
+        size but no data, so they can be listed and found but not
+        downloaded.
+
+        The nodes are not reported on the server-client channel, so add
+        them before clients fetch the tree.
+
+        Returns:
+            The handles of the nodes, in order
+        """
+        account = self._account(email)
+        keys = self._bytes(24 * count)
+        encrypted = encrypt_key_bytes(
+            b''.join(keys[i * 24:i * 24 + 16] * 2 if i % 10 == 0 else
+                     keys[i * 24:i * 24 + 24] + keys[i * 24:i * 24 + 8]
+                     for i in range(count)), a32_to_str(account.master_key))
+        with self._lock:
+            folders = [self._special(account, 2)]
+            handles = []
+            for i in range(count):
+                is_folder = i % 10 == 0
+                key = str_to_a32(encrypted[i * 32:i * 32 + 32])
+                plain = str_to_a32(keys[i * 24:i * 24 + 24] +
+                                   keys[i * 24:i * 24 + 8])
+                k = plain[:4] if is_folder else [
+                    plain[j] ^ plain[j + 4] for j in range(4)
+                ]
+                node = self._make_node(
+                    account, folders[i % len(folders)], {
+                        't': int(is_folder),
+                        'a': base64_url_encode(
+                            encrypt_attr({'n': f'node {i}'}, k)),
+                        'k': a32_to_base64(key[:4] if is_folder else key),
+                    }, None if is_folder else b'')
+                if not is_folder:
+                    node['s'] = 1024
+                    del self._data[node['h']]
+                else:
+                    folders.append(node['h'])
+                handles.append(node['h'])
+            return handles
+
+    def _add_node(self, account, parent, new, data=None):
+        with self._lock:
+            if parent is None:
+                parent = self._special(account, 2)
+            node = self._make_node(account, parent, new, data)
+            self._log(account, {'a': 't', 't': {'f': [dict(node)]}})
+            return node['h']
+
+    def _make_node(self, account, parent, new, data=None):
+        handle = self._handle()
+        node = {
+            'h': handle,
+            'p': parent,
+            'u': account.handle,
+            't': new['t'],
+            'a': new['a'],
+            'k': f"{account.handle}:{new['k']}",
+            'ts': int(time.time()),
+        }
+        if new['t'] == 0:
+            node['s'] = len(data)
+            self._data[handle] = data
+        account.nodes[handle] = node
+        return node
+
+    @staticmethod
+    def _special(account, node_type):
+        return next(handle for handle, node in account.nodes.items()
+                    if node['t'] == node_type)
+
+    def _next_sn(self):
+        self._sequence += 1
+        return base64_url_encode(self._sequence.to_bytes(8, 'big'))
+
+    def _log(self, account, *packets):
+        """
+        Queue action packets for the account's server-client channel and
+        wake its waiting clients.
+        """
+        account.sn = self._next_sn()
+        account.packets.extend((account.sn, packet) for packet in packets)
+        self._changed.notify_all()
+
+    def request(self,
+                method: str,
+                url: str,
+                params: Optional[Dict[str, Any]] = None,
+                data: Any = None,
+                headers: Optional[Dict[str, str]] = None,
+                timeout: Optional[float] = None) -> Tuple[int, bytes]:
+        """
+        Answer an HTTP request to the API or a storage host.
+
+        Returns:
+            (status code, body)
+        """
+        path = urlsplit(url).path
+        params = params or {}
+        if path == '/cs':
+            return 200, json.dumps(self._api(params, data)).encode()
+        if path == '/sc':
+            return 200, json.dumps(self._sc(params)).encode()
+        match = re.fullmatch(r'/wsc/([\w-]+)', path)
+        if match:
+            return self._wait(match.group(1), timeout)
+        match = re.fullmatch(r'/dl/([\w-]+)', path)
+        if match and method == 'GET':
+            return self._download(match.group(1), headers or {})
+        match = re.fullmatch(r'/ul/([\w-]+)/(\d+)', path)
+        if match and method == 'POST':
+            return self._upload(match.group(1), int(match.group(2)), data)
+        return 404, b''
+
+    def _api(self, params, data):
+        try:
+            commands = json.loads(data)
+        except (TypeError, ValueError):
+            return -2
+        if not isinstance(commands, list):
+            return -2
+        with self._lock:
+            account = None
+            if 'sid' in params:
+                account = self._sessions.get(params['sid'])
+                if account is None:
+                    return -15
+            results = []
+            for command in commands:
+                if not isinstance(command, dict):
+                    results.append(-2)
+                    continue
+                action = command.get('a')
+                handler = getattr(self, f'_command_{action}', None)
+                if handler is None:
+                    results.append(-2)
+                elif account is None and not self._is_public(command):
+                    results.append(-11)
+                else:
+                    try:
+                        results.append(handler(account, command))
+                    except (KeyError, IndexError, TypeError, ValueError):
+                        results.append(-2)
+            return results
+
+    @staticmethod
+    def _is_public(command):
+        return command['a'] in _PUBLIC_COMMANDS or (command['a'] in ('f', 'g')
+                                                    and 'p' in command)
+
+    def _subtree(self, account, handle):
+        handles = [handle]
+        for current in handles:
+            handles.extend(h for h, node in account.nodes.items()
+                           if node['p'] == current)
+        return handles
+
+    def _command_us0(self, account, command):
+        account = self._emails.get(command['user'].lower())
+        if account is None:
+            return -9
+        if account.version == 2:
+            return {'s': base64_url_encode(account.salt), 'v': 2}
+        return {'v': 1}
+
+    def _command_us(self, account, command):
+        user = command['user']
+        account = self._accounts.get(user)
+        if account is not None and account.email is None:
+            self._sessions[account.tsid] = account
+            return {'k': account.k, 'tsid': account.tsid, 'u': user}
+        account = self._emails.get(user.lower())
+        if account is None or command.get('uh') != account.user_hash:
+            return -9
+        rsa_key = account.rsa_key
+        sid = bytes([self.random.randint(1, 255)]) + self._bytes(42)
+        padded = sid + self._bytes(rsa_key.size_in_bytes() - 1 - len(sid))
+        csid = pow(int.from_bytes(padded, 'big'), rsa_key.e, rsa_key.n)
+        self._sessions[base64_url_encode(sid)] = account
+        return {
+            'k': account.k,
+            'privk': account.privk,
+            'csid': base64_url_encode(_mpi(csid)),
+            'u': account.handle
+        }
+
+    def _command_up(self, account, command):
+        """
+        Create an anonymous account from its encrypted master key and the
+        session self-challenge its temporary session id is checked with.
+        """
+        account = self._new_account(None, command['k'])
+        account.tsid = command['ts']
+        return account.handle
+
+    def _command_ug(self, account, command):
+        return {
+            'u': account.handle,
+            'email': account.email,
+            'k': account.k,
+            'since': account.since,
+            's': 1 if account.email else 0
+        }
+
+    def _command_uq(self, account, command):
+        used = sum(node.get('s', 0) for node in account.nodes.values())
+        result = {
+            'mstrg': self.quota,
+            'cstrg': used,
+            'mxfer': self.quota,
+            'caxfer': 0,
+            'utype': 0
+        }
+        if command.get('pro'):
+            result['balance'] = []
+        return result
+
+    def _command_ur(self, account, command):
+        return 0
+
+    def _command_f(self, account, command):
+        if 'p' in command:
+            public = self._public.get(command['p'])
+            if public is None:
+                return -9
+            owner, handle = public
+            return {'f': [dict(owner.nodes[handle])]}
+        return {
+            'f': [dict(node) for node in account.nodes.values()],
+            'ok': [dict(ok) for ok in account.ok],
+            's': [dict(share) for share in account.s],
+            'sn': account.sn,
+        }
+
+    def _command_g(self, account, command):
+        if 'p' in command:
+            public = self._public.get(command['p'])
+            if public is None:
+                return -9
+            owner, handle = public
+            node = owner.nodes[handle]
+        else:
+            node = account.nodes.get(command['n'])
+            if node is None:
+                return -9
+        if node['t'] != 0:
+            return -2
+        if node['h'] not in self._data:
+            return -9
+        result = {'s': node['s'], 'at': node['a']}
+        if command.get('g'):
+            token = self._handle(16)
+            self._downloads[token] = node['h']
+            result['g'] = f'{STORAGE_URL}/dl/{token}'
+        return result
+
+    def _command_u(self, account, command):
+        size = int(command['s'])
+        if size < 0:
+            return -2
+        token = self._handle(16)
+        self._uploads[token] = [size, {}, 0]
+        return {'p': f'{STORAGE_URL}/ul/{token}'}
+
+    def _command_p(self, account, command):
+        parent = command['t']
+        if parent not in account.nodes:
+            return -9
+        nodes = []
+        for new in command['n']:
+            data = None
+            if new['t'] == 0:
+                if 'ph' in new:
+                    public = self._public.get(new['ph'])
+                    if public is None:
+                        return -9
+                    data = self._data[public[1]]
+                else:
+                    data = self._completed.pop(new['h'], None)
+                    if data is None:
+                        return -9
+            elif new['t'] != 1:
+                return -2
+            nodes.append(self._make_node(account, parent, new, data))
+        self._log(account, {
+            'a': 't',
+            't': {'f': [dict(node) for node in nodes]},
+            'i': command.get('i')
+        })
+        return {'f': [dict(node) for node in nodes]}
+
+    def _command_m(self, account, command):
+        node = account.nodes.get(command['n'])
+        target = command['t']
+        if node is None or target not in account.nodes:
+            return -9
+        if target in self._subtree(account, command['n']):
+            return -10
+        node['p'] = target
+        # the channel reports a move as a deletion and the node put back
+        self._log(account, {'a': 'd', 'n': node['h'], 'i': command.get('i')},
+                  {'a': 't', 't': {'f': [dict(node)]},
+                   'i': command.get('i')})
+        return 0
+
+    def _command_d(self, account, command):
+        if command['n'] not in account.nodes:
+            return -9
+        removed = set(self._subtree(account, command['n']))
+        for handle in removed:
+            del account.nodes[handle]
+            self._data.pop(handle, None)
+        self._public = {
+            public_handle: (owner, handle)
+            for public_handle, (owner, handle) in self._public.items()
+            if owner is not account or handle not in removed
+        }
+        self._log(account, {'a': 'd', 'n': command['n'],
+                            'i': command.get('i')})
+        return 0
+
+    def _command_a(self, account, command):
+        node = account.nodes.get(command['n'])
+        if node is None:
+            return -9
+        node['a'] = command['attr']
+        if 'key' in command:
+            node['k'] = f"{account.handle}:{command['key']}"
+        self._log(account, {'a': 'u', 'n': node['h'], 'at': node['a'],
+                            'ts': node['ts'], 'i': command.get('i')})
+        return 0
+
+    def _command_l(self, account, command):
+        if command['n'] not in account.nodes:
+            return -9
+        for public_handle, (owner, handle) in self._public.items():
+            if owner is account and handle == command['n']:
+                return public_handle
+        public_handle = self._handle()
+        self._public[public_handle] = (account, command['n'])
+        return public_handle
+
+    def _command_s2(self, account, command):
+        """
+        Share a folder. Only exports, shares with the 'EXP' pseudo user
+        behind folder links, are kept: the share key under the master
+        key goes to 'ok', and the keys of the shared nodes under the
+        share key are added to those nodes.
+        """
+        node = account.nodes.get(command['n'])
+        if node is None:
+            return -9
+        if node['t'] != 1:
+            return -2
+        handle = node['h']
+        account.ok = [ok for ok in account.ok if ok['h'] != handle]
+        account.ok.append({'h': handle, 'k': command['ok'],
+                           'ha': command['ha']})
+        for share in command['s']:
+            if share['u'] == 'EXP':
+                account.s = [share for share in account.s
+                             if share['h'] != handle]
+                account.s.append({'u': 'EXP', 'h': handle, 'r': share['r']})
+        shares, nodes, keys = command['cr']
+        for index in range(0, len(keys), 3):
+            share_handle = shares[keys[index]]
+            shared = account.nodes.get(nodes[keys[index + 1]])
+            if shared is None:
+                return -9
+            parts = [part for part in shared['k'].split('/')
+                     if not part.startswith(f'{share_handle}:')]
+            shared['k'] = '/'.join(parts +
+                                   [f'{share_handle}:{keys[index + 2]}'])
+        return 0
+
+    def _sc(self, params):
+        with self._lock:
+            account = self._sessions.get(params.get('sid'))
+            if account is None:
+                return -15
+            sn = params.get('sn')
+            if sn == account.sn:
+                token = self._handle(16)
+                self._waits[token] = (account, sn)
+                return {'w': f'https://g.api.local.invalid/wsc/{token}',
+                        'sn': sn}
+            sns = [packet_sn for packet_sn, _ in account.packets]
+            if sn == account.created_sn:
+                start = 0
+            elif sn in sns:
+                start = len(sns) - sns[::-1].index(sn)
+            else:
+                return -9
+            return {
+                'a': [packet for _, packet in account.packets[start:]],
+                'sn': account.sn
+            }
+
+    def _wait(self, token, timeout):
+        """
+        Hold a wait request until the account changes or `timeout`
+        seconds pass.
+        """
+        with self._lock:
+            account, sn = self._waits.pop(token, (None, None))
+            if account is None:
+                return 404, b''
+            self._changed.wait_for(lambda: account.sn != sn,
+                                   timeout=timeout)
+        return 200, b'0'
+
+    def _download(self, token, headers):
+        with self._lock:
+            handle = self._downloads.get(token)
+            data = self._data.get(handle)
+        if data is None:
+            return 404, b''
+        match = re.fullmatch(r'bytes=(\d+)-(\d*)', headers.get('Range', ''))
+        if match is None:
+            return 200, data
+        start = int(match.group(1))
+        end = int(match.group(2)) + 1 if match.group(2) else len(data)
+        if start >= len(data) and data:
+            return 416, b''
+        return 206, data[start:end]
+
+    def _upload(self, token, offset, data):
+        if isinstance(data, str):
+            data = data.encode()
+        with self._lock:
+            upload = self._uploads.get(token)
+            if upload is None:
+                return 200, b'-8'
+            size, chunks, received = upload
+            if offset + len(data) > size or offset % 16:
+                return 200, b'-7'
+            if offset not in chunks:
+                received += len(data)
+            chunks[offset] = bytes(data)
+            upload[2] = received
+            if received < size:
+                return 200, b''
+            del self._uploads[token]
+            data = b''.join(chunks[start] for start in sorted(chunks))
+            if len(data) != size:
+                return 200, b'-7'
+            handle = self._handle(36)
+            self._completed[handle] = data
+            return 200, handle.encode()
+
+
+class LocalTransport(HTTPTransport):
+    """
+    Transport sending a `Mega`'s requests to a `LocalServer` instead of
+    the network.
+    """
+    def __init__(self, server: LocalServer, latency: float = 0.0) -> None:
+        """
+        Args:
+            server: Server answering the requests
+            latency: Seconds every request is delayed by, to mimic a
+                network round trip
+        """
+        self.server = server
+        self.latency = latency
+
+    def _request(self, method, url, params=None, data=None, headers=None,
+                 timeout=None):
+        if self.latency:
+            time.sleep(self.latency)
+        status, body = self.server.request(method, url, params, data,
+                                           headers, timeout)
+        response = requests.Response()
+        response.status_code = status
+        response.url = url
+        response.reason = 'OK' if status < 400 else 'Error'
+        response.raw = io.BytesIO(body)
+        return response
+
+    def api_post(self, url, params, data, timeout, stream=False):
+        return self._request('POST', url, params=params, data=data)
+
+    def api_get(self, url, timeout):
+        return self._request('GET', url, timeout=timeout)
+
+    def storage_get(self, url, headers=None, stream=False, timeout=None):
+        return self._request('GET', url, headers=headers)
+
+    def storage_post(self, url, data, timeout):
+        return self._request('POST', url, data=data)
+
+    def close(self):
+        pass
+
+
+class AsyncLocalTransport:
+    """
+    Async transport sending a `mega.aio.AsyncMega`'s requests to a
+    `LocalServer`.
+    """
+    def __init__(self, server: LocalServer, latency: float = 0.0) -> None:
+        self.server = server
+        self.latency = latency
+
+    async def _request(self, method, url, params=None, data=None,
+                       headers=None):
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        status, body = self.server.request(method, url, params, data,
+                                           headers)
+        if status >= 400:
+            raise NetworkError(f'Network error: {status} for {url}')
+        return body
+
+    async def api_post(self, url, params, data, timeout):
+        return await self._request('POST', url, params=params, data=data)
+
+    async def storage_get(self, url, headers=None, timeout=None):
+        return await self._request('GET', url, headers=headers)
+
+    async def storage_post(self, url, data, timeout):
+        return await self._request('POST', url, data=data)
+
+    async def close(self):
+        pass
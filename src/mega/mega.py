@@ -14,21 +14,40 @@ import binascii
 import tempfile
 import shutil
 import typing
+import threading
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
 from typing import Optional, Dict, Any, List, Tuple, Union
 
-import requests
 from tenacity import retry, wait_exponential, retry_if_exception_type
 from requests.exceptions import RequestException
 
 from .errors import ValidationError, RequestError
+from .transport import HTTPTransport
+from .batch import Batch
+from .tree import NodeTree
+from .sync import ActionPacketSync
+from .cache import NodeStore
+from .nodes import Node
+from .session import seal_session, open_session
+from .stream import iter_response
+from .progress import (DECRYPT, DISK, ENCRYPT, MAC, NETWORK,
+                       TransferStats)
+from .metrics import (NULL_TIMER, command_name, result_errors,
+                      start_request)
 from .crypto import (a32_to_base64, encrypt_key, base64_url_encode,
                       encrypt_attr, base64_to_a32, base64_url_decode,
                       decrypt_attr, a32_to_str, get_chunks, str_to_a32,
                       decrypt_key, mpi_to_int, stringhash, prepare_key, make_id,
-                      makebyte, modular_inverse)
+                      modular_inverse, MacAccumulator, encrypt_key_bytes,
+                      decrypt_key_bytes)
 
 logger = logging.getLogger(__name__)
 
+# bytes read at a time from a streamed API response
+STREAM_CHUNK_SIZE = 64 * 1024
+# nodes of a streamed tree listing decrypted and added together
+TREE_BATCH_SIZE = 10000
+
 class MegaException(Exception):
     """Base exception for all MEGA-related errors."""
     pass
@@ -55,10 +74,51 @@ class Mega:
         self.sequence_num = random.randint(0, 0xFFFFFFFF)
         self.request_id = make_id(10)
         self._trash_folder_node_id = None
+        self._nodes = None
+        self._sync = None
+        # guards the cached node tree: loading it, reading it and
+        # applying changes to it
+        self._tree_lock = threading.RLock()
+        self._sequence_lock = threading.Lock()
 
         if options is None:
             options = {}
         self.options = options
+        # seconds the cached node tree is used before it is fetched again,
+        # None to keep it until refresh() is called
+        self.node_cache_ttl = options.get('node_cache_ttl', 60)
+        # SQLite file keeping the node tree between runs, off by default
+        node_cache_path = options.get('node_cache_path')
+        self._store = NodeStore(node_cache_path) if node_cache_path else None
+        # class of the node cache; mega.columnar.ColumnarNodeTree keeps
+        # very large trees in far less memory
+        self.node_tree = options.get('node_tree', NodeTree)
+        # number of parallel connections used by download/download_url
+        self.download_workers = options.get('download_workers', 1)
+        # number of chunk POSTs upload keeps in flight
+        self.upload_workers = options.get('upload_workers', 1)
+        # sink recording every API request, see mega.metrics; None for
+        # no metrics
+        self.metrics = options.get('metrics')
+        # every request goes through this transport; by default a pooled
+        # keep-alive session for the API and another for storage hosts
+        self.transport = options.get('transport')
+        if self.transport is None:
+            self.transport = HTTPTransport(
+                api_pool_size=options.get('api_pool_size', 4),
+                storage_pool_size=options.get(
+                    'storage_pool_size',
+                    max(16, self.download_workers, self.upload_workers)),
+                session=options.get('session'))
+
+    def close(self) -> None:
+        """
+        Close the pooled connections held by this instance, and the
+        on-disk node cache if there is one.
+        """
+        self.transport.close()
+        if self._store is not None:
+            self._store.close()
 
     def login(self, email: Optional[str] = None, password: Optional[str] = None) -> 'Mega':
         """
@@ -90,11 +150,111 @@ class Mega:
             logger.error(f'Network error during login: {e}')
             raise NetworkError(f'Network error: {e}') from e
 
+    def export_session(self, key: bytes) -> str:
+        """
+        Save the logged in session, to restore it later with
+        `from_session` instead of logging in again.
+
+        Args:
+            key: 16, 24 or 32 byte secret the session is encrypted with,
+                e.g. from secrets.token_bytes(32)
+
+        Returns:
+            Encrypted session blob
+        """
+        if self.sid is None:
+            raise ValidationError('Not logged in')
+        state = {
+            'sid': self.sid,
+            'master_key': list(self.master_key),
+            'root_id': getattr(self, 'root_id', None),
+            'inbox_id': getattr(self, 'inbox_id', None),
+            'trashbin_id': getattr(self, 'trashbin_id', None),
+            'shared_keys': {
+                user: {handle: list(share_key)
+                       for handle, share_key in keys.items()}
+                for user, keys in getattr(self, 'shared_keys', {}).items()
+            },
+        }
+        return seal_session(state, key)
+
+    @classmethod
+    def from_session(cls,
+                     blob: str,
+                     key: bytes,
+                     email: Optional[str] = None,
+                     password: Optional[str] = None,
+                     options: Optional[Dict[str, Any]] = None) -> 'Mega':
+        """
+        Restore a session saved with `export_session`, skipping the key
+        derivation and RSA work of a login.
+
+        The session is checked with one API request. If the server no
+        longer accepts it (ESID), a full login is done with `email` and
+        `password` when given.
+
+        Args:
+            blob: Session blob from `export_session`
+            key: Secret the blob was encrypted with
+            email: Account email, for logging in again
+            password: Account password, for logging in again
+            options: Options for the new instance, see `Mega`
+
+        Returns:
+            A logged in Mega instance
+
+        Raises:
+            ValidationError: If the blob cannot be decrypted with `key`
+            AuthenticationError: If the session expired and no credentials
+                were given, or logging in again fails
+            NetworkError: If the session check fails to reach the API
+        """
+        state = open_session(blob, key)
+        mega = cls(options)
+        mega.sid = state['sid']
+        mega.master_key = tuple(state['master_key'])
+        for name in ('root_id', 'inbox_id', 'trashbin_id'):
+            if state[name] is not None:
+                setattr(mega, name, state[name])
+        mega.shared_keys = {
+            user: {handle: tuple(share_key)
+                   for handle, share_key in keys.items()}
+            for user, keys in state['shared_keys'].items()
+        }
+        mega._trash_folder_node_id = state['trashbin_id']
+        try:
+            mega.get_user()
+        except RequestError as e:
+            if e.code != -15:
+                raise
+            if not email:
+                raise AuthenticationError('Session expired') from e
+            logger.info('Saved session expired, logging in again')
+            mega.sid = None
+            return mega.login(email, password)
+        logger.info('Session restored')
+        return mega
+
     def _login_user(self, email, password):
         logger.info('Logging in user...')
         email = email.lower()
         get_user_salt_resp = self._api_request({'a': 'us0', 'user': email})
-        user_salt = None
+        password_aes, user_hash = self._password_key(email, password,
+                                                     get_user_salt_resp)
+        resp = self._api_request({'a': 'us', 'user': email, 'uh': user_hash})
+        if isinstance(resp, int):
+            raise RequestError(resp)
+        self._login_process(resp, password_aes)
+
+    @staticmethod
+    def _password_key(email, password, get_user_salt_resp):
+        """
+        Derive the password key and the user hash sent to log in, from
+        the account's answer to 'us0'.
+
+        Returns:
+            (password key, user hash)
+        """
         try:
             user_salt = base64_to_a32(get_user_salt_resp['s'])
         except KeyError:
@@ -110,48 +270,54 @@ class Mega:
                                              dklen=32)
             password_aes = str_to_a32(pbkdf2_key[:16])
             user_hash = base64_url_encode(pbkdf2_key[-16:])
-        resp = self._api_request({'a': 'us', 'user': email, 'uh': user_hash})
-        if isinstance(resp, int):
-            raise RequestError(resp)
-        self._login_process(resp, password_aes)
+        return password_aes, user_hash
 
     def login_anonymous(self):
         logger.info('Logging in anonymous temporary user...')
+        password_key, command = self._anonymous_user()
+        user = self._api_request(command)
+
+        resp = self._api_request({'a': 'us', 'user': user})
+        if isinstance(resp, int):
+            raise RequestError(resp)
+        self._login_process(resp, password_key)
+
+    @staticmethod
+    def _anonymous_user():
+        """
+        Returns:
+            (password key, 'up' command creating a temporary account)
+        """
         master_key = [random.randint(0, 0xFFFFFFFF)] * 4
         password_key = [random.randint(0, 0xFFFFFFFF)] * 4
         session_self_challenge = [random.randint(0, 0xFFFFFFFF)] * 4
-
-        user = self._api_request({
+        return password_key, {
             'a':
             'up',
             'k':
-            a32_to_base64(encrypt_key(master_key, password_key)),
+            a32_to_base64(encrypt_key(master_key, password_key,
+                                      cache=False)),
             'ts':
             base64_url_encode(
                 a32_to_str(session_self_challenge) +
                 a32_to_str(encrypt_key(session_self_challenge, master_key)))
-        })
-
-        resp = self._api_request({'a': 'us', 'user': user})
-        if isinstance(resp, int):
-            raise RequestError(resp)
-        self._login_process(resp, password_key)
+        }
 
     def _login_process(self, resp, password):
+        self._nodes = None
         encrypted_master_key = base64_to_a32(resp['k'])
-        self.master_key = decrypt_key(encrypted_master_key, password)
+        # the password key is kept out of the shared cipher cache
+        self.master_key = decrypt_key(encrypted_master_key, password,
+                                      cache=False)
         if 'tsid' in resp:
             tsid = base64_url_decode(resp['tsid'])
-            key_encrypted = a32_to_str(
-                encrypt_key(str_to_a32(tsid[:16]), self.master_key))
+            key_encrypted = encrypt_key_bytes(tsid[:16],
+                                              a32_to_str(self.master_key))
             if key_encrypted == tsid[-16:]:
                 self.sid = resp['tsid']
         elif 'csid' in resp:
-            encrypted_rsa_private_key = base64_to_a32(resp['privk'])
-            rsa_private_key = decrypt_key(encrypted_rsa_private_key,
-                                          self.master_key)
-
-            private_key = a32_to_str(rsa_private_key)
+            private_key = decrypt_key_bytes(base64_url_decode(resp['privk']),
+                                            a32_to_str(self.master_key))
             # The private_key contains 4 MPI integers concatenated together.
             rsa_private_key = [0, 0, 0, 0]
             for i in range(4):
@@ -189,11 +355,6 @@ class Mega:
             sid = binascii.unhexlify('0' + sid if len(sid) % 2 else sid)
             self.sid = base64_url_encode(sid[:43])
 
-    @retry(
-        retry=retry_if_exception_type((RuntimeError, RequestException)),
-        wait=wait_exponential(multiplier=2, min=2, max=60),
-        reraise=True
-    )
     def _api_request(self, data: Union[Dict[str, Any], List[Dict[str, Any]]]) -> Any:
         """
         Make an API request to MEGA server.
@@ -208,51 +369,179 @@ class Mega:
             NetworkError: If network request fails
             RequestError: If API request fails
         """
+        # ensure input data is a list
+        if not isinstance(data, list):
+            data = [data]
+
+        return self._command_result(self._api_post(data))
+
+    @staticmethod
+    def _command_result(json_resp: Union[int, List[Any]]) -> Any:
+        """
+        The result of the first command in a decoded API response.
+
+        Raises:
+            RequestError: If the request or the command failed
+        """
+        if isinstance(json_resp, list):
+            int_resp = json_resp[0] if isinstance(json_resp[0], int) else None
+        elif isinstance(json_resp, int):
+            int_resp = json_resp
+        else:
+            int_resp = None
+
+        if int_resp is not None:
+            if int_resp == 0:
+                return int_resp
+            raise RequestError(int_resp)
+
+        return json_resp[0]
+
+    @retry(
+        retry=retry_if_exception_type((RuntimeError, RequestException)),
+        wait=wait_exponential(multiplier=2, min=2, max=60),
+        reraise=True
+    )
+    def _api_post(self,
+                  commands: List[Dict[str, Any]]) -> Union[int, List[Any]]:
+        """
+        Send a list of commands to the MEGA server in one request.
+
+        Args:
+            commands: Commands to send
+
+        Returns:
+            The decoded response: a list holding one result per command,
+            or an int error code for the request as a whole
+
+        Raises:
+            NetworkError: If network request fails
+            RequestError: If the response cannot be decoded
+        """
+        data = json.dumps(commands)
+        timer = start_request(self.metrics, command_name(commands),
+                              len(data))
         try:
-            params = {'id': self.sequence_num}
-            self.sequence_num += 1
+            params = {'id': self._next_sequence_num()}
 
             if self.sid:
                 params.update({'sid': self.sid})
 
-            # ensure input data is a list
-            if not isinstance(data, list):
-                data = [data]
-
             url = f'{self.schema}://g.api.{self.domain}/cs'
-            response = requests.post(
+            response = self.transport.api_post(
                 url,
                 params=params,
-                data=json.dumps(data),
+                data=data,
                 timeout=self.timeout,
             )
             response.raise_for_status()
             json_resp = json.loads(response.text)
-            
-            if isinstance(json_resp, list):
-                int_resp = json_resp[0] if isinstance(json_resp[0], int) else None
-            elif isinstance(json_resp, int):
-                int_resp = json_resp
-            else:
-                int_resp = None
-                
-            if int_resp is not None:
-                if int_resp == 0:
-                    return int_resp
-                if int_resp == -3:
-                    msg = 'Request failed, retrying'
-                    logger.info(msg)
-                    raise RuntimeError(msg)
-                raise RequestError(int_resp)
-            
-            return json_resp[0]
-            
+            errors = result_errors(json_resp)
+
+            # as before batching, EAGAIN for the first command of a list
+            # is taken to mean the whole request was not processed
+            if json_resp == -3 or (isinstance(json_resp, list)
+                                   and json_resp[:1] == [-3]):
+                timer.done(len(response.content), errors, retried=True)
+                msg = 'Request failed, retrying'
+                logger.info(msg)
+                raise RuntimeError(msg)
+
+            timer.done(len(response.content), errors)
+            return json_resp
+
+        except RequestException as e:
+            timer.done(errors=('network', ))
+            logger.error(f'Network error: {e}')
+            raise NetworkError(f'Network error: {e}') from e
+        except json.JSONDecodeError as e:
+            timer.done(len(response.content), ('decode', ))
+            logger.error(f'Failed to decode JSON response: {e}')
+            raise RequestError(f'Invalid response format: {e}') from e
+
+    def _next_sequence_num(self) -> int:
+        """
+        Take the id of the next request, unique even across threads
+        """
+        with self._sequence_lock:
+            sequence_num = self.sequence_num
+            self.sequence_num += 1
+        return sequence_num
+
+    @retry(
+        retry=retry_if_exception_type((RuntimeError, RequestException)),
+        wait=wait_exponential(multiplier=2, min=2, max=60),
+        reraise=True
+    )
+    def _api_stream(self, command: Dict[str, Any]):
+        """
+        Send one command and parse its result as the response body
+        arrives, see `mega.stream.iter_response`.
+
+        Returns:
+            Iterator over the result's (field, value) pairs
+
+        Raises:
+            NetworkError: If network request fails
+            RequestError: If the server answers with an error code
+        """
+        data = json.dumps([command])
+        timer = start_request(self.metrics, command_name([command]),
+                              len(data))
+        try:
+            params = {'id': self._next_sequence_num()}
+            if self.sid:
+                params.update({'sid': self.sid})
+            url = f'{self.schema}://g.api.{self.domain}/cs'
+            response = self.transport.api_post(url,
+                                               params=params,
+                                               data=data,
+                                               timeout=self.timeout,
+                                               stream=True)
+            response.raise_for_status()
+            events = iter_response(
+                timer.count(
+                    response.iter_content(chunk_size=STREAM_CHUNK_SIZE)))
+            try:
+                first = next(events)
+            except StopIteration:
+                timer.done()
+                return iter(())
+        except RequestError as e:
+            timer.done(errors=(e.code, ), retried=e.code == -3)
+            if e.code == -3:
+                msg = 'Request failed, retrying'
+                logger.info(msg)
+                raise RuntimeError(msg) from e
+            raise
         except RequestException as e:
+            timer.done(errors=('network', ))
             logger.error(f'Network error: {e}')
             raise NetworkError(f'Network error: {e}') from e
         except json.JSONDecodeError as e:
+            timer.done(errors=('decode', ))
             logger.error(f'Failed to decode JSON response: {e}')
             raise RequestError(f'Invalid response format: {e}') from e
+        return self._stream_events(first, events, timer)
+
+    @staticmethod
+    def _stream_events(first, events, timer=NULL_TIMER):
+        """
+        Yield the parsed events of a streamed response, and record the
+        request to `timer` once they are all read.
+        """
+        yield first
+        try:
+            yield from events
+        except RequestException as e:
+            timer.done(errors=('network', ))
+            logger.error(f'Network error: {e}')
+            raise NetworkError(f'Network error: {e}') from e
+        except json.JSONDecodeError as e:
+            timer.done(errors=('decode', ))
+            logger.error(f'Failed to decode JSON response: {e}')
+            raise RequestError(f'Invalid response format: {e}') from e
+        timer.done()
 
     def _parse_url(self, url):
         """Parse file id and key from url."""
@@ -304,23 +593,8 @@ class Mega:
                 key = decrypt_key(encrypted_key, shared_key)
                 file['shared_folder_key'] = shared_key
             if key is not None:
-                # file
-                if file['t'] == 0:
-                    k = (key[0] ^ key[4], key[1] ^ key[5], key[2] ^ key[6],
-                         key[3] ^ key[7])
-                    file['iv'] = key[4:6] + (0, 0)
-                    file['meta_mac'] = key[6:8]
-                # folder
-                else:
-                    k = key
-                file['key'] = key
-                file['k'] = k
-                attributes = base64_url_decode(file['a'])
-                attributes = decrypt_attr(attributes, k)
-                file['a'] = attributes
-            # other => wrong object
-            elif file['k'] == '':
-                file['a'] = False
+                key = a32_to_str(key)
+            return self._make_node(file, key)
         elif file['t'] == 2:
             self.root_id = file['h']
             file['a'] = {'n': 'Cloud Drive'}
@@ -330,7 +604,125 @@ class Mega:
         elif file['t'] == 4:
             self.trashbin_id = file['h']
             file['a'] = {'n': 'Rubbish Bin'}
-        return file
+        return Node(file)
+
+    @staticmethod
+    def _make_node(file, key):
+        """
+        Build the `mega.nodes.Node` of a file or folder from its decrypted
+        key, leaving its attributes to be decrypted when first read.
+        """
+        # other => wrong object
+        if key is None and file['k'] == '':
+            file['a'] = False
+        return Node(file, key)
+
+    def _process_files(self, files, shared_keys):
+        """
+        `_process_file` over a whole 'f' listing, with the node keys
+        decrypted in batches instead of one by one: first every key under
+        the master key (own nodes and the share keys of inbound shares),
+        then the keys under each share key.
+        """
+        processed = []
+        nodes = []
+        for file in files:
+            if file['t'] == 0 or file['t'] == 1:
+                keys = dict(
+                    keypart.split(':', 1) for keypart in file['k'].split('/')
+                    if ':' in keypart)
+                nodes.append((len(processed), file, keys))
+                processed.append(None)
+            else:
+                processed.append(self._process_file(file, shared_keys))
+
+        node_keys = self._decrypt_node_keys([
+            (self.master_key, keys[file['u']]) if file['u'] in keys else
+            (self.master_key, file['sk']) if self._is_share_root(file) else
+            None for _, file, keys in nodes
+        ])
+        for index, (_, file, keys) in enumerate(nodes):
+            if file['u'] not in keys and self._is_share_root(file):
+                shared_keys.setdefault(file['su'], {})[file['h']] = (
+                    str_to_a32(node_keys[index]))
+                node_keys[index] = None
+
+        shared_node_keys = self._decrypt_node_keys([
+            self._shared_node_key(file, keys, shared_keys, node_keys[index])
+            for index, (_, file, keys) in enumerate(nodes)
+        ])
+        for index, (position, file, keys) in enumerate(nodes):
+            key = shared_node_keys[index] or node_keys[index]
+            if file['h'] and file['h'] in shared_keys.get('EXP', ()):
+                file['shared_folder_key'] = shared_keys['EXP'][file['h']]
+            processed[position] = self._make_node(file, key)
+        return processed
+
+    def _add_nodes(self, tree, files, shared_keys):
+        for processed_file in self._process_files(files, shared_keys):
+            # drop nodes without attributes; those still encrypted are
+            # kept and checked when they are read
+            if self._listed(processed_file):
+                tree.add(processed_file)
+
+    @staticmethod
+    def _needs_share_keys(file):
+        """
+        True for a file or folder whose key is not under the master key
+        and which is not the root of an inbound share
+        """
+        if file['t'] != 0 and file['t'] != 1:
+            return False
+        owners = {keypart.split(':', 1)[0] for keypart in file['k'].split('/')}
+        return file['u'] not in owners and not Mega._is_share_root(file)
+
+    @staticmethod
+    def _is_share_root(file):
+        return 'su' in file and 'sk' in file and ':' in file['k']
+
+    @staticmethod
+    def _shared_node_key(file, keys, shared_keys, own_key):
+        """
+        Returns:
+            (share key, encrypted node key) for a node whose key is under
+            a share key, None otherwise
+        """
+        if file['h'] and file['h'] in shared_keys.get('EXP', ()):
+            return shared_keys['EXP'][file['h']], file['k'].split(':')[-1]
+        if own_key is not None or file['u'] in keys:
+            return None
+        if Mega._is_share_root(file):
+            return shared_keys[file['su']][file['h']], keys[file['h']]
+        for hkey, shared_key in shared_keys.get(file['u'], {}).items():
+            if hkey in keys:
+                return shared_key, keys[hkey]
+        return None
+
+    @staticmethod
+    def _decrypt_node_keys(requests):
+        """
+        Decrypt (key, base64 encrypted key) pairs with one ECB call per
+        distinct key.
+
+        Returns:
+            The decrypted keys as bytes, None where the request was None
+        """
+        groups = {}
+        for index, request in enumerate(requests):
+            if request is not None:
+                key, encrypted = request
+                groups.setdefault(tuple(key), []).append(
+                    (index, base64_url_decode(encrypted)))
+        results = [None] * len(requests)
+        for key, items in groups.items():
+            decrypted = decrypt_key_bytes(
+                b''.join(encrypted for _, encrypted in items),
+                a32_to_str(key))
+            offset = 0
+            for index, encrypted in items:
+                results[index] = decrypted[offset:offset + len(encrypted)]
+                offset += len(encrypted)
+        return results
 
     def _init_shared_keys(self, files, shared_keys):
         """
@@ -357,72 +749,268 @@ class Mega:
         Find descriptor of folder inside a path. i.e.: folder1/folder2/folder3
         Params:
             path, string like folder1/folder2/folder3
+            files, optional dict of nodes as returned by get_files() to
+            search instead of the cached tree
         Return:
             Descriptor (str) of folder3 if exists, None otherwise
         """
-        paths = path.split('/')
-
-        files = files or self.get_files()
-        parent_desc = self.root_id
-        found = False
-        for foldername in paths:
-            if foldername != '':
-                for file in files.items():
-                    if (file[1]['a'] and file[1]['t']
-                            and file[1]['a']['n'] == foldername):
-                        if parent_desc == file[1]['p']:
-                            parent_desc = file[0]
-                            found = True
-                if found:
-                    found = False
-                else:
-                    return None
-        return parent_desc
+        if files:
+            return NodeTree(files.values()).resolve(path, self.root_id)
+        with self._tree_lock:
+            return self._node_tree().resolve(path, self.root_id)
 
     def find(self, filename=None, handle=None, exclude_deleted=False):
         """
         Return file object from given filename
         """
-        files = self.get_files()
-        if handle:
-            return files[handle]
-        path = Path(filename)
-        filename = path.name
-        parent_dir_name = path.parent.name
-        for file in list(files.items()):
-            parent_node_id = None
-            try:
-                if parent_dir_name:
-                    parent_node_id = self.find_path_descriptor(parent_dir_name,
-                                                               files=files)
-                    if (filename and parent_node_id and file[1]['a']
-                            and file[1]['a']['n'] == filename
-                            and parent_node_id == file[1]['p']):
-                        if (exclude_deleted and self._trash_folder_node_id
-                                == file[1]['p']):
-                            continue
-                        return file
-                elif (filename and file[1]['a']
-                      and file[1]['a']['n'] == filename):
-                    if (exclude_deleted
-                            and self._trash_folder_node_id == file[1]['p']):
-                        continue
-                    return file
-            except TypeError:
-                continue
+        with self._tree_lock:
+            tree = self._node_tree()
+            if handle:
+                return tree.nodes[handle]
+            path = Path(filename)
+            filename = path.name
+            if not filename:
+                return None
+            if path.parent.name:
+                parent_node_id = tree.resolve(path.parent.as_posix(),
+                                              self.root_id)
+                if not parent_node_id:
+                    return None
+                candidates = tree.named(filename, parent_node_id)
+            else:
+                candidates = tree.named(filename)
+            for node_id in candidates:
+                node = tree.get(node_id)
+                if (exclude_deleted
+                        and self._trash_folder_node_id == node['p']):
+                    continue
+                return node_id, node
+        return None
 
     def get_files(self):
+        """
+        Every cached node by handle, leaving out those whose attributes
+        are known not to decrypt. Attributes still encrypted are left
+        so, and read as None if they turn out not to decrypt.
+        """
+        with self._tree_lock:
+            return {
+                handle: node
+                for handle, node in self._node_tree().nodes.items()
+                if self._listed(node)
+            }
+
+    @staticmethod
+    def _listed(node):
+        """
+        False for a node whose attributes have been found not to decrypt,
+        without decrypting those that have not been read yet
+        """
+        if isinstance(node, Node) and not node.decrypted:
+            return True
+        return bool(node['a'])
+
+    def materialize(self):
+        """
+        Decrypt the attributes of every cached node now, rather than each
+        the first time it is read
+        """
+        with self._tree_lock:
+            self._node_tree().materialize()
+
+    def refresh(self):
+        """
+        Fetch the whole node tree again, replacing the cached one
+        """
+        with self._tree_lock:
+            self._load_nodes()
+
+    def _node_tree(self):
+        """
+        The cached node tree, fetched when missing or older than the
+        `node_cache_ttl` option. With the `node_cache_path` option, the
+        first call loads the tree from disk instead and only fetches the
+        changes made since it was stored, and an expired tree is brought
+        up to date the same way.
+
+        Only one thread loads the tree; others wait for it. Callers that
+        go on to read or change the tree should hold `_tree_lock` while
+        they do.
+        """
+        with self._tree_lock:
+            tree = self._nodes
+            if tree is None and self._store is not None:
+                tree = self._load_stored_nodes()
+            elif tree is None:
+                tree = self._load_nodes()
+            elif (self.node_cache_ttl is not None
+                  and tree.age() >= self.node_cache_ttl):
+                if self._store is not None and tree.sn is not None:
+                    tree = self._catch_up_nodes()
+                else:
+                    tree = self._load_nodes()
+            return tree
+
+    def _load_stored_nodes(self):
+        stored = self._store.load(self.master_key, self.node_tree)
+        if stored is None or stored[0].sn is None:
+            return self._load_nodes()
+        logger.info('Loaded node tree from %s', self._store.path)
+        tree, self.shared_keys = stored
+        for node_type, name in ((2, 'root_id'), (3, 'inbox_id'),
+                                (4, 'trashbin_id')):
+            handles = tree.by_type(node_type)
+            if handles:
+                setattr(self, name, handles[0])
+        self._nodes = tree
+        return self._catch_up_nodes()
+
+    def _catch_up_nodes(self):
+        """
+        Apply the changes made since the cached tree's sequence number,
+        fetching the whole tree again if the server no longer has them.
+        """
+        try:
+            self.sync().catch_up()
+        except RequestError as e:
+            logger.info('Stored node tree is out of date (%s), '
+                        'fetching it again', e)
+            return self._load_nodes()
+        return self._nodes
+
+    def _load_nodes(self):
+        """
+        Fetch the whole node tree, processing nodes in batches as the
+        response is read rather than once it has all arrived.
+
+        Nodes whose key is under the account's master key are added as
+        they come. Those of other users need the share keys listed in
+        'ok' and 's', which come after 'f', so they are held back until
+        the end.
+        """
         logger.info('Getting all files...')
-        files = self._api_request({'a': 'f', 'c': 1, 'r': 1})
-        files_dict = {}
+        return self._build_tree(
+            self._api_stream({'a': 'f', 'c': 1, 'r': 1}))
+
+    def _build_tree(self, listing_events):
+        """
+        Fill a new node tree from the (field, value) pairs of an 'f'
+        listing, see `_load_nodes`, and make it the cached tree.
+        """
+        tree = self.node_tree()
         shared_keys = {}
-        self._init_shared_keys(files, shared_keys)
-        for file in files['f']:
-            processed_file = self._process_file(file, shared_keys)
-            # ensure each file has a name before returning
-            if processed_file['a']:
-                files_dict[file['h']] = processed_file
-        return files_dict
+        listing = {'ok': [], 's': []}
+        batch = []
+        deferred = []
+        for field, value in listing_events:
+            if field == 'f':
+                if self._needs_share_keys(value):
+                    deferred.append(value)
+                    continue
+                batch.append(value)
+                if len(batch) >= TREE_BATCH_SIZE:
+                    self._add_nodes(tree, batch, shared_keys)
+                    batch = []
+            elif field in listing:
+                listing[field].append(value)
+            elif field == 'sn':
+                tree.sn = value
+        self._add_nodes(tree, batch, shared_keys)
+        self._init_shared_keys(listing, shared_keys)
+        self._add_nodes(tree, deferred, shared_keys)
+        for handle, shared_key in shared_keys.get('EXP', {}).items():
+            node = tree.get(handle)
+            if node is not None:
+                node['shared_folder_key'] = shared_key
+                tree.add(node)
+        with self._tree_lock:
+            self._nodes = tree
+            if self._store is not None:
+                self._store.save(self.master_key, tree, self.shared_keys)
+        return tree
+
+    def sync(self):
+        """
+        The `mega.sync.ActionPacketSync` that applies changes made by
+        other clients to the cached node tree
+        """
+        with self._tree_lock:
+            if self._sync is None:
+                self._sync = ActionPacketSync(self)
+            return self._sync
+
+    def changes(self, wait=True):
+        """
+        Iterate over `mega.sync.NodeEvent`s for changes made to the
+        account from anywhere, forever. Each change is applied to the
+        cached node tree before it is yielded.
+        """
+        return self.sync().events(wait=wait)
+
+    def _apply_command(self, command, result):
+        """
+        Update the cached node tree after a successful command, so that
+        the client's own changes do not need a full fetch to show up.
+        """
+        with self._tree_lock:
+            self._apply_command_to_tree(command, result)
+
+    def _apply_command_to_tree(self, command, result):
+        tree = self._nodes
+        if tree is None:
+            return
+        action = command['a']
+        changed = []
+        removed = []
+        if action == 'm':
+            tree.move(command['n'], command['t'])
+            changed.append(command['n'])
+        elif action == 'd':
+            removed = tree.remove(command['n'])
+        elif action == 'a':
+            node = tree.get(command['n'])
+            if node is not None:
+                attributes = decrypt_attr(base64_url_decode(command['attr']),
+                                          node['k'])
+                tree.set_attributes(command['n'], attributes)
+                changed.append(command['n'])
+        elif action == 'p' and isinstance(result, dict):
+            shared_keys = getattr(self, 'shared_keys', {})
+            for file in result.get('f', ()):
+                processed_file = self._process_file(file, shared_keys)
+                if processed_file['a']:
+                    tree.add(processed_file)
+                    changed.append(processed_file['h'])
+        elif action == 's2':
+            node = tree.get(command['n'])
+            if node is not None:
+                # the share key was made by this client, see
+                # _export_folder_command
+                shared_key = decrypt_key(base64_to_a32(command['ok']),
+                                         self.master_key)
+                getattr(self, 'shared_keys', {}).setdefault(
+                    'EXP', {})[command['n']] = shared_key
+                node['shared_folder_key'] = shared_key
+                tree.add(node)
+                changed.append(command['n'])
+        self._store_changes(changed, removed)
+
+    def _store_events(self, events):
+        """
+        Write changes applied from the server-client channel to the
+        on-disk node cache.
+        """
+        self._store_changes(
+            [event.handle for event in events if event.kind != 'delete'],
+            [event.handle for event in events if event.kind == 'delete'])
+
+    def _store_changes(self, changed, removed):
+        with self._tree_lock:
+            tree = self._nodes
+            if self._store is None or tree is None:
+                return
+            nodes = [tree.get(handle) for handle in changed if handle in tree]
+            self._store.update(self.master_key, tree.sn, nodes, removed)
 
     def get_upload_link(self, file):
         """
@@ -448,15 +1036,23 @@ class Mega:
         file = file[1]
         if 'h' in file and 'k' in file:
             public_handle = self._api_request({'a': 'l', 'n': file['h']})
-            if public_handle == -11:
-                raise RequestError("Can't get a public link from that file "
-                                   "(is this a shared file?)")
-            decrypted_key = a32_to_base64(file['key'])
-            return (f'{self.schema}://{self.domain}'
-                    f'/#!{public_handle}!{decrypted_key}')
+            return self._public_link(public_handle, file['key'])
         else:
             raise ValidationError('File id and key must be present')
 
+    def _public_link(self, public_handle, key, folder=False):
+        """
+        Returns:
+            The link of a file or folder, from the result of 'l' and the
+            node's key, or share key for a folder
+        """
+        if public_handle == -11:
+            raise RequestError("Can't get a public link from that file "
+                               "(is this a shared file?)")
+        marker = '#F!' if folder else '#!'
+        return (f'{self.schema}://{self.domain}'
+                f'/{marker}{public_handle}!{a32_to_base64(key)}')
+
     def _node_data(self, node):
         try:
             return node[1]
@@ -470,15 +1066,25 @@ class Mega:
             pass
         if 'h' in file and 'k' in file:
             public_handle = self._api_request({'a': 'l', 'n': file['h']})
-            if public_handle == -11:
-                raise RequestError("Can't get a public link from that file "
-                                   "(is this a shared file?)")
-            decrypted_key = a32_to_base64(file['shared_folder_key'])
-            return (f'{self.schema}://{self.domain}'
-                    f'/#F!{public_handle}!{decrypted_key}')
+            return self._public_link(public_handle,
+                                     file['shared_folder_key'],
+                                     folder=True)
         else:
             raise ValidationError('File id and key must be present')
 
+    def batch(self, max_commands=Batch.MAX_COMMANDS):
+        """
+        Queue commands and send them together, e.g.
+
+            with mega.batch() as batch:
+                results = [batch.move(node_id, target) for node_id in ids]
+            for result in results:
+                result.result()
+
+        See `mega.batch.Batch`.
+        """
+        return Batch(self, max_commands=max_commands)
+
     def get_user(self):
         user_data = self._api_request({'a': 'ug'})
         return user_data
@@ -492,10 +1098,11 @@ class Mega:
         3: special: inbox
         4: special trash bin
         """
-        nodes = self.get_files()
-        for node in list(nodes.items()):
-            if node[1]['t'] == type:
-                return node
+        with self._tree_lock:
+            tree = self._node_tree()
+            node_ids = tree.by_type(type)
+            if node_ids:
+                return node_ids[0], tree.get(node_ids[0])
 
     def get_files_in_node(self, target):
         """
@@ -507,15 +1114,14 @@ class Mega:
         else:
             node_id = [target]
 
-        files = self._api_request({'a': 'f', 'c': 1})
-        files_dict = {}
-        shared_keys = {}
-        self._init_shared_keys(files, shared_keys)
-        for file in files['f']:
-            processed_file = self._process_file(file, shared_keys)
-            if processed_file['a'] and processed_file['p'] == node_id[0]:
-                files_dict[file['h']] = processed_file
-        return files_dict
+        with self._tree_lock:
+            tree = self._node_tree()
+            children = (tree.get(handle)
+                        for handle in tree.children(node_id[0]))
+            return {
+                node['h']: node
+                for node in children if self._listed(node)
+            }
 
     def get_id_from_public_handle(self, public_handle):
         # get node data
@@ -597,11 +1203,13 @@ class Mega:
         """
         Destroy a file by its private id
         """
-        return self._api_request({
-            'a': 'd',
-            'n': file_id,
-            'i': self.request_id
-        })
+        command = self._destroy_command(file_id)
+        result = self._api_request(command)
+        self._apply_command(command, result)
+        return result
+
+    def _destroy_command(self, file_id):
+        return {'a': 'd', 'n': file_id, 'i': self.request_id}
 
     def destroy_url(self, url):
         """
@@ -616,37 +1224,42 @@ class Mega:
         # get list of files in rubbish out
         files = self.get_files_in_node(4)
 
-        # make a list of json
+        # destroy them all in as few requests as possible
         if files != {}:
-            post_list = []
-            for file in files:
-                post_list.append({"a": "d", "n": file, "i": self.request_id})
-            return self._api_request(post_list)
-
-    def download(self, file, dest_path=None, dest_filename=None):
+            with self.batch() as batch:
+                results = [batch.destroy(file) for file in files]
+            for result in results:
+                result.result()
+            return 0
+
+    def download(self, file, dest_path=None, dest_filename=None,
+                 workers=None, stats=None):
         """
-        Download a file by it's file object
+        Download a file by it's file object.
+        `workers` overrides the instance's `download_workers` option.
+        A `mega.progress.TransferStats` given as `stats` follows the
+        download's progress and stage timings.
         """
         return self._download_file(file_handle=None,
                                    file_key=None,
                                    file=file[1],
                                    dest_path=dest_path,
                                    dest_filename=dest_filename,
-                                   is_public=False)
+                                   is_public=False,
+                                   workers=workers,
+                                   stats=stats)
 
     def _export_file(self, node):
         node_data = self._node_data(node)
-        self._api_request([{
-            'a': 'l',
-            'n': node_data['h'],
-            'i': self.request_id
-        }])
+        self._api_request([self._link_command(node_data['h'])])
         return self.get_link(node)
 
+    def _link_command(self, node_id):
+        return {'a': 'l', 'n': node_id, 'i': self.request_id}
+
     def export(self, path=None, node_id=None):
-        nodes = self.get_files()
         if node_id:
-            node = nodes[node_id]
+            node = self.find(handle=node_id)
         else:
             node = self.find(path)
 
@@ -661,6 +1274,15 @@ class Mega:
             except (RequestError, KeyError):
                 pass
 
+        command = self._export_folder_command(node_data)
+        self._apply_command(command, self._api_request([command]))
+        return self.get_folder_link(self.find(handle=node_data['h']))
+
+    def _export_folder_command(self, node_data):
+        """
+        The 's2' command sharing a folder with a new share key, so that
+        it can be opened through a folder link.
+        """
         master_key_cipher = AES.new(a32_to_str(self.master_key), AES.MODE_ECB)
         ha = base64_url_encode(
             master_key_cipher.encrypt(node_data['h'].encode("utf8") +
@@ -675,7 +1297,7 @@ class Mega:
             share_key_cipher.encrypt(a32_to_str(node_key)))
 
         node_id = node_data['h']
-        request_body = [{
+        return {
             'a':
             's2',
             'n':
@@ -691,12 +1313,14 @@ class Mega:
             'ha':
             ha,
             'cr': [[node_id], [node_id], [0, 0, encrypted_node_key]]
-        }]
-        self._api_request(request_body)
-        nodes = self.get_files()
-        return self.get_folder_link(nodes[node_id])
+        }
 
-    def download_url(self, url: str, dest_path: Optional[str] = None, dest_filename: Optional[str] = None) -> str:
+    def download_url(self,
+                     url: str,
+                     dest_path: Optional[str] = None,
+                     dest_filename: Optional[str] = None,
+                     workers: Optional[int] = None,
+                     stats: Optional[TransferStats] = None) -> str:
         """
         Download a file by its public URL.
 
@@ -704,6 +1328,9 @@ class Mega:
             url: Public MEGA file URL
             dest_path: Destination directory path
             dest_filename: Destination filename
+            workers: Number of parallel connections, defaults to the
+                instance's `download_workers` option
+            stats: `TransferStats` following the download's progress
 
         Returns:
             Path to the downloaded file
@@ -727,6 +1354,8 @@ class Mega:
                 dest_path=dest_path,
                 dest_filename=dest_filename,
                 is_public=True,
+                workers=workers,
+                stats=stats,
             )
             
         except ValueError as e:
@@ -742,39 +1371,82 @@ class Mega:
                        dest_path=None,
                        dest_filename=None,
                        is_public=False,
-                       file=None):
+                       file=None,
+                       workers=None,
+                       stats=None):
+        command, k, iv, meta_mac = self._download_command(
+            file_handle, file_key, is_public, file)
+        file_data = self._api_request(command)
+        file_url, file_size, file_name = self._download_target(
+            file_data, k, dest_filename)
+
+        if workers is None:
+            workers = self.download_workers
+        if stats is None:
+            stats = TransferStats()
+        stats.start('download', file_size)
+
+        if dest_path is None:
+            dest_path = ''
+        else:
+            dest_path += '/'
+
+        with tempfile.NamedTemporaryFile(mode='w+b',
+                                         prefix='megapy_',
+                                         delete=False) as temp_output_file:
+            k_str = a32_to_str(k)
+            if workers > 1 and file_size > 0:
+                mac = self._download_chunks_parallel(file_url, file_size,
+                                                     temp_output_file, k_str,
+                                                     iv, workers, stats)
+            else:
+                mac = self._download_chunks(file_url, file_size,
+                                            temp_output_file, k_str, iv,
+                                            stats)
+            stats.finish()
+            # check mac integrity
+            if mac.meta_mac() != tuple(meta_mac):
+                raise ValueError('Mismatched mac')
+            output_path = Path(dest_path + file_name)
+            shutil.move(temp_output_file.name, output_path)
+            return output_path
+
+    @staticmethod
+    def _download_command(file_handle, file_key, is_public, file):
+        """
+        Returns:
+            ('g' command asking for the file's storage URL, attribute
+            key, CTR nonce, expected meta-MAC)
+        """
         if file is None:
             if is_public:
                 file_key = base64_to_a32(file_key)
-                file_data = self._api_request({
-                    'a': 'g',
-                    'g': 1,
-                    'p': file_handle
-                })
+                command = {'a': 'g', 'g': 1, 'p': file_handle}
             else:
-                file_data = self._api_request({
-                    'a': 'g',
-                    'g': 1,
-                    'n': file_handle
-                })
+                command = {'a': 'g', 'g': 1, 'n': file_handle}
 
             k = (file_key[0] ^ file_key[4], file_key[1] ^ file_key[5],
                  file_key[2] ^ file_key[6], file_key[3] ^ file_key[7])
             iv = file_key[4:6] + (0, 0)
             meta_mac = file_key[6:8]
         else:
-            file_data = self._api_request({'a': 'g', 'g': 1, 'n': file['h']})
+            command = {'a': 'g', 'g': 1, 'n': file['h']}
             k = file['k']
             iv = file['iv']
             meta_mac = file['meta_mac']
+        return command, k, iv, meta_mac
 
+    @staticmethod
+    def _download_target(file_data, k, dest_filename=None):
+        """
+        Returns:
+            (storage URL, size, file name) from the result of 'g'
+        """
         # Seems to happens sometime... When this occurs, files are
         # inaccessible also in the official also in the official web app.
         # Strangely, files can come back later.
         if 'g' not in file_data:
             raise RequestError('File not accessible anymore')
-        file_url = file_data['g']
-        file_size = file_data['s']
         attribs = base64_url_decode(file_data['at'])
         attribs = decrypt_attr(attribs, k)
 
@@ -782,66 +1454,107 @@ class Mega:
             file_name = dest_filename
         else:
             file_name = attribs['n']
+        return file_data['g'], file_data['s'], file_name
 
-        input_file = requests.get(file_url, stream=True).raw
-
-        if dest_path is None:
-            dest_path = ''
-        else:
-            dest_path += '/'
-
-        with tempfile.NamedTemporaryFile(mode='w+b',
-                                         prefix='megapy_',
-                                         delete=False) as temp_output_file:
-            k_str = a32_to_str(k)
-            counter = Counter.new(128,
-                                  initial_value=((iv[0] << 32) + iv[1]) << 64)
-            aes = AES.new(k_str, AES.MODE_CTR, counter=counter)
+    @staticmethod
+    def _chunk_cipher(k_str, iv, chunk_start):
+        """
+        AES-CTR cipher positioned at the start of a chunk
+        """
+        counter = Counter.new(128,
+                              initial_value=(((iv[0] << 32) + iv[1]) << 64) +
+                              chunk_start // 16)
+        return AES.new(k_str, AES.MODE_CTR, counter=counter)
 
-            mac_str = '\0' * 16
-            mac_encryptor = AES.new(k_str, AES.MODE_CBC,
-                                    mac_str.encode("utf8"))
-            iv_str = a32_to_str([iv[0], iv[1], iv[0], iv[1]])
+    def _download_chunks(self, file_url, file_size, output_file, k_str, iv,
+                         stats):
+        """
+        Stream the file over a single connection, decrypting and writing
+        it in order.
+        """
+        counter = Counter.new(128,
+                              initial_value=((iv[0] << 32) + iv[1]) << 64)
+        aes = AES.new(k_str, AES.MODE_CTR, counter=counter)
+        mac = MacAccumulator(k_str, iv)
 
+        with self.transport.storage_get(file_url, stream=True) as response:
+            input_file = response.raw
             for chunk_start, chunk_size in get_chunks(file_size):
-                chunk = input_file.read(chunk_size)
-                chunk = aes.decrypt(chunk)
-                temp_output_file.write(chunk)
-
-                encryptor = AES.new(k_str, AES.MODE_CBC, iv_str)
-                for i in range(0, len(chunk) - 16, 16):
-                    block = chunk[i:i + 16]
-                    encryptor.encrypt(block)
-
-                # fix for files under 16 bytes failing
-                if file_size > 16:
-                    i += 16
-                else:
-                    i = 0
-
-                block = chunk[i:i + 16]
-                if len(block) % 16:
-                    block += b'\0' * (16 - (len(block) % 16))
-                mac_str = mac_encryptor.encrypt(encryptor.encrypt(block))
-
-                file_info = os.stat(temp_output_file.name)
-                logger.info('%s of %s downloaded', file_info.st_size,
+                with stats.stage(NETWORK, chunk_size):
+                    chunk = input_file.read(chunk_size)
+                with stats.stage(DECRYPT, chunk_size):
+                    chunk = aes.decrypt(chunk)
+                with stats.stage(DISK, chunk_size):
+                    output_file.write(chunk)
+                with stats.stage(MAC, chunk_size):
+                    mac.update(chunk)
+                stats.advance(chunk_size)
+                logger.info('%s of %s downloaded', stats.bytes_done,
                             file_size)
-            file_mac = str_to_a32(mac_str)
-            # check mac integrity
-            if (file_mac[0] ^ file_mac[1],
-                    file_mac[2] ^ file_mac[3]) != meta_mac:
-                raise ValueError('Mismatched mac')
-            output_path = Path(dest_path + file_name)
-            shutil.move(temp_output_file.name, output_path)
-            return output_path
+        return mac
 
-    def upload(self, filename, dest=None, dest_filename=None):
+    def _download_chunks_parallel(self, file_url, file_size, output_file,
+                                  k_str, iv, workers, stats):
+        """
+        Fetch every chunk with its own HTTP Range request over up to
+        `workers` connections. Each chunk is decrypted at its own CTR
+        offset and written in place into the preallocated output file;
+        the chunk MACs are folded in file order once all have arrived.
+        """
+        output_file.truncate(file_size)
+        mac = MacAccumulator(k_str, iv)
+        write_lock = threading.Lock()
+
+        def fetch_chunk(chunk):
+            chunk_start, chunk_size = chunk
+            chunk_end = chunk_start + chunk_size - 1
+            with stats.stage(NETWORK, chunk_size):
+                response = self.transport.storage_get(
+                    file_url,
+                    headers={'Range': f'bytes={chunk_start}-{chunk_end}'},
+                    timeout=self.timeout)
+                response.raise_for_status()
+                data = response.content
+            if len(data) != chunk_size:
+                raise NetworkError(
+                    f'Expected {chunk_size} bytes at offset {chunk_start}, '
+                    f'got {len(data)}')
+            with stats.stage(DECRYPT, chunk_size):
+                data = self._chunk_cipher(k_str, iv,
+                                          chunk_start).decrypt(data)
+            with write_lock, stats.stage(DISK, chunk_size):
+                output_file.seek(chunk_start)
+                output_file.write(data)
+            with stats.stage(MAC, chunk_size):
+                chunk_mac = mac.chunk_mac(data)
+            stats.advance(chunk_size)
+            logger.info('%s of %s downloaded', stats.bytes_done, file_size)
+            return chunk_mac
+
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            chunk_macs = list(
+                executor.map(fetch_chunk, get_chunks(file_size)))
+        for chunk_mac in chunk_macs:
+            mac.add_chunk_mac(chunk_mac)
+        return mac
+
+    def upload(self, filename, dest=None, dest_filename=None, workers=None,
+               stats=None):
+        """
+        Upload a file. `workers` overrides the instance's `upload_workers`
+        option and sets how many chunk POSTs are kept in flight. A
+        `mega.progress.TransferStats` given as `stats` follows the
+        upload's progress and stage timings.
+        """
+        if workers is None:
+            workers = self.upload_workers
+        if stats is None:
+            stats = TransferStats()
         # determine storage node
         if dest is None:
             # if none set, upload to cloud drive node
             if not hasattr(self, 'root_id'):
-                self.get_files()
+                self._node_tree()
             dest = self.root_id
 
         # request upload url, call 'u' method
@@ -852,92 +1565,158 @@ class Mega:
             # generate random aes key (128) for file
             ul_key = [random.randint(0, 0xFFFFFFFF) for _ in range(6)]
             k_str = a32_to_str(ul_key[:4])
-            count = Counter.new(
-                128, initial_value=((ul_key[4] << 32) + ul_key[5]) << 64)
-            aes = AES.new(k_str, AES.MODE_CTR, counter=count)
-
-            upload_progress = 0
-            completion_file_handle = None
-
-            mac_str = '\0' * 16
-            mac_encryptor = AES.new(k_str, AES.MODE_CBC,
-                                    mac_str.encode("utf8"))
-            iv_str = a32_to_str([ul_key[4], ul_key[5], ul_key[4], ul_key[5]])
-            if file_size > 0:
-                for chunk_start, chunk_size in get_chunks(file_size):
-                    chunk = input_file.read(chunk_size)
-                    upload_progress += len(chunk)
-
-                    encryptor = AES.new(k_str, AES.MODE_CBC, iv_str)
-                    for i in range(0, len(chunk) - 16, 16):
-                        block = chunk[i:i + 16]
-                        encryptor.encrypt(block)
-
-                    # fix for files under 16 bytes failing
-                    if file_size > 16:
-                        i += 16
-                    else:
-                        i = 0
-
-                    block = chunk[i:i + 16]
-                    if len(block) % 16:
-                        block += makebyte('\0' * (16 - len(block) % 16))
-                    mac_str = mac_encryptor.encrypt(encryptor.encrypt(block))
-
-                    # encrypt file and upload
-                    chunk = aes.encrypt(chunk)
-                    output_file = requests.post(ul_url + "/" +
-                                                str(chunk_start),
-                                                data=chunk,
-                                                timeout=self.timeout)
-                    completion_file_handle = output_file.text
-                    logger.info('%s of %s uploaded', upload_progress,
-                                file_size)
+
+            mac = MacAccumulator(k_str, ul_key[4:6])
+            stats.start('upload', file_size)
+            if file_size > 0 and workers > 1:
+                completion_file_handle = self._upload_chunks_parallel(
+                    input_file, file_size, ul_url, k_str, ul_key[4:6], mac,
+                    workers, stats)
+            elif file_size > 0:
+                completion_file_handle = self._upload_chunks(
+                    input_file, file_size, ul_url, k_str, ul_key[4:6], mac,
+                    stats)
             else:
-                output_file = requests.post(ul_url + "/0",
-                                            data='',
-                                            timeout=self.timeout)
+                with stats.stage(NETWORK):
+                    output_file = self.transport.storage_post(
+                        ul_url + "/0", data='', timeout=self.timeout)
                 completion_file_handle = output_file.text
+            stats.finish()
 
             logger.info('Chunks uploaded')
             logger.info('Setting attributes to complete upload')
             logger.info('Computing attributes')
-            file_mac = str_to_a32(mac_str)
-
-            # determine meta mac
-            meta_mac = (file_mac[0] ^ file_mac[1], file_mac[2] ^ file_mac[3])
 
             dest_filename = dest_filename or os.path.basename(filename)
-            attribs = {'n': dest_filename}
-
-            encrypt_attribs = base64_url_encode(
-                encrypt_attr(attribs, ul_key[:4]))
-            key = [
-                ul_key[0] ^ ul_key[4], ul_key[1] ^ ul_key[5],
-                ul_key[2] ^ meta_mac[0], ul_key[3] ^ meta_mac[1], ul_key[4],
-                ul_key[5], meta_mac[0], meta_mac[1]
-            ]
-            encrypted_key = a32_to_base64(encrypt_key(key, self.master_key))
             logger.info('Sending request to update attributes')
-            # update attributes
-            data = self._api_request({
-                'a':
-                'p',
-                't':
-                dest,
-                'i':
-                self.request_id,
-                'n': [{
-                    'h': completion_file_handle,
-                    't': 0,
-                    'a': encrypt_attribs,
-                    'k': encrypted_key
-                }]
-            })
+            command = self._upload_completion_command(
+                dest, completion_file_handle, ul_key, mac.meta_mac(),
+                dest_filename)
+            data = self._api_request(command)
+            self._apply_command(command, data)
             logger.info('Upload complete')
             return data
 
+    def _upload_completion_command(self, dest, completion_file_handle, ul_key,
+                                   meta_mac, dest_filename):
+        """
+        The 'p' command turning uploaded data into a file node
+        """
+        attribs = {'n': dest_filename}
+
+        encrypt_attribs = base64_url_encode(encrypt_attr(attribs, ul_key[:4]))
+        key = [
+            ul_key[0] ^ ul_key[4], ul_key[1] ^ ul_key[5],
+            ul_key[2] ^ meta_mac[0], ul_key[3] ^ meta_mac[1], ul_key[4],
+            ul_key[5], meta_mac[0], meta_mac[1]
+        ]
+        encrypted_key = a32_to_base64(encrypt_key(key, self.master_key))
+        # update attributes
+        return {
+            'a':
+            'p',
+            't':
+            dest,
+            'i':
+            self.request_id,
+            'n': [{
+                'h': completion_file_handle,
+                't': 0,
+                'a': encrypt_attribs,
+                'k': encrypted_key
+            }]
+        }
+
+    def _upload_chunks(self, input_file, file_size, ul_url, k_str, iv, mac,
+                       stats):
+        """
+        Encrypt and POST the chunks one after another.
+        """
+        count = Counter.new(128, initial_value=((iv[0] << 32) + iv[1]) << 64)
+        aes = AES.new(k_str, AES.MODE_CTR, counter=count)
+        completion_file_handle = None
+        for chunk_start, chunk_size in get_chunks(file_size):
+            with stats.stage(DISK, chunk_size):
+                chunk = input_file.read(chunk_size)
+            with stats.stage(MAC, chunk_size):
+                mac.update(chunk)
+
+            # encrypt file and upload
+            with stats.stage(ENCRYPT, chunk_size):
+                chunk = aes.encrypt(chunk)
+            with stats.stage(NETWORK, chunk_size):
+                output_file = self.transport.storage_post(
+                    ul_url + "/" + str(chunk_start),
+                    data=chunk,
+                    timeout=self.timeout)
+            completion_file_handle = output_file.text
+            stats.advance(len(chunk))
+            logger.info('%s of %s uploaded', stats.bytes_done, file_size)
+        return completion_file_handle
+
+    def _upload_chunks_parallel(self, input_file, file_size, ul_url, k_str,
+                                iv, mac, workers, stats):
+        """
+        Keep up to `workers` chunk POSTs in flight. Each worker MACs and
+        encrypts its chunk at the chunk's own CTR offset, so responses
+        may come back in any order: the chunk MACs are folded in file
+        order at the end and the completion handle is taken from
+        whichever response carries it. At most twice `workers` chunks
+        are held in memory at a time.
+        """
+        def upload_chunk(chunk_start, chunk):
+            with stats.stage(MAC, len(chunk)):
+                chunk_mac = mac.chunk_mac(chunk)
+            with stats.stage(ENCRYPT, len(chunk)):
+                chunk = self._chunk_cipher(k_str, iv,
+                                           chunk_start).encrypt(chunk)
+            with stats.stage(NETWORK, len(chunk)):
+                output_file = self.transport.storage_post(
+                    ul_url + "/" + str(chunk_start),
+                    data=chunk,
+                    timeout=self.timeout)
+                output_file.raise_for_status()
+            return chunk_mac, output_file.text
+
+        chunk_macs = {}
+        completion_file_handle = None
+        pending = {}
+
+        def collect(futures):
+            nonlocal completion_file_handle
+            for future in futures:
+                chunk_start, chunk_size = pending.pop(future)
+                chunk_mac, response_text = future.result()
+                if re.fullmatch(r'-\d+', response_text):
+                    raise RequestError(int(response_text))
+                if response_text:
+                    completion_file_handle = response_text
+                chunk_macs[chunk_start] = chunk_mac
+                stats.advance(chunk_size)
+                logger.info('%s of %s uploaded', stats.bytes_done, file_size)
+
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            for chunk_start, chunk_size in get_chunks(file_size):
+                with stats.stage(DISK, chunk_size):
+                    chunk = input_file.read(chunk_size)
+                future = executor.submit(upload_chunk, chunk_start, chunk)
+                pending[future] = (chunk_start, len(chunk))
+                if len(pending) >= 2 * workers:
+                    done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                    collect(done)
+            collect(list(pending))
+
+        for chunk_start, chunk_size in get_chunks(file_size):
+            mac.add_chunk_mac(chunk_macs[chunk_start])
+        return completion_file_handle
+
     def _mkdir(self, name, parent_node_id):
+        command = self._mkdir_command(name, parent_node_id)
+        data = self._api_request(command)
+        self._apply_command(command, data)
+        return data
+
+    def _mkdir_command(self, name, parent_node_id):
         # generate random aes key (128) for folder
         ul_key = [random.randint(0, 0xFFFFFFFF) for _ in range(6)]
 
@@ -946,8 +1725,7 @@ class Mega:
         encrypt_attribs = base64_url_encode(encrypt_attr(attribs, ul_key[:4]))
         encrypted_key = a32_to_base64(encrypt_key(ul_key[:4], self.master_key))
 
-        # update attributes
-        data = self._api_request({
+        return {
             'a':
             'p',
             't':
@@ -960,12 +1738,11 @@ class Mega:
             }],
             'i':
             self.request_id
-        })
-        return data
+        }
 
     def _root_node_id(self):
         if not hasattr(self, 'root_id'):
-            self.get_files()
+            self._node_tree()
         return self.root_id
 
     def create_folder(self, name, dest=None):
@@ -990,6 +1767,13 @@ class Mega:
         return dict(zip(dirs, folder_node_ids.values()))
 
     def rename(self, file, new_name):
+        # update attributes
+        command = self._rename_command(file, new_name)
+        result = self._api_request([command])
+        self._apply_command(command, result)
+        return result
+
+    def _rename_command(self, file, new_name):
         file = file[1]
         # create new attribs
         attribs = {'n': new_name}
@@ -997,14 +1781,13 @@ class Mega:
         encrypt_attribs = base64_url_encode(encrypt_attr(attribs, file['k']))
         encrypted_key = a32_to_base64(encrypt_key(file['key'],
                                                   self.master_key))
-        # update attributes
-        return self._api_request([{
+        return {
             'a': 'a',
             'attr': encrypt_attribs,
             'key': encrypted_key,
             'n': file['h'],
             'i': self.request_id
-        }])
+        }
 
     def move(self, file_id, target):
         """
@@ -1025,7 +1808,12 @@ class Mega:
         or...
         target's structure returned by find()
         """
+        command = self._move_command(file_id, target)
+        result = self._api_request(command)
+        self._apply_command(command, result)
+        return result
 
+    def _move_command(self, file_id, target):
         # determine target_node_id
         if type(target) == int:
             target_node_id = str(self.get_node_by_type(target)[0])
@@ -1034,12 +1822,12 @@ class Mega:
         else:
             file = target[1]
             target_node_id = file['h']
-        return self._api_request({
+        return {
             'a': 'm',
             'n': file_id,
             't': target_node_id,
             'i': self.request_id
-        })
+        }
 
     def add_contact(self, email):
         """
@@ -1137,7 +1925,7 @@ class Mega:
 
         encrypted_key = a32_to_base64(encrypt_key(key, self.master_key))
         encrypted_name = base64_url_encode(encrypt_attr({'n': dest_name}, k))
-        return self._api_request({
+        command = {
             'a':
             'p',
             't':
@@ -1148,4 +1936,7 @@ class Mega:
                 'a': encrypted_name,
                 'k': encrypted_key
             }]
-        })
+        }
+        data = self._api_request(command)
+        self._apply_command(command, data)
+        return data
@@ -0,0 +1,236 @@
+import threading
+import time
+from typing import (Any, Callable, Dict, List, NamedTuple, Optional, Tuple,
+                    Union)
+
+# upper bounds, in seconds, of the latency histogram buckets
+LATENCY_BUCKETS = (0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0,
+                   30.0, 60.0)
+
+
+class ApiSample(NamedTuple):
+    """
+    One request to the API as seen by the client.
+
+    `command` is the 'a' of the command sent, 'batch' for a request
+    holding several and 'sc' for an action packet request. `errors`
+    holds the negative codes the server answered with, for the request
+    as a whole or for single commands of it, or 'network' or 'decode'
+    when there was no usable response. `retried` is true when the
+    request is sent again, as it is after an EAGAIN (-3).
+    """
+    command: str
+    seconds: float
+    request_bytes: int
+    response_bytes: int
+    errors: Tuple[Union[int, str], ...] = ()
+    retried: bool = False
+
+
+def command_name(commands: List[Dict[str, Any]]) -> str:
+    if len(commands) == 1:
+        return str(commands[0].get('a'))
+    return 'batch'
+
+
+def result_errors(json_resp: Any) -> Tuple[int, ...]:
+    """
+    The error codes in a decoded API response.
+    """
+    if isinstance(json_resp, int):
+        return (json_resp, ) if json_resp < 0 else ()
+    if isinstance(json_resp, list):
+        return tuple(result for result in json_resp
+                     if isinstance(result, int) and result < 0)
+    return ()
+
+
+class RequestTimer:
+    """
+    Times one request and counts its bytes, and records it to a sink
+    once its outcome is known.
+    """
+    def __init__(self, sink, command: str, request_bytes: int) -> None:
+        self.sink = sink
+        self.command = command
+        self.request_bytes = request_bytes
+        self.response_bytes = 0
+        self.start = time.perf_counter()
+
+    def count(self, chunks):
+        """
+        Pass a response body's chunks through, counting their bytes.
+        """
+        for chunk in chunks:
+            self.response_bytes += len(chunk)
+            yield chunk
+
+    def done(self,
+             response_bytes: Optional[int] = None,
+             errors=(),
+             retried: bool = False) -> None:
+        if response_bytes is not None:
+            self.response_bytes = response_bytes
+        self.sink.record(
+            ApiSample(self.command,
+                      time.perf_counter() - self.start, self.request_bytes,
+                      self.response_bytes, tuple(errors), retried))
+
+
+class _NullTimer:
+    """
+    Stands in for `RequestTimer` when metrics are off.
+    """
+    @staticmethod
+    def count(chunks):
+        return chunks
+
+    @staticmethod
+    def done(response_bytes=None, errors=(), retried=False):
+        pass
+
+
+NULL_TIMER = _NullTimer()
+
+
+def start_request(sink, command: str, request_bytes: int):
+    """
+    Returns:
+        A `RequestTimer` recording to `sink`, or one doing nothing if
+        `sink` is None
+    """
+    if sink is None:
+        return NULL_TIMER
+    return RequestTimer(sink, command, request_bytes)
+
+
+class CallbackSink:
+    """
+    Sink handing every `ApiSample` to a function, e.g. to forward it to
+    StatsD or a tracing system. The function is called on the thread
+    that made the request.
+    """
+    def __init__(self, callback: Callable[[ApiSample], Any]) -> None:
+        self.callback = callback
+
+    def record(self, sample: ApiSample) -> None:
+        self.callback(sample)
+
+
+class MemorySink:
+    """
+    Sink aggregating samples in memory, per command: requests, retries,
+    error codes, bytes sent and received and a latency histogram.
+    Safe to share between threads and clients.
+    """
+    def __init__(self, buckets=LATENCY_BUCKETS) -> None:
+        self.buckets = tuple(sorted(buckets))
+        self._lock = threading.Lock()
+        self._commands: Dict[str, Dict[str, Any]] = {}
+
+    def record(self, sample: ApiSample) -> None:
+        with self._lock:
+            stats = self._commands.get(sample.command)
+            if stats is None:
+                stats = self._commands[sample.command] = {
+                    'requests': 0,
+                    'retries': 0,
+                    'errors': {},
+                    'request_bytes': 0,
+                    'response_bytes': 0,
+                    'latency_sum': 0.0,
+                    'latency_buckets': [0] * (len(self.buckets) + 1),
+                }
+            stats['requests'] += 1
+            stats['retries'] += sample.retried
+            for code in sample.errors:
+                stats['errors'][code] = stats['errors'].get(code, 0) + 1
+            stats['request_bytes'] += sample.request_bytes
+            stats['response_bytes'] += sample.response_bytes
+            stats['latency_sum'] += sample.seconds
+            index = 0
+            while (index < len(self.buckets)
+                   and sample.seconds > self.buckets[index]):
+                index += 1
+            stats['latency_buckets'][index] += 1
+
+    def snapshot(self) -> Dict[str, Dict[str, Any]]:
+        """
+        Returns:
+            Per command name, a dict of 'requests', 'retries', 'errors'
+            (count per code), 'request_bytes', 'response_bytes',
+            'latency_sum' and 'latency_buckets': (upper bound, count of
+            requests no slower) pairs, ending with float('inf')
+        """
+        with self._lock:
+            snapshot = {}
+            for command, stats in self._commands.items():
+                stats = dict(stats, errors=dict(stats['errors']))
+                bounds = self.buckets + (float('inf'), )
+                total = 0
+                cumulative = []
+                for bound, count in zip(bounds, stats['latency_buckets']):
+                    total += count
+                    cumulative.append((bound, total))
+                stats['latency_buckets'] = cumulative
+                snapshot[command] = stats
+            return snapshot
+
+    def reset(self) -> None:
+        with self._lock:
+            self._commands.clear()
+
+
+class PrometheusSink(MemorySink):
+    """
+    `MemorySink` that renders its totals in the Prometheus text
+    exposition format, to be served from a /metrics endpoint.
+    """
+    def __init__(self, prefix: str = 'mega_api',
+                 buckets=LATENCY_BUCKETS) -> None:
+        super().__init__(buckets)
+        self.prefix = prefix
+
+    def render(self) -> str:
+        snapshot = sorted(self.snapshot().items())
+        lines = []
+
+        def metric(name, kind, help_text, values):
+            name = f'{self.prefix}_{name}'
+            lines.append(f'# HELP {name} {help_text}')
+            lines.append(f'# TYPE {name} {kind}')
+            for suffix, labels, value in values:
+                labels = ','.join(f'{key}="{label}"' for key, label in labels)
+                lines.append(f'{name}{suffix}{{{labels}}} {value}')
+
+        def per_command(key):
+            return [('', [('command', command)], stats[key])
+                    for command, stats in snapshot]
+
+        metric('requests_total', 'counter', 'API requests sent.',
+               per_command('requests'))
+        metric('retries_total', 'counter', 'API requests sent again.',
+               per_command('retries'))
+        metric('errors_total', 'counter', 'Error codes received.',
+               [('', [('command', command), ('code', code)], count)
+                for command, stats in snapshot
+                for code, count in sorted(stats['errors'].items(),
+                                          key=lambda item: str(item[0]))])
+        metric('request_bytes_total', 'counter', 'Bytes of requests sent.',
+               per_command('request_bytes'))
+        metric('response_bytes_total', 'counter',
+               'Bytes of responses received.', per_command('response_bytes'))
+        histogram = []
+        for command, stats in snapshot:
+            for bound, count in stats['latency_buckets']:
+                le = '+Inf' if bound == float('inf') else repr(bound)
+                histogram.append(
+                    ('_bucket', [('command', command), ('le', le)], count))
+            histogram.append(
+                ('_sum', [('command', command)], stats['latency_sum']))
+            histogram.append(
+                ('_count', [('command', command)], stats['requests']))
+        metric('latency_seconds', 'histogram',
+               'Seconds from sending a request to its full response.',
+               histogram)
+        return '\n'.join(lines) + '\n'
@@ -0,0 +1,237 @@
+import sys
+import threading
+from collections.abc import MutableMapping
+from typing import Any, Dict, Iterator, Mapping, Optional, Tuple
+
+from .crypto import a32_to_str, base64_url_decode, decrypt_attr, str_to_a32
+
+# node fields with a slot of their own; s and ts are absent for some nodes
+_SLOT_FIELDS = ('h', 'p', 'u', 't', 's', 'ts')
+_OPTIONAL_FIELDS = ('s', 'ts')
+# fields worked out from the node key rather than stored
+_KEY_FIELDS = ('k', 'key', 'iv', 'meta_mac')
+# orders storing decrypted attributes against setting new ones, see
+# Node.materialize; decryption itself runs outside it
+_attributes_lock = threading.Lock()
+
+
+class Node(MutableMapping):
+    """
+    A decrypted node, stored compactly.
+
+    Handle, parent, owner, type, size and timestamp have slots of their
+    own, the node key is kept as bytes, and 'k', 'key', 'iv' and
+    'meta_mac' are worked out from it when read. Any other field the
+    server sent (e.g. 'fa', 'su', 'sk') goes in `extra`.
+
+    Nodes read like the dicts they replace, so `node['a']['n']`,
+    `node.get('s')`, `dict(node)` and comparisons with dicts keep
+    working.
+
+    The attributes ('a') are decrypted the first time they are read;
+    until then only the encrypted string is kept, so lookups by handle,
+    parent or type never pay for them. `materialize()` decrypts them up
+    front. Attributes that fail to decrypt read as None.
+    """
+    __slots__ = ('h', 'p', 'u', 't', 's', 'ts', 'key_bytes', '_attributes',
+                 '_encrypted_attributes', 'shared_folder_key', 'extra')
+
+    def __init__(self,
+                 fields: Mapping[str, Any],
+                 key: Optional[bytes] = None) -> None:
+        """
+        Args:
+            fields: The node's fields as the server sends them, with 'a'
+                either still encrypted or already decrypted
+            key: The decrypted node key; encrypted attributes are
+                decrypted with it when first read
+        """
+        self.h = fields['h']
+        self.p = sys.intern(fields['p'])
+        self.u = sys.intern(fields['u'])
+        self.t = fields['t']
+        self.s = fields.get('s')
+        self.ts = fields.get('ts')
+        self.key_bytes = key
+        attributes = fields['a']
+        if key is not None and isinstance(attributes, str):
+            self._attributes = None
+            self._encrypted_attributes = attributes
+        else:
+            self._attributes = attributes
+            self._encrypted_attributes = None
+        shared_folder_key = fields.get('shared_folder_key')
+        self.shared_folder_key = (tuple(shared_folder_key)
+                                  if shared_folder_key is not None else None)
+        extra = {
+            field: value
+            for field, value in fields.items()
+            if field not in _SLOT_FIELDS and field not in _KEY_FIELDS
+            and field not in ('a', 'shared_folder_key')
+        }
+        if key is None and 'k' in fields:
+            # undecryptable or key-less node, keep what the server sent
+            extra['k'] = fields['k']
+        self.extra: Optional[Dict[str, Any]] = extra or None
+
+    @property
+    def decrypted(self) -> bool:
+        """
+        False while the attributes are still encrypted
+        """
+        return self._encrypted_attributes is None
+
+    @property
+    def encrypted_attributes(self) -> Optional[str]:
+        """
+        The attributes as the server sent them, while not yet decrypted
+        """
+        return self._encrypted_attributes
+
+    def materialize(self) -> None:
+        """
+        Decrypt the attributes now if they have not been yet.
+        """
+        encrypted = self._encrypted_attributes
+        if encrypted is not None:
+            attributes = decrypt_attr(base64_url_decode(encrypted), self.k)
+            with _attributes_lock:
+                # attributes set meanwhile, e.g. by a rename, are newer
+                # than those just decrypted
+                if self._encrypted_attributes is not encrypted:
+                    return
+                # set the attributes before clearing the encrypted ones,
+                # so that another thread reading the node meanwhile
+                # decrypts them too rather than seeing None
+                self._attributes = attributes
+                self._encrypted_attributes = None
+
+    @property
+    def attributes(self) -> Any:
+        self.materialize()
+        return self._attributes
+
+    @attributes.setter
+    def attributes(self, attributes: Any) -> None:
+        with _attributes_lock:
+            self._encrypted_attributes = None
+            self._attributes = attributes
+
+    @property
+    def key(self) -> Optional[Tuple[int, ...]]:
+        """
+        The full node key as ints, 8 for files and 4 for folders
+        """
+        if self.key_bytes is None:
+            return None
+        return str_to_a32(self.key_bytes)
+
+    @property
+    def k(self) -> Optional[Tuple[int, ...]]:
+        """
+        The AES key of the node's attributes and, for files, its data
+        """
+        key = self.key
+        if key is None or self.t != 0:
+            return key
+        return (key[0] ^ key[4], key[1] ^ key[5], key[2] ^ key[6],
+                key[3] ^ key[7])
+
+    @property
+    def iv(self) -> Optional[Tuple[int, ...]]:
+        key = self.key
+        if key is None or self.t != 0:
+            return None
+        return key[4:6] + (0, 0)
+
+    @property
+    def meta_mac(self) -> Optional[Tuple[int, ...]]:
+        key = self.key
+        if key is None or self.t != 0:
+            return None
+        return key[6:8]
+
+    def _fields(self) -> Iterator[str]:
+        yield 'h'
+        yield 'p'
+        yield 'u'
+        yield 't'
+        if self.s is not None:
+            yield 's'
+        if self.ts is not None:
+            yield 'ts'
+        yield 'a'
+        if self.key_bytes is not None:
+            yield 'k'
+            yield 'key'
+            if self.t == 0:
+                yield 'iv'
+                yield 'meta_mac'
+        if self.shared_folder_key is not None:
+            yield 'shared_folder_key'
+        if self.extra:
+            yield from self.extra
+
+    def __getitem__(self, field: str) -> Any:
+        if field in _SLOT_FIELDS or field == 'shared_folder_key':
+            value = getattr(self, field)
+            if value is not None or field in ('h', 'p', 'u', 't'):
+                return value
+        elif field == 'a':
+            return self.attributes
+        elif field in _KEY_FIELDS and self.key_bytes is not None:
+            value = getattr(self, field)
+            if value is not None:
+                return value
+        elif self.extra and field in self.extra:
+            return self.extra[field]
+        raise KeyError(field)
+
+    def __setitem__(self, field: str, value: Any) -> None:
+        if field == 'p' or field == 'u':
+            setattr(self, field, sys.intern(value))
+        elif field in _SLOT_FIELDS:
+            setattr(self, field, value)
+        elif field == 'a':
+            self.attributes = value
+        elif field == 'key':
+            self.key_bytes = a32_to_str(value)
+        elif field == 'shared_folder_key':
+            self.shared_folder_key = tuple(value)
+        elif field in _KEY_FIELDS and self.key_bytes is not None:
+            raise TypeError(f'{field} is worked out from the node key')
+        else:
+            if self.extra is None:
+                self.extra = {}
+            self.extra[field] = value
+
+    def __delitem__(self, field: str) -> None:
+        if field in _OPTIONAL_FIELDS and getattr(self, field) is not None:
+            setattr(self, field, None)
+        elif field == 'shared_folder_key' and self.shared_folder_key:
+            self.shared_folder_key = None
+        elif self.extra and field in self.extra:
+            del self.extra[field]
+        else:
+            raise KeyError(field)
+
+    def __contains__(self, field: object) -> bool:
+        if field == 'a':
+            return True
+        try:
+            self[field]
+        except KeyError:
+            return False
+        return True
+
+    def __iter__(self) -> Iterator[str]:
+        return self._fields()
+
+    def __len__(self) -> int:
+        return sum(1 for _ in self._fields())
+
+    def copy(self) -> Dict[str, Any]:
+        return dict(self)
+
+    def __repr__(self) -> str:
+        return f'Node({dict(self)!r})'
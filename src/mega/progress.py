@@ -0,0 +1,162 @@
+import collections
+import threading
+import time
+from typing import Any, Callable, Dict, Optional
+
+# stages of a transfer timed by TransferStats
+NETWORK = 'network'
+DECRYPT = 'decrypt'
+ENCRYPT = 'encrypt'
+MAC = 'mac'
+DISK = 'disk'
+
+
+class _Stage:
+    __slots__ = ('stats', 'name', 'size', 'start')
+
+    def __init__(self, stats, name, size):
+        self.stats = stats
+        self.name = name
+        self.size = size
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.stats._add(self.name, time.perf_counter() - self.start,
+                        self.size)
+
+
+class TransferStats:
+    """
+    Progress of one download or upload, and the time it spent in each
+    stage: 'network' (reading or sending chunks), 'decrypt' or
+    'encrypt' (AES-CTR), 'mac' (the chunk CBC-MACs) and 'disk' (writing
+    the output or reading the input file).
+
+    Pass one to `Mega.download`, `download_url` or `upload` as `stats`
+    and read it during or after the transfer. Stage times are summed
+    over the threads of a transfer with several workers, so together
+    they can exceed `elapsed`.
+
+    Args:
+        callback: Called with the stats each time a chunk is done,
+            from the thread that finished it
+        window: Seconds over which `current_throughput` is measured
+    """
+    def __init__(self,
+                 callback: Optional[Callable[['TransferStats'], Any]] = None,
+                 window: float = 5.0) -> None:
+        self.callback = callback
+        self.window = window
+        self.direction = None
+        self.total_bytes = 0
+        self.bytes_done = 0
+        self.stage_seconds: Dict[str, float] = {}
+        self.stage_bytes: Dict[str, int] = {}
+        self.started = None
+        self.finished = None
+        self._lock = threading.Lock()
+        self._recent = collections.deque()
+
+    def start(self, direction: str, total_bytes: int) -> None:
+        """
+        Start the clock of a 'download' or 'upload' of `total_bytes`.
+        """
+        with self._lock:
+            self.direction = direction
+            self.total_bytes = total_bytes
+            self.started = time.monotonic()
+            self._recent.append((self.started, 0))
+
+    def stage(self, name: str, size: int = 0) -> _Stage:
+        """
+        Context manager adding the time spent in its block, and `size`
+        bytes, to stage `name`.
+        """
+        return _Stage(self, name, size)
+
+    def _add(self, name, seconds, size):
+        with self._lock:
+            self.stage_seconds[name] = self.stage_seconds.get(name,
+                                                              0.0) + seconds
+            self.stage_bytes[name] = self.stage_bytes.get(name, 0) + size
+
+    def advance(self, size: int) -> None:
+        """
+        Count `size` more bytes as transferred and tell the callback.
+        """
+        now = time.monotonic()
+        with self._lock:
+            self.bytes_done += size
+            self._recent.append((now, self.bytes_done))
+            while len(self._recent) > 2 and (now - self._recent[1][0] >=
+                                             self.window):
+                self._recent.popleft()
+        if self.callback is not None:
+            self.callback(self)
+
+    def finish(self) -> None:
+        """
+        Stop the clock.
+        """
+        self.finished = time.monotonic()
+
+    @property
+    def elapsed(self) -> float:
+        if self.started is None:
+            return 0.0
+        return (self.finished or time.monotonic()) - self.started
+
+    @property
+    def throughput(self) -> float:
+        """
+        Bytes per second since the start.
+        """
+        elapsed = self.elapsed
+        return self.bytes_done / elapsed if elapsed > 0 else 0.0
+
+    @property
+    def current_throughput(self) -> float:
+        """
+        Bytes per second over the last `window` seconds.
+        """
+        with self._lock:
+            if len(self._recent) < 2:
+                return 0.0
+            (first_time, first_bytes) = self._recent[0]
+            (last_time, last_bytes) = self._recent[-1]
+        if last_time <= first_time:
+            return 0.0
+        return (last_bytes - first_bytes) / (last_time - first_time)
+
+    @property
+    def eta(self) -> Optional[float]:
+        """
+        Seconds left at the current throughput, None before it is known.
+        """
+        remaining = self.total_bytes - self.bytes_done
+        if remaining <= 0:
+            return 0.0
+        rate = self.current_throughput
+        return remaining / rate if rate > 0 else None
+
+    def snapshot(self) -> Dict[str, Any]:
+        """
+        Returns:
+            The stats as a dict, e.g. for logging as JSON
+        """
+        with self._lock:
+            stage_seconds = dict(self.stage_seconds)
+            stage_bytes = dict(self.stage_bytes)
+        return {
+            'direction': self.direction,
+            'total_bytes': self.total_bytes,
+            'bytes_done': self.bytes_done,
+            'elapsed': self.elapsed,
+            'throughput': self.throughput,
+            'current_throughput': self.current_throughput,
+            'eta': self.eta,
+            'stage_seconds': stage_seconds,
+            'stage_bytes': stage_bytes,
+        }
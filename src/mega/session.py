@@ -0,0 +1,67 @@
+import json
+from typing import Any, Dict
+
+from Crypto.Cipher import AES
+from Crypto.Random import get_random_bytes
+
+from .crypto import base64_url_encode, base64_url_decode
+from .errors import ValidationError
+
+# first byte of every blob, bumped if the payload layout changes
+SESSION_VERSION = 1
+_NONCE_SIZE = 12
+_TAG_SIZE = 16
+
+
+def seal_session(state: Dict[str, Any], key: bytes) -> str:
+    """
+    Encrypt a session's state into a string safe to store or pass around.
+
+    The state is serialised as JSON and encrypted with AES-GCM, so a blob
+    that was tampered with or is opened with the wrong key is rejected
+    rather than restored.
+
+    Args:
+        state: JSON-serialisable session state
+        key: 16, 24 or 32 byte secret the blob is encrypted with
+
+    Returns:
+        URL-safe base64 blob
+    """
+    if len(key) not in AES.key_size:
+        raise ValueError("Key must be 16, 24 or 32 bytes long")
+    nonce = get_random_bytes(_NONCE_SIZE)
+    cipher = AES.new(key, AES.MODE_GCM, nonce=nonce, mac_len=_TAG_SIZE)
+    cipher.update(bytes([SESSION_VERSION]))
+    ciphertext, tag = cipher.encrypt_and_digest(
+        json.dumps(state).encode('utf8'))
+    return base64_url_encode(
+        bytes([SESSION_VERSION]) + nonce + ciphertext + tag)
+
+
+def open_session(blob: str, key: bytes) -> Dict[str, Any]:
+    """
+    Decrypt a blob made by `seal_session`.
+
+    Raises:
+        ValidationError: If the blob is malformed, from another version,
+            or does not decrypt with `key`
+    """
+    if len(key) not in AES.key_size:
+        raise ValueError("Key must be 16, 24 or 32 bytes long")
+    try:
+        data = base64_url_decode(blob)
+    except ValueError as e:
+        raise ValidationError('Malformed session blob') from e
+    if len(data) < 1 + _NONCE_SIZE + _TAG_SIZE or data[0] != SESSION_VERSION:
+        raise ValidationError('Malformed session blob')
+    nonce = data[1:1 + _NONCE_SIZE]
+    ciphertext, tag = data[1 + _NONCE_SIZE:-_TAG_SIZE], data[-_TAG_SIZE:]
+    cipher = AES.new(key, AES.MODE_GCM, nonce=nonce, mac_len=_TAG_SIZE)
+    cipher.update(data[:1])
+    try:
+        plaintext = cipher.decrypt_and_verify(ciphertext, tag)
+    except ValueError as e:
+        raise ValidationError(
+            'Session blob does not decrypt with this key') from e
+    return json.loads(plaintext)
@@ -0,0 +1,134 @@
+import codecs
+import json
+import re
+from typing import Any, Collection, Iterable, Iterator, Tuple
+
+from .errors import RequestError
+
+_NON_WHITESPACE = re.compile(r'[^ \t\n\r]')
+_decoder = json.JSONDecoder()
+
+
+class _Reader:
+    """
+    Text read from an iterable of byte chunks, kept only from the
+    current position on.
+    """
+    def __init__(self, chunks: Iterable[bytes]) -> None:
+        self._chunks = iter(chunks)
+        self._utf8 = codecs.getincrementaldecoder('utf-8')()
+        self.text = ''
+        self.pos = 0
+        self.done = False
+
+    def more(self) -> bool:
+        """
+        Read the next chunk.
+
+        Returns:
+            False once the body is exhausted
+        """
+        if self.done:
+            return False
+        if self.pos:
+            self.text = self.text[self.pos:]
+            self.pos = 0
+        for chunk in self._chunks:
+            if chunk:
+                self.text += self._utf8.decode(chunk)
+                return True
+        self.text += self._utf8.decode(b'', final=True)
+        self.done = True
+        return False
+
+    def peek(self) -> str:
+        """
+        Returns:
+            The next non-whitespace character, '' at the end of the body
+        """
+        while True:
+            match = _NON_WHITESPACE.search(self.text, self.pos)
+            if match is not None:
+                self.pos = match.start()
+                return match.group()
+            self.pos = len(self.text)
+            if not self.more():
+                return ''
+
+    def expect(self, characters: str) -> str:
+        character = self.peek()
+        if not character or character not in characters:
+            raise json.JSONDecodeError(f'Expecting one of {characters!r}',
+                                       self.text, self.pos)
+        self.pos += 1
+        return character
+
+    def value(self) -> Any:
+        """
+        Decode the next JSON value, reading as many chunks as it needs.
+        """
+        if not self.peek():
+            raise json.JSONDecodeError('Expecting value', self.text,
+                                       self.pos)
+        while True:
+            try:
+                value, end = _decoder.raw_decode(self.text, self.pos)
+            except json.JSONDecodeError:
+                if self.more():
+                    continue
+                raise
+            # a number or literal ending the buffer may carry on in the
+            # next chunk
+            if end == len(self.text) and self.more():
+                continue
+            self.pos = end
+            return value
+
+
+def iter_response(
+        chunks: Iterable[bytes],
+        streamed: Collection[str] = ('f', 'ok', 's')
+) -> Iterator[Tuple[str, Any]]:
+    """
+    Parse the response to a single API command as it is read, without
+    holding the whole body or its decoded form.
+
+    Args:
+        chunks: The response body, e.g. `Response.iter_content(...)`
+        streamed: Fields of the result holding arrays to yield element
+            by element
+
+    Yields:
+        (field, element) for each element of a streamed array, in the
+        order they arrive, and (field, value) for every other field
+
+    Raises:
+        RequestError: If the server answered with an error code
+        json.JSONDecodeError: If the body is not valid JSON
+    """
+    reader = _Reader(chunks)
+    if reader.peek() != '[':
+        raise RequestError(reader.value())
+    reader.expect('[')
+    if reader.peek() != '{':
+        result = reader.value()
+        raise RequestError(result)
+    reader.expect('{')
+    if reader.peek() == '}':
+        return
+    while True:
+        field = reader.value()
+        reader.expect(':')
+        if field in streamed and reader.peek() == '[':
+            reader.expect('[')
+            if reader.peek() == ']':
+                reader.expect(']')
+            else:
+                while True:
+                    yield field, reader.value()
+                    if reader.expect(',]') == ']':
+                        break
+        else:
+            yield field, reader.value()
+        if reader.expect(',}') == '}':
+            return
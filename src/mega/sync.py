@@ -0,0 +1,218 @@
+import json
+import logging
+from typing import Any, Dict, Iterator, List, NamedTuple, Optional
+
+from requests.exceptions import RequestException
+
+from .crypto import base64_url_decode, decrypt_attr
+from .errors import RequestError
+from .metrics import result_errors, start_request
+
+logger = logging.getLogger(__name__)
+
+
+class NodeEvent(NamedTuple):
+    """
+    A change to the node tree reported by the server.
+
+    kind is one of 'new', 'update', 'move' or 'delete'. node is the node
+    after the change, or the removed node for 'delete'.
+    """
+    kind: str
+    handle: str
+    node: Optional[Dict[str, Any]]
+
+
+class ActionPacketSync:
+    """
+    Keeps a Mega instance's cached node tree current by following the
+    server-client channel.
+
+    The 'f' fetch that fills the tree records its sequence number. Each
+    poll asks the /sc endpoint for the action packets that follow it and
+    applies them to the tree: new nodes ('t'), attribute updates ('u')
+    and deletions ('d'). A deletion followed by the same node coming
+    back in the same response is reported as a move. When nothing has
+    changed, the server hands out a wait URL which is long-polled before
+    asking again.
+
+    Packets caused by this client's own commands carry its request id
+    and are skipped, as those changes are already in the tree.
+    """
+    def __init__(self, mega) -> None:
+        self.mega = mega
+
+    @property
+    def sn(self) -> Optional[str]:
+        """
+        Sequence number the tree is current up to
+        """
+        return self.mega._node_tree().sn
+
+    def events(self, wait: bool = True) -> Iterator[NodeEvent]:
+        """
+        Iterate over changes as they happen, forever.
+        """
+        while True:
+            yield from self.poll(wait=wait)
+
+    def poll(self, wait: bool = True) -> List[NodeEvent]:
+        """
+        Fetch and apply the next batch of action packets.
+
+        Args:
+            wait: Whether to long-poll when the server has nothing new
+
+        Returns:
+            The changes applied, empty if there were none
+        """
+        tree = self._tree()
+        response = self._request(tree.sn)
+        if 'w' in response:
+            tree.touch()
+            if wait:
+                logger.info('Waiting for action packets')
+                try:
+                    self.mega.transport.api_get(response['w'],
+                                                timeout=self.mega.timeout)
+                except RequestException as e:
+                    logger.info('Wait request ended: %s', e)
+            return []
+        return self._apply_response(tree, response)
+
+    def catch_up(self) -> List[NodeEvent]:
+        """
+        Apply every action packet the server has queued, without waiting
+        for new ones. Used to bring a tree loaded from disk up to date.
+
+        Returns:
+            The changes applied
+        """
+        tree = self._tree()
+        events = []
+        while True:
+            response = self._request(tree.sn)
+            if 'w' in response:
+                tree.touch()
+                return events
+            events.extend(self._apply_response(tree, response))
+
+    def _tree(self):
+        """
+        The cached tree, whatever its age: the packets applied to it keep
+        it current, so it is not fetched again when `node_cache_ttl`
+        runs out.
+        """
+        with self.mega._tree_lock:
+            tree = self.mega._nodes
+        return self.mega._node_tree() if tree is None else tree
+
+    def _apply_response(self, tree, response):
+        with self.mega._tree_lock:
+            if tree is not self.mega._nodes:
+                # fetched again while the packets were on their way; the
+                # new tree already has these changes
+                return []
+            events = self._apply(tree, response.get('a', []))
+            tree.sn = response['sn']
+            tree.touch()
+            self.mega._store_events(events)
+            return events
+
+    def _request(self, sn: str) -> Dict[str, Any]:
+        params = {'sn': sn}
+        if self.mega.sid:
+            params['sid'] = self.mega.sid
+        url = f'{self.mega.schema}://g.api.{self.mega.domain}/sc'
+        timer = start_request(self.mega.metrics, 'sc', 0)
+        try:
+            response = self.mega.transport.api_post(url,
+                                                    params=params,
+                                                    data='',
+                                                    timeout=self.mega.timeout)
+            response.raise_for_status()
+        except RequestException:
+            timer.done(errors=('network', ))
+            raise
+        json_resp = json.loads(response.text)
+        timer.done(len(response.content), result_errors(json_resp))
+        if isinstance(json_resp, int):
+            raise RequestError(json_resp)
+        return json_resp
+
+    def apply(self, packets: List[Dict[str, Any]]) -> List[NodeEvent]:
+        """
+        Apply action packets to the cached tree.
+
+        Returns:
+            The resulting changes
+        """
+        with self.mega._tree_lock:
+            return self._apply(self._tree(), packets)
+
+    def _apply(self, tree, packets):
+        # handles deleted and put back within these packets are moves
+        readded = set()
+        for packet in packets:
+            if packet.get('a') == 't':
+                readded.update(node['h'] for node in packet['t']['f'])
+
+        events = []
+        for packet in packets:
+            if packet.get('i') == self.mega.request_id:
+                continue
+            action = packet.get('a')
+            if action == 't':
+                events.extend(self._new_nodes(tree, packet, readded))
+            elif action == 'u':
+                events.extend(self._update_node(tree, packet))
+            elif action == 'd':
+                if packet['n'] in readded:
+                    continue
+                events.extend(self._remove(tree, packet['n']))
+            else:
+                logger.debug('Ignoring action packet %s', action)
+        return events
+
+    def _new_nodes(self, tree, packet, readded):
+        shared_keys = getattr(self.mega, 'shared_keys', {})
+        for file in packet['t']['f']:
+            moved = file['h'] in readded and file['h'] in tree
+            processed_file = self.mega._process_file(file, shared_keys)
+            if not processed_file['a']:
+                continue
+            if moved:
+                old = tree.get(file['h'])
+                if old['p'] != processed_file['p']:
+                    tree.move(file['h'], processed_file['p'])
+                    yield NodeEvent('move', file['h'], tree.get(file['h']))
+            else:
+                tree.add(processed_file)
+                yield NodeEvent('new', file['h'], processed_file)
+
+    def _update_node(self, tree, packet):
+        node = tree.get(packet['n'])
+        if node is None:
+            return
+        if 'at' in packet:
+            attributes = decrypt_attr(base64_url_decode(packet['at']),
+                                      node['k'])
+            if attributes:
+                tree.set_attributes(packet['n'], attributes)
+        if 'ts' in packet:
+            tree.set_timestamp(packet['n'], packet['ts'])
+        yield NodeEvent('update', packet['n'], tree.get(packet['n']))
+
+    def _remove(self, tree, handle):
+        nodes = {h: tree.get(h) for h in self._subtree(tree, handle)}
+        for removed in tree.remove(handle):
+            yield NodeEvent('delete', removed, nodes[removed])
+
+    @staticmethod
+    def _subtree(tree, handle):
+        pending = [handle]
+        while pending:
+            current = pending.pop()
+            if current in tree:
+                yield current
+                pending.extend(tree.children(current))
@@ -0,0 +1,124 @@
+import threading
+from typing import Any, Dict, Optional
+
+import requests
+from requests.adapters import HTTPAdapter
+
+
+class HTTPTransport:
+    """
+    Pooled HTTP transport owned by a Mega instance.
+
+    API commands to g.api and transfers to the storage hosts go through
+    two separate connection pools, so each keeps its own keep-alive
+    connections and the two can be sized independently.
+
+    The transport can be shared by threads. Each thread gets its own
+    pair of `requests.Session` objects, as sessions are not safe to use
+    from several threads at once, but they all mount the same adapters
+    and so draw on the same thread-safe pools.
+    """
+    def __init__(self,
+                 api_pool_size: int = 4,
+                 storage_pool_size: int = 16,
+                 storage_hosts: int = 8,
+                 session: Optional[requests.Session] = None) -> None:
+        """
+        Args:
+            api_pool_size: Connections kept open to the API host
+            storage_pool_size: Connections kept open per storage host
+            storage_hosts: Number of storage hosts whose pools are kept
+            session: Use this session for both API and storage requests
+                instead of building pooled ones
+        """
+        self._session = session
+        self._api_adapter = HTTPAdapter(pool_connections=1,
+                                        pool_maxsize=api_pool_size)
+        self._storage_adapter = HTTPAdapter(pool_connections=storage_hosts,
+                                            pool_maxsize=storage_pool_size)
+        self._local = threading.local()
+
+    @property
+    def api_session(self) -> requests.Session:
+        """
+        The calling thread's session for API requests
+        """
+        if self._session is not None:
+            return self._session
+        session = getattr(self._local, 'api_session', None)
+        if session is None:
+            session = self._local.api_session = self._make_session(
+                self._api_adapter)
+        return session
+
+    @property
+    def storage_session(self) -> requests.Session:
+        """
+        The calling thread's session for storage requests
+        """
+        if self._session is not None:
+            return self._session
+        session = getattr(self._local, 'storage_session', None)
+        if session is None:
+            session = self._local.storage_session = self._make_session(
+                self._storage_adapter)
+        return session
+
+    @staticmethod
+    def _make_session(adapter: HTTPAdapter) -> requests.Session:
+        session = requests.Session()
+        session.mount('https://', adapter)
+        session.mount('http://', adapter)
+        return session
+
+    def api_post(self,
+                 url: str,
+                 params: Dict[str, Any],
+                 data: str,
+                 timeout: Optional[float],
+                 stream: bool = False) -> requests.Response:
+        """
+        POST a batch of commands to the API. With `stream`, the body is
+        read as it is consumed, as for the node tree listing.
+        """
+        return self.api_session.post(url,
+                                     params=params,
+                                     data=data,
+                                     timeout=timeout,
+                                     stream=stream)
+
+    def api_get(self, url: str,
+                timeout: Optional[float]) -> requests.Response:
+        """
+        GET an API URL, such as the wait URL of the server-client channel.
+        """
+        return self.api_session.get(url, timeout=timeout)
+
+    def storage_get(self,
+                    url: str,
+                    headers: Optional[Dict[str, str]] = None,
+                    stream: bool = False,
+                    timeout: Optional[float] = None) -> requests.Response:
+        """
+        GET file data from a storage host.
+        """
+        return self.storage_session.get(url,
+                                        headers=headers,
+                                        stream=stream,
+                                        timeout=timeout)
+
+    def storage_post(self, url: str, data: bytes,
+                     timeout: Optional[float]) -> requests.Response:
+        """
+        POST an upload chunk to a storage host.
+        """
+        return self.storage_session.post(url, data=data, timeout=timeout)
+
+    def close(self) -> None:
+        """
+        Close every pooled connection.
+        """
+        if self._session is not None:
+            self._session.close()
+        self._api_adapter.close()
+        self._storage_adapter.close()
@@ -0,0 +1,268 @@
+import time
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from .nodes import Node
+
+
+def _name(node: Dict[str, Any]) -> Optional[str]:
+    attributes = node['a']
+    if attributes:
+        return attributes.get('n')
+    return None
+
+
+class NodeTree:
+    """
+    Decrypted nodes of an account, keyed by handle.
+
+    A Mega instance keeps one of these as its node cache. It is filled by
+    a full fetch and then kept current by applying each change the client
+    makes (moves, renames, new and destroyed nodes) instead of fetching
+    the whole tree again.
+
+    Lookups go through indexes kept up to date by every change: children
+    per parent, handles per node type, handles per (parent, name) and per
+    name, and a memoised table of full paths. The name indexes and the
+    path table are only built on the first lookup that needs them.
+    """
+    def __init__(self, nodes: Iterable[Dict[str, Any]] = ()) -> None:
+        self.nodes: Dict[str, Dict[str, Any]] = {}
+        self.created_at = time.monotonic()
+        # sequence number of the last change applied, see mega.sync
+        self.sn: Optional[str] = None
+        # parent handle -> child handles, in insertion order
+        self._children: Dict[str, Dict[str, None]] = {}
+        # node type -> handles, in insertion order
+        self._types: Dict[int, Dict[str, None]] = {}
+        # (parent handle, name) -> handles, and name -> handles
+        self._child_names: Optional[Dict[Tuple[str, str],
+                                         Dict[str, None]]] = None
+        self._names: Optional[Dict[str, Dict[str, None]]] = None
+        # handle -> full path, filled as paths are asked for
+        self._paths: Dict[str, str] = {}
+        for node in nodes:
+            self.add(node)
+
+    def __len__(self) -> int:
+        return len(self.nodes)
+
+    def __contains__(self, handle: str) -> bool:
+        return handle in self.nodes
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self.nodes)
+
+    def age(self) -> float:
+        """
+        Returns:
+            Seconds since the tree was fetched or last brought up to date
+        """
+        return time.monotonic() - self.created_at
+
+    def touch(self) -> None:
+        """
+        Mark the tree as current, once the changes made since it was
+        fetched have been applied.
+        """
+        self.created_at = time.monotonic()
+
+    def get(self, handle: str) -> Optional[Dict[str, Any]]:
+        return self.nodes.get(handle)
+
+    def items(self):
+        return self.nodes.items()
+
+    def materialize(self) -> None:
+        """
+        Decrypt the attributes of every node that still holds them
+        encrypted, see `mega.nodes.Node`.
+        """
+        for node in self.nodes.values():
+            if isinstance(node, Node):
+                node.materialize()
+
+    def add(self, node: Dict[str, Any]) -> None:
+        """
+        Insert a node, replacing any node with the same handle.
+        """
+        handle = node['h']
+        if handle in self.nodes:
+            self._unindex(self.nodes[handle])
+            self._forget_paths(handle)
+        self.nodes[handle] = node
+        self._index(node)
+
+    def remove(self, handle: str) -> List[str]:
+        """
+        Remove a node together with everything below it.
+
+        Returns:
+            Handles of the removed nodes
+        """
+        self._forget_paths(handle)
+        removed = []
+        pending = [handle]
+        while pending:
+            current = pending.pop()
+            node = self.nodes.pop(current, None)
+            if node is None:
+                continue
+            self._unindex(node)
+            removed.append(current)
+            pending.extend(self._children.pop(current, ()))
+        return removed
+
+    def move(self, handle: str, parent: str) -> None:
+        node = self.nodes.get(handle)
+        if node is not None:
+            self._forget_paths(handle)
+            self._unindex_name(node)
+            self._children.get(node['p'], {}).pop(handle, None)
+            node['p'] = parent
+            self._children.setdefault(parent, {})[handle] = None
+            self._index_name(node)
+
+    def set_attributes(self, handle: str, attributes: Dict[str, Any]) -> None:
+        node = self.nodes.get(handle)
+        if node is not None:
+            self._forget_paths(handle)
+            self._unindex_name(node)
+            node['a'] = attributes
+            self._index_name(node)
+
+    def set_timestamp(self, handle: str, timestamp: int) -> None:
+        node = self.nodes.get(handle)
+        if node is not None:
+            node['ts'] = timestamp
+
+    def children(self, handle: str) -> List[str]:
+        """
+        Returns:
+            Handles of the nodes directly inside `handle`
+        """
+        return list(self._children.get(handle, ()))
+
+    def subtree(self, handle: str) -> List[str]:
+        """
+        Returns:
+            Handles of a node and everything below it
+        """
+        if handle not in self.nodes:
+            return []
+        handles = []
+        pending = [handle]
+        while pending:
+            current = pending.pop()
+            handles.append(current)
+            pending.extend(self._children.get(current, ()))
+        return handles
+
+    def total_size(self, handle: Optional[str] = None) -> int:
+        """
+        Returns:
+            Bytes taken by the files below a node, or by every file
+        """
+        handles = self.nodes if handle is None else self.subtree(handle)
+        return sum(self.nodes[current].get('s') or 0 for current in handles)
+
+    def by_type(self, node_type: int) -> List[str]:
+        """
+        Returns:
+            Handles of the nodes of a numeric type, see
+            `Mega.get_node_by_type`
+        """
+        return list(self._types.get(node_type, ()))
+
+    def named(self, name: str, parent: Optional[str] = None) -> List[str]:
+        """
+        Returns:
+            Handles of the nodes called `name`, only those directly
+            inside `parent` if given
+        """
+        if self._names is None:
+            self._index_names()
+        if parent is None:
+            return list(self._names.get(name, ()))
+        return list(self._child_names.get((parent, name), ()))
+
+    def resolve(self, path: str, root: str) -> Optional[str]:
+        """
+        Follow a path like folder1/folder2 down from `root`, through
+        folders only.
+
+        Returns:
+            Handle of the last folder, None if the path does not exist
+        """
+        handle = root
+        for name in path.split('/'):
+            if name == '':
+                continue
+            for child in self.named(name, handle):
+                if self.nodes[child]['t']:
+                    handle = child
+                    break
+            else:
+                return None
+        return handle
+
+    def path(self, handle: str) -> Optional[str]:
+        """
+        Returns:
+            Full path of a node, e.g. Cloud Drive/folder1/file.txt
+        """
+        path = self._paths.get(handle)
+        if path is not None:
+            return path
+        node = self.nodes.get(handle)
+        if node is None:
+            return None
+        name = _name(node) or ''
+        parent_path = self.path(node['p']) if node['p'] else None
+        path = name if parent_path is None else f'{parent_path}/{name}'
+        self._paths[handle] = path
+        return path
+
+    def _index(self, node: Dict[str, Any]) -> None:
+        handle = node['h']
+        self._children.setdefault(node['p'], {})[handle] = None
+        self._types.setdefault(node['t'], {})[handle] = None
+        if self._names is not None:
+            self._index_name(node)
+
+    def _unindex(self, node: Dict[str, Any]) -> None:
+        handle = node['h']
+        self._children.get(node['p'], {}).pop(handle, None)
+        self._types.get(node['t'], {}).pop(handle, None)
+        if self._names is not None:
+            self._unindex_name(node)
+
+    def _index_name(self, node: Dict[str, Any]) -> None:
+        name = _name(node) if self._names is not None else None
+        if name is not None:
+            self._names.setdefault(name, {})[node['h']] = None
+            self._child_names.setdefault((node['p'], name),
+                                         {})[node['h']] = None
+
+    def _unindex_name(self, node: Dict[str, Any]) -> None:
+        name = _name(node) if self._names is not None else None
+        if name is not None:
+            self._names.get(name, {}).pop(node['h'], None)
+            self._child_names.get((node['p'], name), {}).pop(node['h'], None)
+
+    def _index_names(self) -> None:
+        self._names = {}
+        self._child_names = {}
+        for node in self.nodes.values():
+            self._index_name(node)
+
+    def _forget_paths(self, handle: str) -> None:
+        """
+        Drop the memoised paths of a node that is about to change, and of
+        everything below it if it is a folder.
+        """
+        if not self._paths:
+            return
+        if self._children.get(handle):
+            self._paths.clear()
+        else:
+            self._paths.pop(handle, None)
@@ -0,0 +1,150 @@
+import json
+import random
+
+import pytest
+import requests
+
+from mega import Mega
+from mega.crypto import (a32_to_base64, base64_url_encode, encrypt_attr,
+                         encrypt_key)
+from mega.stream import iter_response
+from mega.transport import HTTPTransport
+
+MASTER_KEY = (0x01020304, 0x05060708, 0x090a0b0c, 0x0d0e0f10)
+USER = 'U_me_____'
+
+
+class Account:
+    """
+    Synthetic account whose nodes are encrypted like the server's,
+    answering the node commands of `Mega._api_request` and the tree
+    listing of `Mega._api_stream`.
+    """
+    def __init__(self, seed=0):
+        self.random = random.Random(seed)
+        self.api_calls = []
+        self.nodes = [
+            {'h': 'ROOT', 'p': '', 'u': USER, 't': 2, 'a': '', 'k': ''},
+            {'h': 'INBOX', 'p': '', 'u': USER, 't': 3, 'a': '', 'k': ''},
+            {'h': 'TRASH', 'p': '', 'u': USER, 't': 4, 'a': '', 'k': ''},
+        ]
+
+    def _handle(self):
+        return ''.join(
+            self.random.choice('ABCDEFGHIJKLMNOPQRSTUVWXYZ0123456789')
+            for _ in range(8))
+
+    def add_folder(self, name, parent='ROOT'):
+        key = [self.random.getrandbits(32) for _ in range(4)]
+        return self._add(1, name, parent, key, key)
+
+    def add_file(self, name, parent='ROOT', size=0):
+        key = [self.random.getrandbits(32) for _ in range(8)]
+        k = (key[0] ^ key[4], key[1] ^ key[5], key[2] ^ key[6],
+             key[3] ^ key[7])
+        return self._add(0, name, parent, key, k, s=size)
+
+    def _add(self, node_type, name, parent, key, k, **extra):
+        node = {
+            'h': self._handle(),
+            'p': parent,
+            'u': USER,
+            't': node_type,
+            'a': base64_url_encode(encrypt_attr({'n': name}, k)),
+            'k': f'{USER}:{a32_to_base64(encrypt_key(key, MASTER_KEY))}',
+            'ts': 1600000000,
+        }
+        node.update(extra)
+        self.nodes.append(node)
+        return node['h']
+
+    def files_response(self):
+        return {
+            'f': [dict(node) for node in self.nodes],
+            'ok': [],
+            's': [],
+            'sn': 'SEQNUM01',
+        }
+
+    def __call__(self, data):
+        commands = data if isinstance(data, list) else [data]
+        self.api_calls.append(commands)
+        command = commands[0]
+        if command['a'] == 'f':
+            return self.files_response()
+        if command['a'] == 'u':
+            return {'p': 'https://storage.invalid/ul'}
+        if command['a'] == 'p':
+            new = command['n'][0]
+            handle = self._handle()
+            node = {
+                'h': handle,
+                'p': command['t'],
+                'u': USER,
+                't': new['t'],
+                'a': new['a'],
+                'k': f"{USER}:{new['k']}",
+                'ts': 1600000000,
+            }
+            self.nodes.append(node)
+            return {'f': [dict(node)]}
+        return 0
+
+    def stream(self, command):
+        """Parse the answer to `command` from a body read in small chunks."""
+        body = json.dumps([self(command)]).encode()
+        return iter_response(body[i:i + 7] for i in range(0, len(body), 7))
+
+    def fetch_count(self):
+        return sum(1 for commands in self.api_calls
+                   if commands[0]['a'] == 'f')
+
+
+@pytest.fixture
+def account():
+    return Account()
+
+
+@pytest.fixture
+def logged_in(account, mocker):
+    """A Mega client answered by `account` instead of the API."""
+    mega = Mega()
+    mega.master_key = MASTER_KEY
+    mocker.patch.object(mega, '_api_request', side_effect=account)
+    mocker.patch.object(mega, '_api_stream', side_effect=account.stream)
+    return mega
+
+
+class ScriptedTransport(HTTPTransport):
+    """Answers /sc requests with scripted responses, in order."""
+    def __init__(self, responses):
+        self.responses = list(responses)
+        self.sc_requests = []
+        self.waits = []
+
+    def _response(self, body):
+        response = requests.Response()
+        response.status_code = 200
+        response._content = json.dumps(body).encode()
+        return response
+
+    def api_post(self, url, params, data, timeout):
+        assert url.endswith('/sc')
+        self.sc_requests.append(params['sn'])
+        return self._response(self.responses.pop(0))
+
+    def api_get(self, url, timeout):
+        self.waits.append(url)
+        return self._response(0)
+
+    def close(self):
+        pass
+
+
+@pytest.fixture
+def sc(logged_in):
+    def script(*responses):
+        logged_in.transport = ScriptedTransport(responses)
+        return logged_in.transport
+
+    return script
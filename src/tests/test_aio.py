@@ -0,0 +1,150 @@
+import asyncio
+import json
+import os
+
+import pytest
+
+from mega import Mega
+from mega.aio import AsyncMega
+from mega.crypto import (a32_to_base64, a32_to_str, base64_url_encode,
+                         encrypt_key, encrypt_key_bytes)
+from mega.mega import NetworkError
+
+from .conftest import MASTER_KEY, Account
+
+SALT = base64_url_encode(bytes(range(32)))
+STORAGE = 'https://storage.invalid'
+
+
+class AsyncTransport:
+    """
+    Async transport answering the API from an `Account`, logins to it
+    with password 'secret', and storage requests from memory.
+    """
+    def __init__(self, account):
+        self.account = account
+        self.uploads = {}
+        self.ranges = []
+        self.fail_ranges = False
+
+    async def api_post(self, url, params, data, timeout):
+        await asyncio.sleep(0)
+        command = json.loads(data)[0]
+        if command['a'] == 'us0':
+            result = {'s': SALT, 'v': 2}
+        elif command['a'] == 'us':
+            password_key, user_hash = Mega._password_key(
+                command['user'], 'secret', {'s': SALT})
+            assert command['uh'] == user_hash
+            challenge = os.urandom(16)
+            result = {
+                'k': a32_to_base64(encrypt_key(MASTER_KEY, password_key)),
+                'tsid': base64_url_encode(
+                    challenge +
+                    encrypt_key_bytes(challenge, a32_to_str(MASTER_KEY)))
+            }
+        elif command['a'] == 'g':
+            node = next(node for node in self.account.nodes
+                        if node['h'] == command['n'])
+            data = self.uploads[node['h']]
+            result = {'g': f'{STORAGE}/dl', 's': len(data), 'at': node['a']}
+            self.downloading = data
+        else:
+            result = self.account(command)
+            if command['a'] == 'p' and command['n'][0]['t'] == 0:
+                handle = result['f'][0]['h']
+                self.uploads[handle] = b''.join(
+                    self.uploads.pop(start)
+                    for start in sorted(self.uploads))
+        return json.dumps([result]).encode()
+
+    async def storage_post(self, url, data, timeout):
+        await asyncio.sleep(0)
+        self.uploads[int(url.rsplit('/', 1)[1])] = data
+        return b'UPHANDLE'
+
+    async def storage_get(self, url, headers=None, timeout=None):
+        await asyncio.sleep(0)
+        start, end = map(int, headers['Range'][6:].split('-'))
+        self.ranges.append(start)
+        if self.fail_ranges and start:
+            raise NetworkError('Network error: reset')
+        return self.downloading[start:end + 1]
+
+    async def close(self):
+        pass
+
+
+@pytest.fixture
+def transport():
+    return AsyncTransport(Account())
+
+
+def _run(transport, coroutine_function, **options):
+    async def main():
+        options['async_transport'] = transport
+        async with AsyncMega(options) as mega:
+            await mega.login('Someone@Example.com', 'secret')
+            return await coroutine_function(mega)
+
+    return asyncio.run(main())
+
+
+def test_login_and_lookups(transport):
+    docs = transport.account.add_folder('docs')
+    transport.account.add_file('f.txt', parent=docs, size=3)
+
+    async def lookups(mega):
+        assert mega.master_key == MASTER_KEY
+        assert mega.sid
+        assert (await mega.find('docs/f.txt'))[1]['s'] == 3
+        assert list(await mega.get_files_in_node(docs))
+        assert mega.root_id == 'ROOT'
+        return await mega.get_files()
+
+    files = _run(transport, lookups)
+
+    assert {node['a']['n'] for node in files.values() if node['t'] == 1} == {
+        'docs'
+    }
+    assert transport.account.fetch_count() == 1
+
+
+@pytest.mark.parametrize('size', [0, 1000, 700000])
+def test_upload_download(transport, tmp_path, size):
+    source = tmp_path / 'source.bin'
+    source.write_bytes(os.urandom(size))
+    out = tmp_path / 'out'
+    out.mkdir()
+
+    async def round_trip(mega):
+        folders = await mega.create_folder('docs/sub')
+        await mega.upload(str(source), dest=folders['sub'], workers=3)
+        file = await mega.find('docs/sub/source.bin')
+        await mega.move(file[0], 4)
+        assert (await mega.find('source.bin', exclude_deleted=True)) is None
+        return await mega.download(file, str(out), workers=3)
+
+    path = _run(transport, round_trip)
+
+    assert path.read_bytes() == source.read_bytes()
+    assert transport.account.fetch_count() == 1
+
+
+def test_failed_chunk_fails_download(transport, tmp_path):
+    source = tmp_path / 'source.bin'
+    source.write_bytes(os.urandom(600000))
+
+    async def download(mega):
+        await mega.upload(str(source))
+        transport.fail_ranges = True
+        await mega.download(await mega.find('source.bin'), str(tmp_path))
+
+    with pytest.raises(NetworkError):
+        _run(transport, download, download_workers=2)
+    assert transport.ranges[0] == 0
+
+
+def test_unsupported_options(transport):
+    with pytest.raises(ValueError):
+        AsyncMega({'async_transport': transport, 'node_cache_path': 'x'})
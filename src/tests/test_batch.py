@@ -0,0 +1,140 @@
+import json
+
+import pytest
+import requests
+import requests_mock
+from tenacity import wait_none
+
+from mega import Mega
+from mega.errors import RequestError
+
+
+@pytest.fixture
+def mega():
+    return Mega({'session': requests.Session()})
+
+
+@pytest.fixture
+def api(mega):
+    """Register the API response, returning its request history."""
+    with requests_mock.Mocker(session=mega.transport.api_session) as m:
+        yield lambda text: m.post(f'{mega.schema}://g.api.{mega.domain}/cs',
+                                  text=text)
+
+
+def test_batch_sends_one_request(mega, api):
+    history = api('[0, -9, 0]')
+
+    with mega.batch() as batch:
+        first = batch.move('aaa', 'ttt')
+        missing = batch.destroy('bbb')
+        third = batch.add({'a': 'd', 'n': 'ccc'})
+
+    assert history.call_count == 1
+    assert [command['n'] for command in history.last_request.json()] == [
+        'aaa', 'bbb', 'ccc'
+    ]
+    assert history.last_request.json()[0] == {
+        'a': 'm',
+        'n': 'aaa',
+        't': 'ttt',
+        'i': mega.request_id
+    }
+    assert first.result() == 0
+    assert third.result() == 0
+    with pytest.raises(RequestError) as exc:
+        missing.result()
+    assert exc.value.code == -9
+
+
+def test_batch_splits_into_max_commands(mega, api):
+    history = api(
+        lambda request, context: json.dumps([0] * len(request.json())))
+
+    batch = mega.batch(max_commands=2)
+    results = [batch.destroy(str(i)) for i in range(5)]
+    assert len(batch) == 5
+    assert batch.send() == [0] * 5
+
+    assert history.call_count == 3
+    assert [result.result() for result in results] == [0] * 5
+    assert len(batch) == 0
+
+
+def test_batch_request_error_fails_every_command(mega, api):
+    api('-15')
+
+    batch = mega.batch()
+    result = batch.destroy('aaa')
+    with pytest.raises(RequestError):
+        batch.send()
+
+    with pytest.raises(RequestError) as exc:
+        result.result()
+    assert exc.value.code == -15
+
+
+def test_batch_short_response_fails_the_rest(mega, api):
+    api('[0]')
+
+    batch = mega.batch()
+    first = batch.destroy('aaa')
+    second = batch.destroy('bbb')
+    with pytest.raises(RequestError):
+        batch.send()
+
+    assert first.exception() is not None
+    with pytest.raises(RequestError):
+        second.result(timeout=0)
+
+
+def test_batch_apply_error_fails_the_rest(mega, api, mocker):
+    api('[0, 0, 0]')
+    mocker.patch.object(mega, '_apply_command',
+                        side_effect=[None, KeyError('h'), None])
+
+    batch = mega.batch()
+    results = [batch.destroy(name) for name in ('aaa', 'bbb', 'ccc')]
+    with pytest.raises(KeyError):
+        batch.send()
+
+    assert results[0].result(timeout=0) == 0
+    for result in results[1:]:
+        with pytest.raises(KeyError):
+            result.result(timeout=0)
+
+
+def test_batch_retries_eagain(mega, monkeypatch):
+    monkeypatch.setattr(Mega._api_post.retry, 'wait', wait_none())
+    with requests_mock.Mocker(session=mega.transport.api_session) as m:
+        history = m.post(f'{mega.schema}://g.api.{mega.domain}/cs',
+                         [{'text': '[-3, 0]'}, {'text': '[0, 0]'}])
+        with mega.batch() as batch:
+            first = batch.destroy('aaa')
+            batch.destroy('bbb')
+
+    assert history.call_count == 2
+    assert first.result() == 0
+
+
+def test_batch_not_sent_on_exception(mega, api):
+    history = api('[0]')
+    with pytest.raises(KeyError):
+        with mega.batch() as batch:
+            result = batch.destroy('aaa')
+            raise KeyError
+
+    assert history.call_count == 0
+    assert result.cancelled()
+
+
+def test_empty_trash_destroys_in_one_request(mega, api, mocker):
+    mocker.patch.object(mega, 'get_files_in_node',
+                        return_value={'a': {}, 'b': {}, 'c': {}})
+    history = api('[0, 0, 0]')
+
+    assert mega.empty_trash() == 0
+    assert history.call_count == 1
+    assert [command['n'] for command in history.last_request.json()] == [
+        'a', 'b', 'c'
+    ]
@@ -0,0 +1,113 @@
+import time
+
+import pytest
+
+from mega import Mega
+from mega.crypto import a32_to_str
+
+from .conftest import MASTER_KEY, ScriptedTransport
+
+
+@pytest.fixture
+def client(account, mocker, tmp_path):
+    """Makes clients of `account` sharing one on-disk node cache."""
+    def make(*sc_responses, master_key=MASTER_KEY):
+        mega = Mega({
+            'node_cache_path': str(tmp_path / 'nodes.db'),
+            'transport': ScriptedTransport(sc_responses),
+        })
+        mega.master_key = master_key
+        mocker.patch.object(mega, '_api_request', side_effect=account)
+        mocker.patch.object(mega, '_api_stream', side_effect=account.stream)
+        return mega
+
+    return make
+
+
+def _packet_node(account, handle):
+    return dict(next(node for node in account.nodes if node['h'] == handle))
+
+
+def test_warm_start_fetches_only_changes(client, account):
+    docs = account.add_folder('docs')
+    file = account.add_file('a.txt', parent=docs, size=10)
+    cold = client()
+    cold.get_files()
+    new = account.add_folder('new')
+    warm = client({
+        'a': [{
+            'a': 't',
+            't': {
+                'f': [_packet_node(account, new)]
+            }
+        }],
+        'sn': 'SEQNUM02'
+    }, {'w': 'https://wait.invalid'})
+
+    assert warm.find('docs/a.txt') == cold.find('docs/a.txt')
+    assert warm.find('new')[0] == new
+    assert warm.root_id == 'ROOT'
+    assert warm.get_node_by_type(4)[0] == 'TRASH'
+    assert warm.transport.sc_requests == ['SEQNUM01', 'SEQNUM02']
+    assert warm.transport.waits == []
+    assert account.fetch_count() == 1
+
+    again = client({'w': 'https://wait.invalid'})
+    assert again.find('new')[0] == new
+    assert again.sync().sn == 'SEQNUM02'
+    assert again.find(handle=file)['s'] == 10
+
+
+def test_key_material_is_encrypted(client, account, tmp_path):
+    file = account.add_file('a.txt')
+    mega = client()
+    key = mega.find(handle=file)['key']
+    mega.close()
+
+    stored = (tmp_path / 'nodes.db').read_bytes()
+    assert a32_to_str(key) not in stored
+    assert a32_to_str(key[:4]) not in stored
+
+
+def test_own_changes_are_stored(client, account):
+    file = account.add_file('a.txt')
+    cold = client()
+    cold.rename(cold.find('a.txt'), 'b.txt')
+
+    warm = client({'w': 'https://wait.invalid'})
+    assert warm.find('b.txt')[0] == file
+    assert warm.find('a.txt') is None
+    assert account.fetch_count() == 1
+
+
+def test_expired_tree_fetches_only_changes(client, account):
+    client().get_files()
+    new = account.add_folder('new')
+    warm = client({'w': 'https://wait.invalid'}, {
+        'a': [{'a': 't', 't': {'f': [_packet_node(account, new)]}}],
+        'sn': 'SEQNUM02'
+    }, {'w': 'https://wait.invalid'})
+    warm.node_cache_ttl = 0.05
+
+    assert warm.find('new') is None
+    time.sleep(0.1)
+    assert warm.find('new')[0] == new
+    assert warm.transport.sc_requests == ['SEQNUM01', 'SEQNUM01', 'SEQNUM02']
+    assert account.fetch_count() == 1
+
+
+def test_out_of_date_cache_is_fetched_again(client, account):
+    client().get_files()
+    account.add_folder('docs')
+
+    warm = client(-6)
+
+    assert warm.find('docs')
+    assert account.fetch_count() == 2
+
+
+def test_accounts_are_kept_apart(client, account):
+    client().get_files()
+    other = client(master_key=(1, 2, 3, 4))
+    other.get_files()
+    assert account.fetch_count() == 2
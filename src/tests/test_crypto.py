@@ -1,6 +1,15 @@
+import random
+
 import pytest
+from Crypto.Cipher import AES
 
-from mega.crypto import get_chunks
+from mega import Mega
+from mega.crypto import (get_chunks, a32_to_str, str_to_a32, MacAccumulator,
+                         prepare_key, prepare_key_bytes, aes_cbc_encrypt,
+                         aes_cbc_decrypt, aes_ecb_cipher, encrypt_key,
+                         decrypt_key, stringhash, a32_to_base64,
+                         encrypt_key_bytes, decrypt_key_bytes,
+                         base64_url_encode)
 
 
 @pytest.mark.parametrize('file_size, exp_result', [
@@ -18,3 +27,135 @@ def test_get_chunks(file_size, exp_result):
     result = tuple(get_chunks(file_size))
 
     assert result == exp_result
+
+
+def _reference_file_mac(data, key, iv):
+    """Block-at-a-time CBC-MAC, as the transfer loops used to compute it."""
+    iv_str = a32_to_str([iv[0], iv[1], iv[0], iv[1]])
+    mac_encryptor = AES.new(key, AES.MODE_CBC, b'\0' * 16)
+    mac_str = b'\0' * 16
+    for chunk_start, chunk_size in get_chunks(len(data)):
+        chunk = data[chunk_start:chunk_start + chunk_size]
+        if not chunk:
+            continue
+        encryptor = AES.new(key, AES.MODE_CBC, iv_str)
+        for i in range(0, len(chunk), 16):
+            block = chunk[i:i + 16]
+            block += b'\0' * (16 - len(block))
+            last = encryptor.encrypt(block)
+        mac_str = mac_encryptor.encrypt(last)
+    return mac_str
+
+
+@pytest.mark.parametrize('size', [0, 1, 15, 16, 17, 1000, 131072, 131073,
+                                  131072 + 16, 1000000])
+def test_mac_accumulator_matches_block_loop(size):
+    rng = random.Random(size)
+    key = bytes(rng.getrandbits(8) for _ in range(16))
+    iv = (rng.getrandbits(32), rng.getrandbits(32))
+    data = bytes(rng.getrandbits(8) for _ in range(size))
+
+    mac = MacAccumulator(key, iv)
+    for chunk_start, chunk_size in get_chunks(size):
+        mac.update(data[chunk_start:chunk_start + chunk_size])
+
+    expected = _reference_file_mac(data, key, iv)
+    file_mac = str_to_a32(expected)
+    assert mac.digest() == expected
+    assert mac.meta_mac() == (file_mac[0] ^ file_mac[1],
+                              file_mac[2] ^ file_mac[3])
+
+
+# outputs of the 0x10000-round loop that prepare_key used to run
+@pytest.mark.parametrize('password, expected', [
+    ('', (0x93c467e3, 0x7db0c7a4, 0xd1be3f81, 0x0152cb56)),
+    ('a', (0x6dd9f7ec, 0xb24689c4, 0x35a14f7c, 0x51da434d)),
+    ('password', (0x64033972, 0x5e6ebd13, 0xa25f0052, 0x129f7cb1)),
+    ('sixteen chars!!!', (0xe4f94f51, 0xc736a7bc, 0x0b32f36b, 0x6ead9140)),
+    ('a longer password of 34 characters',
+     (0x498b2050, 0xec1c0e12, 0xf51fbaab, 0x588dcb92)),
+    ('p\xe4ssw\xf6rd', (0xf38493e3, 0x54193dd0, 0x28c8ed07, 0xd52c7a25)),
+])
+def test_prepare_key(password, expected):
+    assert tuple(prepare_key(str_to_a32(password))) == expected
+    assert prepare_key_bytes(password.encode('latin-1')) == a32_to_str(
+        expected)
+
+
+@pytest.mark.parametrize('size', [16, 32, 48, 160])
+def test_cbc_helpers_match_cbc_mode(size):
+    rng = random.Random(size)
+    key = bytes(rng.getrandbits(8) for _ in range(16))
+    data = bytes(rng.getrandbits(8) for _ in range(size))
+    expected = AES.new(key, AES.MODE_CBC, b'\0' * 16).encrypt(data)
+
+    assert aes_cbc_encrypt(data, key) == expected
+    assert aes_cbc_decrypt(expected, key) == data
+
+
+@pytest.mark.parametrize('helper', [aes_cbc_encrypt, aes_cbc_decrypt])
+def test_cbc_helpers_reject_partial_blocks(helper):
+    with pytest.raises(ValueError):
+        helper(b'\0' * 17, b'k' * 16)
+
+
+def test_ciphers_are_reused():
+    key = (1, 2, 3, 4)
+    aes_ecb_cipher.cache_clear()
+    for _ in range(3):
+        decrypt_key(encrypt_key((5, 6, 7, 8, 9, 10, 11, 12), key), key)
+
+    assert aes_ecb_cipher.cache_info().misses == 1
+
+
+def test_password_keys_stay_out_of_the_cache():
+    password_key = (1, 2, 3, 4)
+    master_key = (5, 6, 7, 8)
+    challenge = a32_to_str((9, 10, 11, 12))
+    response = {
+        'k': a32_to_base64(encrypt_key(master_key, password_key)),
+        'tsid': base64_url_encode(
+            challenge + encrypt_key_bytes(challenge, a32_to_str(master_key)))
+    }
+    aes_ecb_cipher.cache_clear()
+
+    mega = Mega()
+    mega._login_process(response, password_key)
+    misses = aes_ecb_cipher.cache_info().misses
+    aes_ecb_cipher(a32_to_str(password_key))
+
+    assert mega.master_key == master_key
+    assert mega.sid == response['tsid']
+    assert aes_ecb_cipher.cache_info().misses == misses + 1
+
+
+def test_stringhash():
+    aeskey = (0x11111111, 0x22222222, 0x33333333, 0x44444444)
+    h32 = [0, 0, 0, 0]
+    for i, value in enumerate(str_to_a32('first.last@example.com')):
+        h32[i % 4] ^= value
+    h = a32_to_str(h32)
+    for _ in range(0x4000):
+        h = AES.new(a32_to_str(aeskey), AES.MODE_ECB).encrypt(h)
+    h32 = str_to_a32(h)
+
+    assert stringhash('first.last@example.com',
+                      aeskey) == a32_to_base64((h32[0], h32[2]))
+
+
+@pytest.mark.parametrize('length', [0, 4, 8, 164])
+def test_key_helpers_match_block_loop(length):
+    rng = random.Random(length)
+    key = tuple(rng.getrandbits(32) for _ in range(4))
+    a = tuple(rng.getrandbits(32) for _ in range(length))
+    expected = ()
+    for i in range(0, length, 4):
+        cipher = AES.new(a32_to_str(key), AES.MODE_CBC, b'\0' * 16)
+        expected += str_to_a32(cipher.encrypt(a32_to_str(a[i:i + 4])))
+
+    assert encrypt_key(a, key) == expected
+    assert decrypt_key(expected, key) == a
+    assert encrypt_key_bytes(a32_to_str(a),
+                             a32_to_str(key)) == a32_to_str(expected)
+    assert decrypt_key_bytes(a32_to_str(expected),
+                             a32_to_str(key)) == a32_to_str(a)
@@ -12,3 +12,10 @@ def test_request_error(code, exp_message):
     assert exc.code == code
     assert exc.message == exp_message
     assert str(exc) == exp_message
+
+
+def test_request_error_message():
+    exc = RequestError('File not accessible anymore')
+
+    assert exc.code is None
+    assert str(exc) == 'File not accessible anymore'
@@ -0,0 +1,164 @@
+import asyncio
+import os
+import threading
+
+import pytest
+
+from mega import Mega
+from mega.aio import AsyncMega
+from mega.errors import RequestError
+from mega.local import AsyncLocalTransport, LocalServer, LocalTransport
+from mega.metrics import CallbackSink
+from mega.mega import AuthenticationError
+
+EMAIL = 'user@example.com'
+
+
+@pytest.fixture(scope='module')
+def server():
+    server = LocalServer(rsa_bits=1024, seed=1)
+    server.add_user(EMAIL, 'secret')
+    server.add_user('old@example.com', 'secret', version=1)
+    return server
+
+
+def _client(server, **options):
+    options['transport'] = LocalTransport(server)
+    return Mega(options)
+
+
+@pytest.mark.parametrize('email', [EMAIL, 'Old@Example.com'])
+def test_login(server, email):
+    mega = _client(server).login(email, 'secret')
+
+    assert mega.sid
+    assert mega.get_user()['email'] == email.lower()
+    assert mega.get_node_by_type(2)
+
+
+def test_wrong_password(server):
+    with pytest.raises(AuthenticationError):
+        _client(server).login(EMAIL, 'wrong')
+
+
+def test_anonymous_login(server):
+    mega = _client(server).login()
+
+    assert mega.sid
+    assert mega.create_folder('mine')
+
+
+@pytest.mark.parametrize('workers', [1, 4])
+def test_transfers(server, tmp_path, workers):
+    data = os.urandom(1500000)
+    seeded = server.add_file(EMAIL, f'seeded{workers}.bin', data)
+    source = tmp_path / 'source.bin'
+    source.write_bytes(data[::-1])
+    mega = _client(server, download_workers=workers,
+                   upload_workers=workers).login(EMAIL, 'secret')
+
+    folder = mega.create_folder(f'up{workers}')[f'up{workers}']
+    mega.upload(str(source), dest=folder)
+
+    seeded_node = (seeded, mega.find(handle=seeded))
+    assert mega.download(seeded_node, str(tmp_path)).read_bytes() == data
+    uploaded = mega.find(f'up{workers}/source.bin')
+    assert uploaded[1]['s'] == len(data)
+    assert mega.download(uploaded, str(tmp_path),
+                         'back.bin').read_bytes() == data[::-1]
+
+
+def test_links(server, tmp_path):
+    data = os.urandom(1000)
+    folder = server.add_folder(EMAIL, 'shared')
+    server.add_file(EMAIL, 'public.bin', data, parent=folder)
+    samples = []
+    mega = _client(server, metrics=CallbackSink(samples.append)).login(
+        EMAIL, 'secret')
+
+    file_link = mega.export('shared/public.bin')
+    folder_link = mega.export('shared')
+
+    assert folder_link.startswith('https://mega.co.nz/#F!')
+    assert mega.export('shared') == folder_link
+    assert [sample.command for sample in samples].count('f') == 1
+    anonymous = _client(server)
+    assert anonymous.get_public_url_info(file_link) == {
+        'size': 1000,
+        'name': 'public.bin'
+    }
+    assert anonymous.download_url(file_link,
+                                  str(tmp_path)).read_bytes() == data
+    mega.destroy(folder)
+    with pytest.raises(RequestError):
+        anonymous.get_public_url_info(file_link)
+
+
+def test_changes_from_another_client(server):
+    mega = _client(server).login(EMAIL, 'secret')
+    other = _client(server).login(EMAIL, 'secret')
+    assert mega.sync().poll(wait=False) == []
+
+    folder = other.create_folder('watched')['watched']
+    other.move(folder, 4)
+    events = mega.sync().catch_up()
+
+    assert [(event.kind, event.handle) for event in events] == [
+        ('new', folder), ('move', folder)
+    ]
+    assert mega.find('watched')[1]['p'] == mega.trashbin_id
+
+
+def test_wait_ends_on_change(server):
+    mega = _client(server).login(EMAIL, 'secret')
+    mega.get_files()
+    polled = []
+    waiting = threading.Thread(
+        target=lambda: polled.extend(mega.sync().poll()))
+    waiting.start()
+
+    wake = server.add_folder(EMAIL, 'wake')
+    waiting.join(timeout=10)
+
+    assert not waiting.is_alive()
+    # woken by the change, or given it if it came before the wait
+    events = polled + mega.sync().poll(wait=False)
+    assert [(event.kind, event.handle) for event in events] == [('new', wake)]
+
+
+def test_async_client(server, tmp_path):
+    data = os.urandom(700000)
+    server.add_file(EMAIL, 'async.bin', data)
+
+    async def main():
+        options = {
+            'async_transport': AsyncLocalTransport(server),
+            'download_workers': 3
+        }
+        async with AsyncMega(options) as mega:
+            await mega.login(EMAIL, 'secret')
+            file = await mega.find('async.bin')
+            return await mega.download(file, str(tmp_path))
+
+    assert asyncio.run(main()).read_bytes() == data
+
+
+def test_rejected_chunk(server):
+    mega = _client(server).login(EMAIL, 'secret')
+    url = mega._api_request({'a': 'u', 's': 100})['p']
+
+    assert mega.transport.storage_post(url + '/8', b'x', None).text == '-7'
+    assert mega.transport.storage_post(url + '/0', b'x' * 100,
+                                       None).text != ''
+
+
+def test_add_tree():
+    server = LocalServer(rsa_bits=1024, seed=2)
+    server.add_user(EMAIL, 'secret')
+    handles = server.add_tree(EMAIL, 25)
+    mega = _client(server).login(EMAIL, 'secret')
+
+    assert mega.find('node 20')[0] == handles[20]
+    assert mega.find('node 10/node 20')
+    assert mega.find('node 7')[1]['s'] == 1024
+    assert len(mega.get_files()) == 28
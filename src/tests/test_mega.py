@@ -6,12 +6,15 @@ import requests_mock
 import pytest
 
 from mega import Mega
+from mega.local import LocalServer, LocalTransport
 
 TEST_CONTACT = 'test@mega.co.nz'
 TEST_PUBLIC_URL = (
     'https://mega.nz/#!hYVmXKqL!r0d0-WRnFwulR_shhuEDwrY1Vo103-am1MyUy8oV6Ps')
 TEST_FILE = os.path.basename(__file__)
 MODULE = 'mega.mega'
+LOCAL_EMAIL = 'test@example.com'
+LOCAL_PASSWORD = 'password'
 
 
 @pytest.fixture
@@ -19,10 +22,23 @@ def folder_name():
     return 'mega.py_testfolder_{0}'.format(random.random())
 
 
+@pytest.fixture(scope='module')
+def local_server():
+    server = LocalServer(rsa_bits=1024)
+    server.add_user(LOCAL_EMAIL, LOCAL_PASSWORD)
+    return server
+
+
 @pytest.fixture
-def mega(folder_name):
-    mega_ = Mega()
-    mega_.login(email=os.environ['EMAIL'], password=os.environ['PASS'])
+def mega(folder_name, request):
+    if 'EMAIL' in os.environ:
+        mega_ = Mega()
+        mega_.login(email=os.environ['EMAIL'], password=os.environ['PASS'])
+    else:
+        # no account given: run against the bundled stand-in server
+        server = request.getfixturevalue('local_server')
+        mega_ = Mega({'transport': LocalTransport(server)})
+        mega_.login(email=LOCAL_EMAIL, password=LOCAL_PASSWORD)
     created_nodes = mega_.create_folder(folder_name)
     yield mega_
     node_id = next(iter(created_nodes.values()))
@@ -112,8 +128,17 @@ class TestExport:
             assert result_public_share_url.startswith('https://mega.co.nz/#!')
 
 
-def test_import_public_url(mega):
-    resp = mega.import_public_url(TEST_PUBLIC_URL)
+@pytest.fixture
+def public_url(mega, folder_name):
+    if 'EMAIL' in os.environ:
+        return TEST_PUBLIC_URL
+    folder = mega.find(folder_name)
+    mega.upload(__file__, dest=folder[0], dest_filename='public.py')
+    return mega.export(f'{folder_name}/public.py')
+
+
+def test_import_public_url(mega, public_url):
+    resp = mega.import_public_url(public_url)
     file_handle = mega.get_id_from_obj(resp)
     resp = mega.destroy(file_handle)
     assert isinstance(resp, int)
@@ -0,0 +1,98 @@
+import pytest
+import requests
+import requests_mock
+from tenacity import wait_none
+
+from mega import Mega
+from mega.errors import RequestError
+from mega.metrics import (ApiSample, CallbackSink, MemorySink,
+                          PrometheusSink)
+from mega.mega import NetworkError
+
+
+@pytest.fixture
+def sink():
+    return MemorySink(buckets=(0.5, 10))
+
+
+@pytest.fixture
+def mega(sink):
+    return Mega({'session': requests.Session(), 'metrics': sink})
+
+
+@pytest.fixture
+def api(mega, monkeypatch):
+    """Register the API responses, returning their request history."""
+    monkeypatch.setattr(Mega._api_post.retry, 'wait', wait_none())
+    with requests_mock.Mocker(session=mega.transport.api_session) as m:
+        yield lambda *responses: m.post(
+            f'{mega.schema}://g.api.{mega.domain}/cs', responses)
+
+
+def test_counts_per_command(mega, api, sink):
+    api({'text': '[-3]'}, {'text': '[{"q": 1}]'}, {'text': '[-9]'},
+        {'text': '[0, -11]'})
+
+    assert mega.get_user() == {'q': 1}
+    with pytest.raises(RequestError):
+        mega.destroy('aaa')
+    with mega.batch() as batch:
+        batch.destroy('bbb')
+        batch.destroy('ccc')
+
+    snapshot = sink.snapshot()
+    assert set(snapshot) == {'ug', 'd', 'batch'}
+    assert snapshot['ug']['requests'] == 2
+    assert snapshot['ug']['retries'] == 1
+    assert snapshot['ug']['errors'] == {-3: 1}
+    assert snapshot['ug']['response_bytes'] == len('[-3]') + len('[{"q": 1}]')
+    assert snapshot['ug']['request_bytes'] == 2 * len('[{"a": "ug"}]')
+    assert snapshot['d']['errors'] == {-9: 1}
+    assert snapshot['batch']['errors'] == {-11: 1}
+    assert snapshot['d']['latency_buckets'] == [(0.5, 1), (10, 1),
+                                                (float('inf'), 1)]
+
+
+def test_network_error(mega, api, sink):
+    api({'exc': requests.ConnectionError})
+
+    with pytest.raises(NetworkError):
+        mega.get_user()
+
+    assert sink.snapshot()['ug']['errors'] == {'network': 1}
+
+
+def test_streamed_listing(mega, api):
+    samples = []
+    mega.metrics = CallbackSink(samples.append)
+    body = '[{"f": [{"h": "a", "t": 2}], "ok": []}]'
+    api({'text': body})
+
+    assert list(mega._api_stream({'a': 'f', 'c': 1}))
+    assert [(sample.command, sample.response_bytes, sample.errors)
+            for sample in samples] == [('f', len(body), ())]
+
+
+def test_off_by_default():
+    assert Mega().metrics is None
+
+
+def test_prometheus_text():
+    sink = PrometheusSink(buckets=(0.1, 1))
+    sink.record(ApiSample('f', 0.5, 30, 2000))
+    sink.record(ApiSample('f', 2.0, 30, 8, (-3, ), retried=True))
+
+    text = sink.render()
+
+    for line in ('# TYPE mega_api_requests_total counter',
+                 'mega_api_requests_total{command="f"} 2',
+                 'mega_api_retries_total{command="f"} 1',
+                 'mega_api_errors_total{command="f",code="-3"} 1',
+                 'mega_api_response_bytes_total{command="f"} 2008',
+                 '# TYPE mega_api_latency_seconds histogram',
+                 'mega_api_latency_seconds_bucket{command="f",le="0.1"} 0',
+                 'mega_api_latency_seconds_bucket{command="f",le="1"} 1',
+                 'mega_api_latency_seconds_bucket{command="f",le="+Inf"} 2',
+                 'mega_api_latency_seconds_sum{command="f"} 2.5',
+                 'mega_api_latency_seconds_count{command="f"} 2'):
+        assert line in text.splitlines()
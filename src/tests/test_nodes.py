@@ -0,0 +1,142 @@
+import json
+
+import pytest
+
+from mega.crypto import (a32_to_str, base64_url_encode, decrypt_attr,
+                         encrypt_attr)
+from mega.nodes import Node
+from mega.tree import NodeTree
+
+FILE_KEY = (1, 2, 3, 4, 5, 6, 7, 8)
+K = (1 ^ 5, 2 ^ 6, 3 ^ 7, 4 ^ 8)
+
+
+@pytest.fixture
+def node():
+    return Node(
+        {
+            'h': 'H',
+            'p': 'P',
+            'u': 'U',
+            't': 0,
+            's': 10,
+            'ts': 1600000000,
+            'a': base64_url_encode(encrypt_attr({'n': 'name'}, K)),
+            'k': 'U:encrypted',
+            'fa': '123:0*abc',
+        }, a32_to_str(FILE_KEY))
+
+
+def test_reads_like_a_dict(node):
+    assert dict(node) == {
+        'h': 'H',
+        'p': 'P',
+        'u': 'U',
+        't': 0,
+        's': 10,
+        'ts': 1600000000,
+        'a': {'n': 'name'},
+        'k': K,
+        'key': FILE_KEY,
+        'iv': (5, 6, 0, 0),
+        'meta_mac': (7, 8),
+        'fa': '123:0*abc',
+    }
+    assert node == dict(node)
+    assert ('h', node) == ('h', dict(node))
+    assert json.loads(json.dumps(dict(node)))['a']['n'] == 'name'
+    assert node.get('shared_folder_key') is None
+    assert 'iv' in node and 'shared_folder_key' not in node
+    with pytest.raises(KeyError):
+        node['missing']
+
+
+def test_folder_fields():
+    folder = Node({'h': 'F', 'p': 'P', 'u': 'U', 't': 1, 'a': {}},
+                  a32_to_str(K))
+    assert folder['k'] == folder['key'] == K
+    assert 's' not in folder and 'iv' not in folder
+
+
+def test_key_less_node_keeps_server_key():
+    node = Node({'h': 'R', 'p': '', 'u': 'U', 't': 2, 'a': {}, 'k': ''})
+    assert node['k'] == ''
+    assert 'key' not in node
+
+
+def test_attributes_decrypted_on_first_read(node, mocker):
+    decrypt = mocker.patch('mega.nodes.decrypt_attr', wraps=decrypt_attr)
+
+    assert node['h'] == 'H'
+    assert 'a' in node
+    assert not node.decrypted
+    decrypt.assert_not_called()
+
+    assert node['a'] == {'n': 'name'}
+    assert node.get('a') == {'n': 'name'}
+    assert node.decrypted
+    decrypt.assert_called_once()
+
+
+def test_rename_during_decryption_wins(node, mocker):
+    tree = NodeTree([node])
+
+    def rename_meanwhile(data, key):
+        # another thread renames the node while this one decrypts
+        tree.set_attributes('H', {'n': 'renamed'})
+        return decrypt_attr(data, key)
+
+    mocker.patch('mega.nodes.decrypt_attr', side_effect=rename_meanwhile)
+
+    assert node['a'] == {'n': 'renamed'}
+    assert tree.named('renamed') == ['H']
+    assert tree.named('name') == []
+
+
+def test_writes(node):
+    node['a'] = {'n': 'other'}
+    node['p'] = 'Q'
+    node['ts'] = 1
+    node['custom'] = True
+    del node['s']
+
+    assert node.decrypted
+    assert (node['a'], node['p'], node['ts'], node['custom']) == ({
+        'n': 'other'
+    }, 'Q', 1, True)
+    assert 's' not in node
+    with pytest.raises(TypeError):
+        node['iv'] = (0, 0, 0, 0)
+
+
+def test_undecryptable_attributes_read_as_none(node):
+    node['key'] = (0, ) * 8
+    assert node['a'] is None
+
+
+def test_tree_load_defers_attributes(logged_in, account):
+    docs = account.add_folder('docs')
+    file = account.add_file('a.txt', parent=docs)
+
+    files = logged_in.get_files()
+    assert not any(node.decrypted for node in (files[docs], files[file]))
+    assert logged_in.get_files_in_node(docs)
+    assert not files[file].decrypted
+
+    assert logged_in.find('docs/a.txt')[0] == file
+    logged_in.materialize()
+    assert all(node.decrypted for node in files.values())
+    assert files[file]['a'] == {'n': 'a.txt'}
+
+
+def test_undecryptable_nodes_are_left_out_once_read(logged_in, account):
+    docs = account.add_folder('docs')
+    file = account.add_file('a.txt', parent=docs)
+    bad = account.add_file('bad.txt', parent=docs)
+    next(node for node in account.nodes if node['h'] == bad)['a'] = (
+        account.nodes[-2]['a'])
+
+    assert logged_in.get_files()[bad]['a'] is None
+    assert set(logged_in.get_files()) == {'ROOT', 'INBOX', 'TRASH', docs,
+                                          file}
+    assert set(logged_in.get_files_in_node(docs)) == {file}
@@ -0,0 +1,89 @@
+import secrets
+
+import pytest
+import requests
+import requests_mock
+
+from mega import Mega
+from mega.errors import RequestError, ValidationError
+from mega.mega import AuthenticationError, NetworkError
+
+from .conftest import MASTER_KEY
+
+KEY = secrets.token_bytes(32)
+
+
+@pytest.fixture
+def blob(logged_in):
+    logged_in.sid = 'SESSIONID'
+    logged_in.get_files()
+    logged_in.shared_keys = {'U_other__': {'SHARE': (1, 2, 3, 4)}}
+    return logged_in.export_session(KEY)
+
+
+def test_restore_without_login(blob, account, mocker):
+    account.api_calls.clear()
+    mocker.patch.object(Mega, '_api_request', side_effect=account)
+    mocker.patch.object(Mega, '_api_stream', side_effect=account.stream)
+    login = mocker.patch.object(Mega, 'login')
+
+    mega = Mega.from_session(blob, KEY)
+
+    login.assert_not_called()
+    assert mega.sid == 'SESSIONID'
+    assert mega.master_key == MASTER_KEY
+    assert (mega.root_id, mega.inbox_id, mega.trashbin_id) == ('ROOT',
+                                                               'INBOX',
+                                                               'TRASH')
+    assert mega.shared_keys == {'U_other__': {'SHARE': (1, 2, 3, 4)}}
+    assert account.api_calls == [[{'a': 'ug'}]]
+    assert mega.get_node_by_type(4)[0] == 'TRASH'
+
+
+@pytest.mark.parametrize('key', [secrets.token_bytes(32), KEY[:16]])
+def test_wrong_key(blob, key):
+    with pytest.raises(ValidationError):
+        Mega.from_session(blob, key)
+
+
+def test_tampered_blob(blob):
+    tampered = blob[:-4] + ('AAAA' if blob[-4:] != 'AAAA' else 'BBBB')
+    with pytest.raises(ValidationError):
+        Mega.from_session(tampered, KEY)
+
+
+def test_expired_session_logs_in_again(blob, mocker):
+    mocker.patch.object(Mega,
+                        '_api_request',
+                        side_effect=RequestError(-15))
+    login = mocker.patch.object(Mega, 'login', return_value='logged in')
+
+    assert Mega.from_session(blob, KEY, 'me@example.com',
+                             'password') == 'logged in'
+    login.assert_called_once_with('me@example.com', 'password')
+
+
+def test_expired_session_without_credentials(blob, mocker):
+    mocker.patch.object(Mega,
+                        '_api_request',
+                        side_effect=RequestError(-15))
+
+    with pytest.raises(AuthenticationError):
+        Mega.from_session(blob, KEY)
+
+
+def test_unreachable_api(blob, mocker):
+    session = requests.Session()
+    login = mocker.patch.object(Mega, 'login')
+    with requests_mock.Mocker(session=session) as m:
+        m.post(requests_mock.ANY, exc=requests.ConnectionError)
+        with pytest.raises(NetworkError):
+            Mega.from_session(blob, KEY, 'me@example.com', 'password',
+                              {'session': session})
+
+    login.assert_not_called()
+
+
+def test_export_requires_login():
+    with pytest.raises(ValidationError):
+        Mega().export_session(KEY)
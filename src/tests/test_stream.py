@@ -0,0 +1,170 @@
+import io
+import json
+
+import pytest
+import requests
+from tenacity import wait_none
+
+from mega import Mega
+from mega.crypto import (a32_to_base64, base64_url_encode, encrypt_attr,
+                         encrypt_key)
+from mega.errors import RequestError
+from mega.stream import iter_response
+from mega.transport import HTTPTransport
+
+from .conftest import MASTER_KEY, USER
+
+RESULT = {
+    'f': [{'h': 'A', 'a': 'caf\xe9 ☃', 's': 123456789}, {'h': 'B'}],
+    'ok': [],
+    's': [{'u': 'U_other__', 'h': 'A'}],
+    'u': [{'u': USER, 'c': 2}],
+    'sn': 'SEQNUM01',
+    'noc': 1,
+}
+
+
+def _chunks(body, size):
+    return [body[i:i + size] for i in range(0, len(body), size)]
+
+
+@pytest.mark.parametrize('size', [1, 2, 7, 65536])
+def test_matches_json_loads(size):
+    body = json.dumps([RESULT], ensure_ascii=False).encode()
+
+    events = list(iter_response(_chunks(body, size)))
+
+    assert events == [
+        ('f', RESULT['f'][0]),
+        ('f', RESULT['f'][1]),
+        ('s', RESULT['s'][0]),
+        ('u', RESULT['u']),
+        ('sn', 'SEQNUM01'),
+        ('noc', 1),
+    ]
+
+
+def test_reads_as_it_yields():
+    body = json.dumps([{'f': [{'h': str(i)} for i in range(1000)]}]).encode()
+    chunks = _chunks(body, 64)
+    read = []
+
+    events = iter_response(read.append(chunk) or chunk for chunk in chunks)
+    next(events)
+
+    assert len(read) == 1
+    assert len(list(events)) == 999
+
+
+@pytest.mark.parametrize('body, code', [(b'-3', -3), (b' [-9] ', -9)])
+def test_error_codes(body, code):
+    with pytest.raises(RequestError) as e:
+        list(iter_response([body]))
+    assert e.value.code == code
+
+
+@pytest.mark.parametrize('body',
+                         [b'[{"f": [{"h": "A"}', b'[{"f" [] }]', b''])
+def test_malformed(body):
+    with pytest.raises(json.JSONDecodeError):
+        list(iter_response(_chunks(body, 3)))
+
+
+def test_api_stream_reads_response():
+    class Transport(HTTPTransport):
+        def __init__(self):
+            self.streamed = []
+
+        def api_post(self, url, params, data, timeout, stream=False):
+            self.streamed.append(stream)
+            response = requests.Response()
+            response.status_code = 200
+            response.raw = io.BytesIO(json.dumps([RESULT]).encode())
+            return response
+
+    transport = Transport()
+    mega = Mega({'transport': transport})
+
+    assert dict(mega._api_stream({'a': 'f'}))['sn'] == 'SEQNUM01'
+    assert transport.streamed == [True]
+
+
+def test_tree_fetch_retries_eagain(monkeypatch):
+    class Transport(HTTPTransport):
+        def __init__(self):
+            self.bodies = [[-3], [{'f': [], 'ok': [], 's': [],
+                                   'sn': 'SEQNUM01'}]]
+
+        def api_post(self, url, params, data, timeout, stream=False):
+            response = requests.Response()
+            response.status_code = 200
+            response.raw = io.BytesIO(json.dumps(self.bodies.pop(0)).encode())
+            return response
+
+    monkeypatch.setattr(Mega._api_stream.retry, 'wait', wait_none())
+    transport = Transport()
+    mega = Mega({'transport': transport})
+    mega.master_key = MASTER_KEY
+
+    assert mega.get_files() == {}
+    assert transport.bodies == []
+
+
+def _listing():
+    """
+    Nodes of other users listed before the keys they need: a file before
+    the share it is in, and a file keyed through 'ok' and 's'.
+    """
+    share_key = (1, 2, 3, 4)
+    ok_key = (5, 6, 7, 8)
+
+    def node(handle, parent, user, name, key_owner, under):
+        key = (9, 10, 11, 12)
+        return {
+            'h': handle, 'p': parent, 'u': user, 't': 1,
+            'a': base64_url_encode(encrypt_attr({'n': name}, key)),
+            'k': f'{key_owner}:{a32_to_base64(encrypt_key(key, under))}',
+        }
+
+    share_root = node('SHARED', 'OTHER', 'U_other__', 'shared', 'SHARED',
+                      share_key)
+    share_root['su'] = 'U_other__'
+    share_root['sk'] = a32_to_base64(encrypt_key(share_key, MASTER_KEY))
+    return {
+        'f': [
+            {'h': 'ROOT', 'p': '', 'u': USER, 't': 2, 'a': '', 'k': ''},
+            node('THEIRS', 'SHARED', 'U_other__', 'theirs', 'SHARED',
+                 share_key),
+            node('MINE', 'ROOT', USER, 'mine', USER, MASTER_KEY),
+            share_root,
+            node('OK', 'ROOT', 'U_third__', 'ok', 'OKSHARE', ok_key),
+        ],
+        'ok': [{
+            'h': 'OKSHARE',
+            'k': a32_to_base64(encrypt_key(ok_key, MASTER_KEY))
+        }],
+        's': [{'u': 'U_third__', 'h': 'OKSHARE'}],
+        'sn': 'SEQNUM02',
+    }
+
+
+def test_tree_load_defers_nodes_needing_share_keys(logged_in, mocker):
+    body = json.dumps([_listing()]).encode()
+    mocker.patch('mega.mega.TREE_BATCH_SIZE', 1)
+    mocker.patch.object(logged_in,
+                        '_api_stream',
+                        return_value=iter_response(_chunks(body, 5)))
+
+    files = logged_in.get_files()
+
+    names = {
+        handle: node['a']['n']
+        for handle, node in files.items() if node['t'] == 1
+    }
+    assert names == {
+        'THEIRS': 'theirs',
+        'MINE': 'mine',
+        'SHARED': 'shared',
+        'OK': 'ok'
+    }
+    assert logged_in._node_tree().sn == 'SEQNUM02'
@@ -0,0 +1,109 @@
+import time
+
+import pytest
+
+from mega.crypto import base64_url_encode, encrypt_attr
+from mega.errors import RequestError
+from mega.sync import NodeEvent
+
+
+def _packet_node(account, handle):
+    node = next(node for node in account.nodes if node['h'] == handle)
+    return dict(node)
+
+
+def test_new_nodes_and_sequence_number(logged_in, account, sc):
+    logged_in.get_files()
+    folder = account.add_folder('incoming')
+    file = account.add_file('a.txt', parent=folder)
+    transport = sc({
+        'a': [{
+            'a': 't',
+            't': {
+                'f': [
+                    _packet_node(account, folder),
+                    _packet_node(account, file)
+                ]
+            }
+        }],
+        'sn': 'SEQNUM02'
+    })
+
+    events = logged_in.sync().poll()
+
+    assert [(event.kind, event.handle) for event in events] == [
+        ('new', folder), ('new', file)
+    ]
+    assert transport.sc_requests == ['SEQNUM01']
+    assert logged_in.sync().sn == 'SEQNUM02'
+    assert logged_in.find('incoming/a.txt')[0] == file
+    assert account.fetch_count() == 1
+
+
+def test_update_move_and_delete(logged_in, account, sc):
+    docs = account.add_folder('docs')
+    file = account.add_file('a.txt')
+    other = account.add_file('b.txt', parent=docs)
+    logged_in.get_files()
+    k = logged_in.find('a.txt')[1]['k']
+    moved = _packet_node(account, file)
+    moved['p'] = docs
+    sc({
+        'w': 'https://wait.invalid/1'
+    }, {
+        'a': [
+            {'a': 'u', 'n': file, 'ts': 5,
+             'at': base64_url_encode(encrypt_attr({'n': 'c.txt'}, k))},
+            {'a': 'd', 'n': file},
+            {'a': 't', 't': {'f': [moved]}},
+            {'a': 'd', 'n': docs, 'i': 'elsewhere'},
+            {'a': 'd', 'n': 'ROOT', 'i': logged_in.request_id},
+            {'a': 'ua', 'u': 'someone'},
+        ],
+        'sn': 'SEQNUM03'
+    })
+
+    changes = logged_in.changes()
+    events = [next(changes) for _ in range(5)]
+
+    assert events[0] == NodeEvent('update', file, events[0].node)
+    assert events[0].node['a'] == {'n': 'c.txt'}
+    assert events[0].node['ts'] == 5
+    assert events[1] == NodeEvent('move', file, events[1].node)
+    assert events[1].node['p'] == docs
+    assert {(event.kind, event.handle) for event in events[2:]} == {
+        ('delete', docs), ('delete', other), ('delete', file)
+    }
+    assert logged_in.transport.waits == ['https://wait.invalid/1']
+    assert logged_in.transport.sc_requests == ['SEQNUM01', 'SEQNUM01']
+    assert logged_in.find('c.txt') is None
+    assert logged_in.get_node_by_type(2)[0] == 'ROOT'
+    assert logged_in.sync().sn == 'SEQNUM03'
+
+
+def test_polling_keeps_the_tree_current(logged_in, account, sc):
+    logged_in.node_cache_ttl = 0.05
+    logged_in.get_files()
+    folder = account.add_folder('incoming')
+    sc({
+        'a': [{'a': 't', 't': {'f': [_packet_node(account, folder)]}}],
+        'sn': 'SEQNUM02'
+    }, {'w': 'https://wait.invalid/1'})
+
+    time.sleep(0.1)
+    assert logged_in.sync().poll(wait=False)
+    assert logged_in.find('incoming')[0] == folder
+    time.sleep(0.1)
+    assert logged_in.sync().poll(wait=False) == []
+    assert logged_in.find('incoming')[0] == folder
+
+    assert account.fetch_count() == 1
+
+
+def test_session_error(logged_in, sc):
+    logged_in.get_files()
+    sc(-15)
+
+    with pytest.raises(RequestError) as exc:
+        logged_in.sync().poll()
+    assert exc.value.code == -15
@@ -0,0 +1,58 @@
+from concurrent.futures import ThreadPoolExecutor
+
+from mega import Mega
+from mega.transport import HTTPTransport
+
+
+def test_sequence_numbers_unique_across_threads():
+    mega = Mega()
+    with ThreadPoolExecutor(8) as pool:
+        numbers = list(
+            pool.map(lambda _: mega._next_sequence_num(), range(1000)))
+
+    assert len(set(numbers)) == 1000
+
+
+def test_threads_share_pools_not_sessions():
+    transport = HTTPTransport()
+    with ThreadPoolExecutor(2) as pool:
+        sessions = list(
+            pool.map(lambda _: (transport.api_session,
+                                transport.storage_session), range(2)))
+
+    assert transport.api_session is transport.api_session
+    assert transport.api_session is not sessions[0][0]
+    api = {api.get_adapter('https://g.api.x/cs') for api, _ in sessions}
+    storage = {storage.get_adapter('https://gfs.x/')
+               for _, storage in sessions}
+    assert api == {transport.api_session.get_adapter('https://g.api.x/cs')}
+    assert storage == {
+        transport.storage_session.get_adapter('https://gfs.x/')
+    }
+
+
+def test_tree_fetched_once_for_concurrent_lookups(logged_in, account):
+    for i in range(20):
+        account.add_folder(f'folder{i}')
+
+    with ThreadPoolExecutor(8) as pool:
+        found = list(
+            pool.map(lambda i: logged_in.find(f'folder{i}'), range(20)))
+
+    assert all(found)
+    assert account.fetch_count() == 1
+
+
+def test_concurrent_changes_and_lookups(logged_in, account):
+    handles = [account.add_folder(f'folder{i}') for i in range(50)]
+    target = account.add_folder('target')
+    logged_in.get_files()
+
+    def move(handle):
+        logged_in.move(handle, target)
+        return logged_in.get_files_in_node(target)
+
+    with ThreadPoolExecutor(8) as pool:
+        list(pool.map(move, handles))
+
+    assert sorted(logged_in.get_files_in_node(target)) == sorted(handles)
@@ -0,0 +1,236 @@
+import os
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+from Crypto.Cipher import AES
+from Crypto.Util import Counter
+
+from mega import Mega
+from mega.crypto import (MacAccumulator, a32_to_str, base64_url_encode,
+                         encrypt_attr, get_chunks, base64_to_a32,
+                         decrypt_key)
+from mega.progress import TransferStats
+
+FILE_KEY = (0x11111111, 0x22222222, 0x33333333, 0x44444444)
+FILE_IV = (0x55555555, 0x66666666, 0, 0)
+
+
+def _encrypt(data, key=FILE_KEY, iv=FILE_IV):
+    counter = Counter.new(128, initial_value=((iv[0] << 32) + iv[1]) << 64)
+    return AES.new(a32_to_str(key), AES.MODE_CTR,
+                   counter=counter).encrypt(data)
+
+
+def _meta_mac(data, key=FILE_KEY, iv=FILE_IV):
+    mac = MacAccumulator(a32_to_str(key), iv)
+    for chunk_start, chunk_size in get_chunks(len(data)):
+        mac.update(data[chunk_start:chunk_start + chunk_size])
+    return mac.meta_mac()
+
+
+class StorageServer:
+    """
+    Local stand-in for a MEGA storage node. It serves one encrypted file
+    and accepts chunk uploads to /ul/<offset>, answering them after a
+    random delay so that they complete out of order.
+    """
+    def __init__(self):
+        self.content = b''
+        self.range_requests = []
+        self.upload_size = 0
+        self.uploaded = {}
+        self.upload_lock = threading.Lock()
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                body = server.content
+                status = 200
+                range_header = self.headers.get('Range')
+                if range_header:
+                    start, end = range_header[len('bytes='):].split('-')
+                    server.range_requests.append((int(start), int(end)))
+                    body = body[int(start):int(end) + 1]
+                    status = 206
+                self.send_response(status)
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def do_POST(self):
+                offset = int(self.path.rsplit('/', 1)[1])
+                body = self.rfile.read(int(self.headers['Content-Length']))
+                time.sleep(random.random() * 0.02)
+                with server.upload_lock:
+                    server.uploaded[offset] = body
+                    received = sum(map(len, server.uploaded.values()))
+                    done = received == server.upload_size
+                response = b'UPLOADHANDLE' if done else b''
+                self.send_response(200)
+                self.send_header('Content-Length', str(len(response)))
+                self.end_headers()
+                self.wfile.write(response)
+
+            def log_message(self, *args):
+                pass
+
+        self.httpd = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self.url = 'http://127.0.0.1:%d/dl/file' % self.httpd.server_port
+        self.upload_url = 'http://127.0.0.1:%d/ul' % self.httpd.server_port
+        self.thread = threading.Thread(target=self.httpd.serve_forever,
+                                       daemon=True)
+        self.thread.start()
+
+    def close(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+
+@pytest.fixture
+def storage_server():
+    server = StorageServer()
+    yield server
+    server.close()
+
+
+@pytest.fixture
+def download_node(storage_server, mocker):
+    """Serve `data` and return a node for it, like get_files() would."""
+    def make(data, meta_mac=None):
+        storage_server.content = _encrypt(data)
+        at = base64_url_encode(encrypt_attr({'n': 'remote.bin'}, FILE_KEY))
+        mocker.patch.object(Mega,
+                            '_api_request',
+                            return_value={
+                                'g': storage_server.url,
+                                's': len(data),
+                                'at': at
+                            })
+        return ('h1', {
+            'h': 'h1',
+            'k': FILE_KEY,
+            'iv': FILE_IV,
+            'meta_mac': meta_mac or _meta_mac(data),
+        })
+
+    return make
+
+
+@pytest.mark.parametrize('size', [0, 10, 1000000, 3 * 1048576 + 7])
+@pytest.mark.parametrize('workers', [1, 4])
+def test_download(download_node, tmp_path, size, workers):
+    data = os.urandom(size)
+    node = download_node(data)
+
+    output_path = Mega().download(node, dest_path=str(tmp_path),
+                                  workers=workers)
+
+    assert output_path.name == 'remote.bin'
+    assert output_path.read_bytes() == data
+
+
+def test_download_parallel_fetches_every_chunk_by_range(
+        download_node, storage_server, tmp_path):
+    data = os.urandom(2000000)
+    node = download_node(data)
+
+    Mega({'download_workers': 3}).download(node, dest_path=str(tmp_path))
+
+    assert sorted(storage_server.range_requests) == [
+        (start, start + size - 1) for start, size in get_chunks(len(data))
+    ]
+
+
+@pytest.mark.parametrize('workers', [1, 4])
+def test_download_mismatched_mac(download_node, tmp_path, workers):
+    data = os.urandom(500000)
+    node = download_node(data, meta_mac=(0, 0))
+
+    with pytest.raises(ValueError, match='Mismatched mac'):
+        Mega().download(node, dest_path=str(tmp_path), workers=workers)
+
+
+@pytest.mark.parametrize('workers', [1, 4])
+def test_download_stats(download_node, tmp_path, workers):
+    data = os.urandom(2000000)
+    node = download_node(data)
+    seen = []
+    stats = TransferStats(callback=lambda stats: seen.append(
+        (stats.bytes_done, stats.eta)))
+
+    Mega().download(node, dest_path=str(tmp_path), workers=workers,
+                    stats=stats)
+
+    assert len(seen) == len(list(get_chunks(len(data))))
+    assert (len(data), 0) in seen
+    assert stats.direction == 'download'
+    assert stats.bytes_done == stats.total_bytes == len(data)
+    assert set(stats.stage_seconds) == {'network', 'decrypt', 'mac', 'disk'}
+    assert set(stats.stage_bytes.values()) == {len(data)}
+    assert stats.throughput > 0
+    assert stats.snapshot()['elapsed'] == stats.elapsed
+
+
+@pytest.fixture
+def upload_target(storage_server, mocker):
+    """Answer the 'u' and 'p' commands, recording the completed node."""
+    completed = []
+
+    def api_request(self, data):
+        if data['a'] == 'u':
+            storage_server.upload_size = data['s']
+            return {'p': storage_server.upload_url}
+        completed.append(data['n'][0])
+        return {'f': [{'h': 'newnode'}]}
+
+    mocker.patch.object(Mega, '_api_request', api_request)
+    return completed
+
+
+def _uploaded_plaintext(storage_server, key, iv):
+    ciphertext = b''.join(
+        body for offset, body in sorted(storage_server.uploaded.items()))
+    return _encrypt(ciphertext, key, iv)
+
+
+@pytest.mark.parametrize('size', [10, 1000000, 3 * 1048576 + 7])
+@pytest.mark.parametrize('workers', [1, 4])
+def test_upload(storage_server, upload_target, tmp_path, size, workers):
+    data = os.urandom(size)
+    path = tmp_path / 'local.bin'
+    path.write_bytes(data)
+    mega = Mega({'upload_workers': workers})
+    mega.master_key = (1, 2, 3, 4)
+
+    mega.upload(str(path), dest='root')
+
+    node, = upload_target
+    assert node['h'] == 'UPLOADHANDLE'
+    key = decrypt_key(base64_to_a32(node['k']), mega.master_key)
+    k = (key[0] ^ key[4], key[1] ^ key[5], key[2] ^ key[6], key[3] ^ key[7])
+    iv = key[4:6] + (0, 0)
+    assert sorted(storage_server.uploaded) == [
+        start for start, chunk_size in get_chunks(size)
+    ]
+    assert _uploaded_plaintext(storage_server, k, iv) == data
+    assert _meta_mac(data, k, iv) == key[6:8]
+
+
+@pytest.mark.parametrize('workers', [1, 4])
+def test_upload_stats(storage_server, upload_target, tmp_path, workers):
+    path = tmp_path / 'local.bin'
+    path.write_bytes(os.urandom(1500000))
+    mega = Mega({'upload_workers': workers})
+    mega.master_key = (1, 2, 3, 4)
+    stats = TransferStats()
+
+    mega.upload(str(path), dest='root', stats=stats)
+
+    assert stats.direction == 'upload'
+    assert stats.bytes_done == 1500000
+    assert stats.stage_bytes == dict.fromkeys(
+        ('network', 'encrypt', 'mac', 'disk'), 1500000)
+    assert stats.eta == 0
@@ -0,0 +1,58 @@
+import requests
+import requests_mock
+
+from mega import Mega
+from mega.transport import HTTPTransport
+
+
+def test_pool_sizes():
+    transport = HTTPTransport(api_pool_size=3, storage_pool_size=12)
+
+    api_adapter = transport.api_session.get_adapter('https://g.api.x/cs')
+    storage_adapter = transport.storage_session.get_adapter('https://gfs.x/')
+    assert transport.api_session is not transport.storage_session
+    assert api_adapter._pool_maxsize == 3
+    assert storage_adapter._pool_maxsize == 12
+
+
+def test_pool_sizes_from_options():
+    mega = Mega({'api_pool_size': 2, 'storage_pool_size': 5})
+
+    adapter = mega.transport.storage_session.get_adapter('https://gfs.x/')
+    assert adapter._pool_maxsize == 5
+    adapter = mega.transport.api_session.get_adapter('https://g.api.x/cs')
+    assert adapter._pool_maxsize == 2
+
+
+def test_session_reused_across_api_requests():
+    session = requests.Session()
+    mega = Mega({'session': session})
+
+    with requests_mock.Mocker(session=session) as m:
+        m.post(f'{mega.schema}://g.api.{mega.domain}/cs',
+               text='[{"u": "me"}]')
+        assert mega.get_user() == {'u': 'me'}
+        assert mega.get_user() == {'u': 'me'}
+
+    assert m.call_count == 2
+    assert mega.transport.storage_session is session
+
+
+def test_injected_transport():
+    class Transport(HTTPTransport):
+        def __init__(self):
+            self.calls = []
+
+        def api_post(self, url, params, data, timeout):
+            self.calls.append(data)
+            response = requests.Response()
+            response.status_code = 200
+            response._content = b'[0]'
+            return response
+
+    transport = Transport()
+    mega = Mega({'transport': transport})
+
+    assert mega.destroy('abc') == 0
+    assert transport.calls == ['[{"a": "d", "n": "abc", "i": "%s"}]' %
+                               mega.request_id]
@@ -0,0 +1,298 @@
+import copy
+import random
+
+import pytest
+
+from mega.crypto import (a32_to_base64, base64_url_encode, encrypt_attr,
+                         encrypt_key)
+from mega.columnar import ColumnarNodeTree
+from mega.tree import NodeTree
+
+from .conftest import MASTER_KEY, USER
+
+
+def _node(handle, parent, name='x', node_type=1):
+    return {
+        'h': handle,
+        'p': parent,
+        'u': USER,
+        't': node_type,
+        'a': {'n': name}
+    }
+
+
+@pytest.fixture(params=[NodeTree, ColumnarNodeTree])
+def tree(request):
+    return request.param([
+        _node('root', '', 'Cloud Drive', 2),
+        _node('a', 'root', 'a'),
+        _node('b', 'a', 'b'),
+        _node('c', 'b', 'c', 0),
+        _node('d', 'root', 'd', 0),
+    ])
+
+
+def test_remove_takes_descendants(tree):
+    assert sorted(tree.remove('a')) == ['a', 'b', 'c']
+    assert sorted(tree) == ['d', 'root']
+
+
+def test_move(tree):
+    tree.move('c', 'root')
+    assert tree.get('c')['p'] == 'root'
+
+
+def test_set_attributes(tree):
+    tree.set_attributes('d', {'n': 'e'})
+    assert tree.get('d')['a'] == {'n': 'e'}
+
+
+def test_subtree_and_sizes(tree):
+    tree.add(dict(_node('c', 'b', 'c', 0), s=10))
+    tree.add(dict(_node('d', 'root', 'd', 0), s=5))
+    tree.set_timestamp('d', 1234)
+
+    assert sorted(tree.subtree('a')) == ['a', 'b', 'c']
+    assert tree.subtree('missing') == []
+    assert tree.total_size('a') == 10
+    assert tree.total_size() == 15
+    assert tree.get('d')['ts'] == 1234
+    tree.remove('b')
+    assert tree.total_size() == 5
+
+
+class TestNodeCache:
+    def test_files_fetched_once(self, logged_in, account):
+        account.add_folder('docs')
+
+        logged_in.get_files()
+        logged_in.find('docs')
+        logged_in.get_node_by_type(4)
+        logged_in.get_files_in_node(2)
+
+        assert account.fetch_count() == 1
+
+    def test_refresh(self, logged_in, account):
+        logged_in.get_files()
+        account.add_folder('docs')
+        assert logged_in.find('docs') is None
+
+        logged_in.refresh()
+
+        assert logged_in.find('docs')
+        assert account.fetch_count() == 2
+
+    def test_ttl(self, logged_in, account):
+        logged_in.node_cache_ttl = 0
+        logged_in.get_files()
+        logged_in.get_files()
+        assert account.fetch_count() == 2
+
+    def test_mutations_update_cache(self, logged_in, account, tmp_path,
+                                    mocker):
+        docs = account.add_folder('docs')
+        old = account.add_file('old.txt', parent=docs)
+        gone = account.add_folder('gone')
+        account.add_file('inside.txt', parent=gone)
+
+        created = logged_in.create_folder('docs/new')
+        logged_in.rename(logged_in.find('docs/old.txt'), 'renamed.txt')
+        logged_in.move(old, 'ROOT')
+        logged_in.destroy(gone)
+        mocker.patch.object(logged_in,
+                            '_upload_chunks',
+                            return_value='UPLOADHANDLE')
+        path = tmp_path / 'up.txt'
+        path.write_bytes(b'data')
+        logged_in.upload(str(path), dest=docs)
+
+        assert logged_in.find('docs/new')[0] == created['new']
+        assert logged_in.find('renamed.txt')[0] == old
+        assert logged_in.find('old.txt') is None
+        assert logged_in.find('gone') is None
+        assert logged_in.find('inside.txt') is None
+        assert logged_in.find('docs/up.txt')
+        assert account.fetch_count() == 1
+
+
+def test_children_and_types(tree):
+    assert tree.children('root') == ['a', 'd']
+    assert tree.by_type(0) == ['c', 'd']
+    tree.move('d', 'b')
+    assert tree.children('root') == ['a']
+    assert tree.children('b') == ['c', 'd']
+
+
+def test_named(tree):
+    assert tree.named('c') == ['c']
+    assert tree.named('c', 'b') == ['c']
+    assert tree.named('c', 'root') == []
+    tree.set_attributes('c', {'n': 'z'})
+    tree.add(_node('e', 'root', 'c', 0))
+    assert tree.named('c') == ['e']
+    assert tree.named('z', 'b') == ['c']
+
+
+def test_resolve_follows_folders_only(tree):
+    assert tree.resolve('a/b', 'root') == 'b'
+    assert tree.resolve('/a//b/', 'root') == 'b'
+    assert tree.resolve('', 'root') == 'root'
+    assert tree.resolve('a/b/c', 'root') is None
+    assert tree.resolve('b', 'root') is None
+
+
+def test_paths_follow_changes(tree):
+    assert tree.path('c') == 'Cloud Drive/a/b/c'
+    tree.set_attributes('a', {'n': 'renamed'})
+    assert tree.path('c') == 'Cloud Drive/renamed/b/c'
+    tree.move('b', 'root')
+    assert tree.path('c') == 'Cloud Drive/b/c'
+    tree.remove('b')
+    assert tree.path('c') is None
+    assert tree.named('b') == []
+    assert tree.children('root') == ['a', 'd']
+
+
+def test_find_nested_path(logged_in, account):
+    top = account.add_folder('top')
+    sub = account.add_folder('sub', parent=top)
+    account.add_folder('sub')
+    account.add_file('f.txt', parent=sub)
+    account.add_file('f.txt')
+
+    assert logged_in.find_path_descriptor('top/sub') == sub
+    assert logged_in.find('top/sub/f.txt')[1]['p'] == sub
+    assert logged_in.find('f.txt', exclude_deleted=True)
+    assert logged_in.find('top/missing/f.txt') is None
+    assert logged_in.get_node_by_type(4)[0] == 'TRASH'
+    assert list(logged_in.get_files_in_node(top)) == [sub]
+
+
+def _shared_listing():
+    """Own nodes, an inbound share and files inside it, as 'f' returns."""
+    rng = random.Random(1)
+
+    def key(size):
+        return tuple(rng.getrandbits(32) for _ in range(size))
+
+    def node(handle, parent, user, node_type, name, node_key, k):
+        k_field = '/'.join(
+            f'{owner}:{a32_to_base64(encrypt_key(node_key, under))}'
+            for owner, under in k)
+        attr_key = node_key if node_type else tuple(
+            node_key[i] ^ node_key[i + 4] for i in range(4))
+        return {
+            'h': handle, 'p': parent, 'u': user, 't': node_type,
+            'a': base64_url_encode(encrypt_attr({'n': name}, attr_key)),
+            'k': k_field, 'ts': 1,
+        }
+
+    share_key = key(4)
+    folder_key, file_key, shared_file_key = key(4), key(8), key(8)
+    share_root = node('SHARED', 'OTHERROOT', 'U_other__', 1, 'shared',
+                      folder_key, [('SHARED', share_key)])
+    share_root['su'] = 'U_other__'
+    share_root['sk'] = a32_to_base64(encrypt_key(share_key, MASTER_KEY))
+    return [
+        {'h': 'ROOT', 'p': '', 'u': USER, 't': 2, 'a': '', 'k': ''},
+        node('MINE', 'ROOT', USER, 0, 'mine.txt', file_key,
+             [(USER, MASTER_KEY)]),
+        share_root,
+        node('THEIRS', 'SHARED', 'U_other__', 0, 'theirs.txt',
+             shared_file_key, [('SHARED', share_key)]),
+        node('LOST', 'SHARED', 'U_third__', 0, 'lost.txt', key(8),
+             [('ELSEWHERE', key(4))]),
+    ]
+
+
+def test_batched_key_decryption_matches_per_node(logged_in):
+    listing = _shared_listing()
+    per_node_keys = {}
+    per_node = [
+        logged_in._process_file(file, per_node_keys)
+        for file in copy.deepcopy(listing)
+    ]
+    batched_keys = {}
+    batched = logged_in._process_files(copy.deepcopy(listing), batched_keys)
+
+    assert batched == per_node
+    assert batched_keys == per_node_keys
+    assert [file['a']['n'] for file in batched[:4]] == [
+        'Cloud Drive', 'mine.txt', 'shared', 'theirs.txt'
+    ]
+    assert 'key' not in batched[4]
+
+
+def test_columnar_node_tree(logged_in, account):
+    logged_in.node_tree = ColumnarNodeTree
+    docs = account.add_folder('docs')
+    file = account.add_file('f.txt', parent=docs, size=3)
+
+    assert isinstance(logged_in._node_tree(), ColumnarNodeTree)
+    assert logged_in.find('docs/f.txt')[1]['s'] == 3
+    assert logged_in.find(handle=file)['a'] == {'n': 'f.txt'}
+    assert list(logged_in.get_files_in_node(docs)) == [file]
+    assert logged_in.get_node_by_type(2)[0] == 'ROOT'
+    logged_in.rename(logged_in.find('f.txt'), 'g.txt')
+    logged_in.move(file, 'ROOT')
+    assert logged_in.find('g.txt')[1]['p'] == 'ROOT'
+    assert logged_in.get_files_in_node(docs) == {}
+    assert account.fetch_count() == 1
+
+
+def _encrypted_folder(handle, parent):
+    folder_key = (1, 2, 3, 4)
+    return {
+        'h': handle, 'p': parent, 'u': USER, 't': 1,
+        'a': base64_url_encode(encrypt_attr({'n': handle}, folder_key)),
+        'key': folder_key,
+    }
+
+
+def _encrypted_tree(count):
+    tree = ColumnarNodeTree()
+    tree.add(_node('root', '', 'Cloud Drive', 2))
+    for i in range(count):
+        tree.add(_encrypted_folder(f'f{i}', 'root'))
+    return tree
+
+
+def test_columnar_nodes_decrypt_when_read():
+    tree = _encrypted_tree(3)
+    tree.add(_encrypted_folder('deep', 'f0'))
+
+    nodes = dict(tree.items())
+    assert not any(node.decrypted for node in nodes.values()
+                   if node['h'] != 'root')
+    assert tree.get('f0') is nodes['f0']
+    assert tree.named('f1', 'root') == ['f1']
+    assert tree._pending[tree._rows['deep']]
+
+    assert nodes['deep']['a'] == {'n': 'deep'}
+    tree.materialize()
+    assert tree._attributes[tree._rows['deep']] is nodes['deep']['a']
+    tree.set_attributes('f0', {'n': 'g'})
+    assert tree.get('f0') is not nodes['f0']
+    assert tree.get('f0')['a'] == {'n': 'g'}
+
+
+def test_columnar_compacts_removed_rows():
+    tree = _encrypted_tree(6)
+    tree.COMPACT_MIN_ROWS = 2
+    tree.add(_node('child', 'orphan', 'child'))
+    tree.named('f0')
+
+    for i in range(4):
+        assert tree.remove(f'f{i}') == [f'f{i}']
+    assert len(tree._handles) == 9
+    assert tree.remove('f4') == ['f4']
+
+    assert len(tree._handles) == 4
+    assert 'f0' not in tree._rows and 'orphan' in tree._rows
+    assert sorted(tree) == ['child', 'f5', 'root']
+    assert tree.children('root') == ['f5']
+    assert tree.named('f5') == ['f5'] and tree.named('f4') == []
+    assert tree.get('f5')['a'] == {'n': 'f5'}
+    assert tree.path('child') == 'child'
+    tree.add(_node('orphan', 'root', 'orphan'))
+    assert tree.path('child') == 'Cloud Drive/orphan/child'